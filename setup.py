@@ -16,8 +16,20 @@ setup(
         "llama-index",
         "llama-index-llms-google-genai",
         "llama-index-embeddings-google-genai", 
-        "python-dotenv"
+        "python-dotenv",
+        "numpy",
+        "transformers"
     ],
+    extras_require={
+        # EMBED_BACKEND=onnx / onnx-int8
+        'onnx': ['sentence-transformers[onnx]'],
+        # src/export_chunks.py --format arrow
+        'arrow': ['pyarrow'],
+        # src/serve.py (servidor pre-fork, Linux/macOS)
+        'serve': ['gunicorn'],
+        # tests/ (python -m pytest -q tests)
+        'test': ['pytest'],
+    },
     classifiers=[
         'Programming Language :: Python :: 3',
         'License :: OSI Approved :: MIT License',
@@ -13,35 +13,253 @@ def chat():
         return render_template('index.html', error="Invalid message")
 """
 
-from flask import Flask, request, render_template
+import time
+
+_import_started = time.perf_counter()
+
+import atexit
+import json
+import os
+import threading
+import uuid
+
+from flask import Flask, request, render_template, jsonify, Response, stream_with_context, g
 
 from controllers.chatbot_controller import ChatbotController
+from llm import embed_model, embed_batcher
+from metrics.process_memory import process_memory
+from metrics.registry import REGISTRY, stats_collector
+from metrics.tracing import start_trace, bind_trace, span, request_seconds
+from persistence.vector_store import get_vector_store
+
+# Tiempos de arranque por etapa (segundos), expuestos en /healthz
+startup_timings = {"imports": time.perf_counter() - _import_started}
+startup_error = None
+ready = threading.Event()
 
 app = Flask(__name__)
 chatbot_controller = ChatbotController()
+atexit.register(get_vector_store().close)
+
+# Endpoints que responden aunque los modelos no estén cargados
+NOT_GATED_ENDPOINTS = {'healthz', 'metrics', 'home', 'static'}
+
+# Máximo de mensajes aceptados por /chat/batch
+BATCH_MAX_SIZE = int(os.getenv("CHAT_BATCH_MAX_SIZE", "64"))
+
+# Agrega el header Server-Timing con la duración de cada etapa del request
+TIMING_HEADER = os.getenv("TIMING_HEADER", "0") == "1"
+
+# Métricas de cache y micro-batching, leídas de sus stats() en cada scrape de /metrics
+REGISTRY.register_collector(stats_collector(
+    "chatbot_embedding_cache", embed_model.stats,
+    counters=("hits", "disk_hits", "misses", "evictions", "expirations")
+))
+REGISTRY.register_collector(stats_collector(
+    "chatbot_response_cache", chatbot_controller.chatbot_service.response_cache.stats,
+    counters=("hits", "misses", "invalidations")
+))
+REGISTRY.register_collector(stats_collector(
+    "chatbot_retrieval_cache", chatbot_controller.chatbot_service.retrieval_cache.stats,
+    counters=("hits", "misses", "evictions", "invalidations")
+))
+REGISTRY.register_collector(stats_collector(
+    "chatbot_conversation_memory", chatbot_controller.chatbot_service.conversation_memory.stats,
+    counters=("evictions", "expirations", "summaries")
+))
+REGISTRY.register_collector(stats_collector(
+    "chatbot_embedding_batcher", embed_batcher.stats,
+    counters=("requests", "bypassed", "batches")
+))
+REGISTRY.register_collector(stats_collector(
+    "chatbot_intent_fast_path", chatbot_controller.chatbot_service.intent_prototypes.stats,
+    counters=("fast", "fallback")
+))
+# Memoria de este proceso (con varios workers, cada uno expone la suya)
+REGISTRY.register_collector(stats_collector("chatbot_process", process_memory))
+
+def warm_up():
+    """Load models, Chroma and indexes; the worker takes traffic only after this"""
+    global startup_error
+    try:
+        started = time.perf_counter()
+        startup_timings.update(chatbot_controller.warm())
+        startup_timings["warm_up_total"] = time.perf_counter() - started
+        ready.set()
+        breakdown = " | ".join(f"{name}: {seconds:.2f}s" for name, seconds in startup_timings.items())
+        print(f"⏱️  Startup breakdown: {breakdown}")
+    except Exception as e:
+        startup_error = str(e)
+        print(f"❌ Warm-up failed: {startup_error}")
+
+
+def preload(embeddings: bool = True):
+    """Load the read-only state in the parent of a pre-fork server, before the workers fork"""
+    started = time.perf_counter()
+    startup_timings.update(chatbot_controller.preload(embeddings))
+    startup_timings["preload_total"] = time.perf_counter() - started
+
+
+def start_warm_up():
+    """Run warm_up in a background thread so /healthz can answer meanwhile"""
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
+@app.before_request
+def begin_trace():
+    """Collect the stage spans of this request"""
+    g.trace = start_trace()
+
+
+@app.before_request
+def require_ready():
+    """Readiness gate: chat endpoints answer 503 until warm-up finishes"""
+    # endpoint None: ninguna ruta coincide, que siga y responda 404
+    if request.endpoint is None or request.endpoint in NOT_GATED_ENDPOINTS or ready.is_set():
+        return None
+    response = jsonify({"error": "Service is starting, try again shortly"})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+
+def observe_request(trace, endpoint, status: int):
+    request_seconds.observe(time.perf_counter() - trace.started, endpoint=endpoint or 'unknown', status=status)
+
+
+@app.after_request
+def finish_trace(response):
+    """Record the request latency and, if enabled, the Server-Timing header"""
+    trace = g.get('trace')
+    if trace is not None:
+        endpoint, status = request.endpoint, response.status_code
+        if response.is_streamed:
+            # El cuerpo se genera después de este hook: el total se mide al cerrar la respuesta
+            response.call_on_close(lambda: observe_request(trace, endpoint, status))
+        else:
+            observe_request(trace, endpoint, status)
+            if TIMING_HEADER:
+                response.headers['Server-Timing'] = trace.server_timing()
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/healthz')
+def healthz():
+    """Readiness probe: 200 once models and indexes are loaded, 503 before"""
+    if ready.is_set():
+        return jsonify({
+            "status": "ready",
+            "startup_seconds": startup_timings,
+            "embeddings": {"cache": embed_model.stats(), "batcher": embed_batcher.stats()},
+            "process": {"pid": os.getpid(), **process_memory()},
+        })
+    status = "error" if startup_error else "starting"
+    return jsonify({"status": status, "error": startup_error}), 503
+
 
 @app.route('/')
 def home():
-    return render_template('index.html')
+    # Cada visita (o "Clear conversation") empieza una conversación nueva
+    return render_template('index.html', session_id=new_session_id())
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def session_id_from(values) -> str:
+    """Conversation id sent by the client, or a new one"""
+    session_id = values.get('session_id')
+    return session_id.strip()[:64] if isinstance(session_id, str) and session_id.strip() else new_session_id()
 
 @app.route('/chat', methods=['POST'])
 def chat():
     try:
         # The form uses 'message' as the input name in the template
         message = request.form.get('message', '').strip()
+        session_id = session_id_from(request.form)
         if not chatbot_controller.validate_message(message):
             raise ValueError("Invalid message")
         else:
-            result = chatbot_controller.process_message(message)
+            result = chatbot_controller.process_message(message, session_id)
             # Render using 'result' so template can access it consistently
-            return render_template('index.html', result=result)
+            with span("render"):
+                return render_template('index.html', result=result, session_id=session_id)
 
     except Exception as e:
         # Return the exception message for easier debugging in the frontend
-        return render_template('index.html', error=str(e))
+        return render_template('index.html', error=str(e), session_id=session_id_from(request.form))
+
+
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """
+    JSON batch endpoint.
+    Body: {"messages": ["...", "..."], "session_ids": [...]} (session_ids optional, one per message)
+    Returns {"results": [...]} with one result per message, in order.
+    """
+    payload = request.get_json(silent=True) or {}
+    messages = payload.get('messages')
+    if not isinstance(messages, list) or not messages:
+        return jsonify({"error": "'messages' must be a non-empty list"}), 400
+    if len(messages) > BATCH_MAX_SIZE:
+        return jsonify({"error": f"At most {BATCH_MAX_SIZE} messages per batch"}), 413
+    if not all(isinstance(message, str) for message in messages):
+        return jsonify({"error": "Every message must be a string"}), 400
+
+    session_ids = payload.get('session_ids')
+    if session_ids is not None and (
+        not isinstance(session_ids, list) or len(session_ids) != len(messages)
+        or not all(session_id is None or isinstance(session_id, str) for session_id in session_ids)
+    ):
+        return jsonify({"error": "'session_ids' must be a list with one id (or null) per message"}), 400
+
+    results = chatbot_controller.process_batch([message.strip() for message in messages], session_ids)
+    with span("render"):
+        return jsonify({"results": results})
+
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Server-Sent Events endpoint: sends the LLM tokens as soon as they arrive.
+    Events: 'meta' (intent/context), 'token' ({"delta": ...}), then 'done' or 'error'.
+    """
+    payload = request.form if request.form else (request.get_json(silent=True) or {})
+    message = (payload.get('message') or '').strip()
+    session_id = session_id_from(payload)
+    if not chatbot_controller.validate_message(message):
+        return jsonify({"error": "Invalid message"}), 400
+
+    trace = g.get('trace')
+
+    def events():
+        # Se itera después de que la vista retorna: los spans (llm) van a la traza de este request
+        bind_trace(trace)
+        with span("stream"):
+            for event, data in chatbot_controller.stream_message(message, session_id):
+                if event == "done" and TIMING_HEADER and trace is not None:
+                    # Los headers ya se enviaron: Server-Timing viaja en el evento final
+                    data = {**data, "server_timing": trace.server_timing()}
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
 if __name__ == '__main__':
     print("🌐 Starting Chatbot API...")
     print("📍 Open: http://localhost:5000")
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Con el reloader de debug, solo el proceso hijo (el que atiende) carga los modelos
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_warm_up()
+    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
@@ -0,0 +1,112 @@
+"""
+Chunking benchmark: token-aware chunker vs the character splitter
+Run from src: python -m benchmarks.chunking [--queries 200] [--output chunking.json]
+
+Queries are sentences sampled from the docs; a chunk is relevant to a query when
+it contains the sentence. Recall@k shows how much text survives embedding: chunks
+longer than the model window are truncated, so their tail cannot be retrieved.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from typing import Dict, Any, List
+
+import numpy as np
+
+from llm import embed_model
+from persistence.db_setup import text_extraction
+from persistence.db_setup.token_chunker import TokenChunker
+
+DOCS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "persistence", "db_setup", "data", "docs")
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def evaluate(name: str, chunks: List[str], query_vectors, queries: List[str], ks: List[int], window: int) -> Dict[str, Any]:
+    """Encode the chunks and compute recall@k for the queries"""
+    start = time.perf_counter()
+    chunk_vectors = embed_model.encode(chunks, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+    encode_seconds = time.perf_counter() - start
+
+    normalized_chunks = [normalize(chunk) for chunk in chunks]
+    token_counts = embed_model.tokenizer(chunks, add_special_tokens=False)["input_ids"]
+    token_counts = np.array([len(ids) for ids in token_counts])
+
+    scores = query_vectors @ chunk_vectors.T
+    ranking = np.argsort(-scores, axis=1)[:, :max(ks)]
+
+    hits = {k: 0 for k in ks}
+    evaluated = 0
+    for row, query in enumerate(queries):
+        relevant = {i for i, chunk in enumerate(normalized_chunks) if query in chunk}
+        if not relevant:
+            continue
+        evaluated += 1
+        for k in ks:
+            if relevant.intersection(ranking[row, :k].tolist()):
+                hits[k] += 1
+
+    return {
+        "chunker": name,
+        "chunks": len(chunks),
+        "mean_tokens": float(token_counts.mean()) if len(chunks) else 0.0,
+        "max_tokens": int(token_counts.max()) if len(chunks) else 0,
+        "truncated_fraction": float((token_counts > window).mean()) if len(chunks) else 0.0,
+        "encode_seconds": round(encode_seconds, 3),
+        "queries_evaluated": evaluated,
+        "recall": {f"@{k}": hits[k] / evaluated if evaluated else 0.0 for k in ks},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the token-aware chunker with the character splitter")
+    parser.add_argument("--queries", type=int, default=200, help="Sentences sampled as queries")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5], help="Cut-offs for recall@k")
+    parser.add_argument("--max-length", type=int, default=500, help="Characters per chunk for the character splitter")
+    parser.add_argument("--chunk-tokens", type=int, default=None, help="Tokens per chunk (default: model window - 2)")
+    parser.add_argument("--overlap", type=int, default=24, help="Overlap tokens between chunks")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    window = embed_model.max_seq_length - 2
+    chunker = TokenChunker(embed_model.tokenizer, chunk_tokens=args.chunk_tokens or window, overlap_tokens=args.overlap)
+
+    sentences, char_chunks, token_chunks = [], [], []
+    for file in sorted(os.listdir(DOCS_PATH)):
+        if not file.endswith(('.pdf', '.txt')):
+            continue
+        path = os.path.join(DOCS_PATH, file)
+        file_sentences = list(text_extraction.iter_sentences(text_extraction.iter_pages(path)))
+        sentences.extend(normalize(sentence) for _, sentence in file_sentences)
+        char_chunks.extend(chunk for chunk, _ in text_extraction.iter_chunks(file_sentences, max_length=args.max_length))
+        token_chunks.extend(chunk for chunk, _ in chunker.chunks(file_sentences))
+
+    # Oraciones con contenido suficiente para ser una consulta razonable
+    candidates = sorted({s for s in sentences if 8 <= len(s.split()) <= 40})
+    queries = random.Random(args.seed).sample(candidates, min(args.queries, len(candidates)))
+    query_vectors = embed_model.encode(queries, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+
+    report = {
+        "model_window_tokens": window,
+        "queries": len(queries),
+        "results": [
+            evaluate(f"chars(max_length={args.max_length})", char_chunks, query_vectors, queries, args.k, window),
+            evaluate(f"tokens(chunk={chunker.chunk_tokens}, overlap={chunker.overlap_tokens})",
+                     token_chunks, query_vectors, queries, args.k, window),
+        ],
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
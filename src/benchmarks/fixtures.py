@@ -0,0 +1,184 @@
+"""
+Offline fixtures for benchmarks and evaluation tools
+Stub LLM, hashing embedder and a throwaway Chroma store, so nothing needs the network
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+from cache.embedding_cache import EmbeddingCache
+from embeddings.batcher import EmbeddingBatcher
+from llm import embed_model_provider, llm_provider, EMBED_MODEL_NAME
+from persistence.vector_store import VectorStore, set_vector_store
+
+
+class StubCompletion:
+    """Minimal stand-in for a llama-index CompletionResponse"""
+
+    def __init__(self, text: str, delta: str = None, prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.text = text
+        self.delta = delta
+        self.raw = {"usage_metadata": {"prompt_token_count": prompt_tokens, "candidates_token_count": completion_tokens}}
+
+    def __str__(self):
+        return self.text
+
+
+class StubLLM:
+    """
+    Local replacement for GoogleGenAI with a fixed answer and simulated latency.
+    ``latency_ms`` is paid once per call (complete) or spread across chunks (stream).
+    """
+
+    ANSWER = "Respuesta de prueba generada sin red."
+
+    def __init__(self, latency_ms: float = 0.0, chunks: int = 8):
+        self.latency = latency_ms / 1000.0
+        self.chunks = chunks
+
+    def _usage(self, prompt: str):
+        return len(prompt.split()), len(self.ANSWER.split())
+
+    def complete(self, prompt: str, **kwargs) -> StubCompletion:
+        if self.latency:
+            time.sleep(self.latency)
+        prompt_tokens, completion_tokens = self._usage(prompt)
+        return StubCompletion(self.ANSWER, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def stream_complete(self, prompt: str, **kwargs):
+        words = self.ANSWER.split(" ")
+        step = max(1, len(words) // self.chunks)
+        prompt_tokens, completion_tokens = self._usage(prompt)
+        text = ""
+        for start in range(0, len(words), step):
+            if self.latency:
+                time.sleep(self.latency / self.chunks)
+            delta = (" " if text else "") + " ".join(words[start:start + step])
+            text += delta
+            yield StubCompletion(text, delta=delta, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+class HashingEmbedder:
+    """
+    Deterministic bag-of-words embedder (hashed unigrams and bigrams).
+
+    Not semantically meaningful like the real model, but cheap and shaped like it,
+    so pipeline timings exclude the transformer and runs need no model download.
+    """
+
+    max_seq_length = 128
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _vector(self, text: str):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = re.findall(r"\w+", text.lower())
+        for token in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        return vector
+
+    def encode(self, sentences, normalize_embeddings: bool = False, **kwargs):
+        single = isinstance(sentences, str)
+        vectors = [self._vector(text) for text in ([sentences] if single else sentences)]
+        # Como SentenceTransformer: una lista vacía da una matriz (0, dim)
+        matrix = np.stack(vectors) if vectors else np.empty((0, self.dim), dtype=np.float32)
+        if normalize_embeddings:
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        return matrix[0] if single else matrix
+
+
+class OfflineFixture:
+    """
+    Throwaway environment for offline runs.
+
+    Points the process-wide vector store (and with it the collection versions
+    and the docs manifest) at a temporary directory, installs the stub LLM, counts
+    prompt tokens by estimate and builds the embedding stack (cache -> batcher ->
+    encoder) that services should use via ``fixture.model``.
+    ``close()`` restores the previous settings and removes the directory.
+    """
+
+    def __init__(self, embedder: str = "model", llm_latency_ms: float = 0.0,
+                 embed_cache_size: int = 0, batch_max_size: int = 32, batch_window_ms: float = 2.0,
+                 directory: Optional[str] = None):
+        self.directory = directory or tempfile.mkdtemp(prefix="chatbot_bench_")
+        self._owns_directory = directory is None
+        self.embedder = embedder
+        # Sin red: el tokenizer local de Gemini descarga su vocabulario en el primer uso
+        self._previous_tokenizer = os.environ.get("PROMPT_TOKENIZER")
+        os.environ["PROMPT_TOKENIZER"] = "estimate"
+
+        self.store = VectorStore(os.path.join(self.directory, "chroma_db"))
+        set_vector_store(self.store)
+
+        llm_provider.set(StubLLM(latency_ms=llm_latency_ms))
+
+        if embedder == "hashing":
+            encoder, model_name = HashingEmbedder(), "hashing"
+        else:
+            encoder, model_name = embed_model_provider.get(), EMBED_MODEL_NAME
+        # Sin tier en disco: los vectores de una corrida no se mezclan con los del servidor
+        self.model = EmbeddingCache(
+            EmbeddingBatcher(encoder, max_batch_size=batch_max_size, max_wait_ms=batch_window_ms),
+            model_name=model_name,
+            max_size=embed_cache_size
+        )
+
+    @property
+    def manifest_path(self):
+        from persistence.db_setup.docs_to_embed_service import docs_manifest_path
+
+        return Path(docs_manifest_path(self.store.path))
+
+    def docs_service(self, **kwargs):
+        """DocsToEmbedService writing to the fixture store (chars chunking with the hashing embedder)"""
+        from persistence.db_setup.docs_to_embed_service import DocsToEmbedService
+
+        if self.embedder == "hashing":
+            kwargs.setdefault("chunking", "chars")
+        service = DocsToEmbedService(**kwargs)
+        service.model = self.model
+        service.manifest_path = self.manifest_path
+        return service
+
+    def intent_service(self):
+        from persistence.db_setup.intent_to_embed_service import IntentToEmbedService
+
+        service = IntentToEmbedService()
+        service.model = self.model
+        return service
+
+    def controller(self, response_cache_size: int = 0):
+        """ChatbotController using the fixture embeddings; response cache off by default"""
+        from cache.response_cache import ResponseCache
+        from controllers.chatbot_controller import ChatbotController
+
+        controller = ChatbotController()
+        controller.chatbot_service.model = self.model
+        controller.chatbot_service.response_cache = ResponseCache(max_size=response_cache_size)
+        return controller
+
+    def info(self) -> Dict[str, Any]:
+        return {"embedder": self.embedder, "directory": self.directory}
+
+    def close(self):
+        self.store.close()
+        if self._previous_tokenizer is None:
+            os.environ.pop("PROMPT_TOKENIZER", None)
+        else:
+            os.environ["PROMPT_TOKENIZER"] = self._previous_tokenizer
+        if self._owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,168 @@
+"""
+Offline benchmark of the routing and retrieval pipeline
+Run from src: python -m benchmarks.pipeline [--embedder hashing] [--concurrency 1 4 16] [--output pipeline.json]
+
+Builds a throwaway Chroma store from INTENT_TRAINING_DATA and the sample docs
+(timing the ingestion), installs a stub LLM and measures throughput and
+p50/p95/p99 latency of each stage and of ChatbotController.process_message at
+several concurrency levels. No network is used: with --embedder model the
+SentenceTransformer must already be in the local Hugging Face cache.
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional
+
+import numpy as np
+
+from benchmarks.fixtures import OfflineFixture
+from persistence.db_setup.data.intents_data import INTENT_TRAINING_DATA
+
+
+def summarize(latencies: List[float], wall_seconds: float) -> Dict[str, Any]:
+    """Throughput and latency percentiles (milliseconds)"""
+    values = np.array(latencies) * 1000.0
+    return {
+        "operations": len(latencies),
+        "throughput_per_sec": len(latencies) / wall_seconds if wall_seconds else 0.0,
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+        "max_ms": float(values.max()),
+    }
+
+
+def run_concurrent(operation: Callable[[Any], Any], operations: int, concurrency: int,
+                   prepare: Optional[Callable[[int], Any]] = None) -> Dict[str, Any]:
+    """
+    Run operation(0..operations-1) on `concurrency` threads and time each call.
+    With ``prepare``, operation gets prepare(i) instead of i, built outside the timed region.
+    """
+    def timed(i):
+        value = prepare(i) if prepare is not None else i
+        started = time.perf_counter()
+        operation(value)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed, range(operations)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def benchmark_ingestion(fixture: OfflineFixture, workers: int = None) -> Dict[str, Any]:
+    """Build the fixture store, timing DocsToEmbedService and IntentToEmbedService"""
+    docs_service = fixture.docs_service(workers=workers)
+    files = [f for f in os.listdir(docs_service.docs_path) if f.endswith(('.pdf', '.txt'))]
+    docs_bytes = sum(os.path.getsize(os.path.join(docs_service.docs_path, f)) for f in files)
+
+    started = time.perf_counter()
+    docs_service.process_docs(incremental=False)
+    docs_seconds = time.perf_counter() - started
+    chunks = fixture.store.docs_collection.count()
+
+    started = time.perf_counter()
+    fixture.intent_service().process_intents(reembed=True)
+    intent_seconds = time.perf_counter() - started
+
+    return {
+        "docs": {
+            "files": len(files),
+            "megabytes": docs_bytes / 1e6,
+            "chunks": chunks,
+            "seconds": docs_seconds,
+            "docs_per_sec": len(files) / docs_seconds if docs_seconds else 0.0,
+            "chunks_per_sec": chunks / docs_seconds if docs_seconds else 0.0,
+        },
+        "intents": {
+            "examples": len(INTENT_TRAINING_DATA),
+            "seconds": intent_seconds,
+            "examples_per_sec": len(INTENT_TRAINING_DATA) / intent_seconds if intent_seconds else 0.0,
+        },
+    }
+
+
+def benchmark_stages(controller, messages: List[str], operations: int, concurrency: int) -> Dict[str, Any]:
+    """Latency of each pipeline stage, fed with precomputed inputs from the previous stage"""
+    service = controller.chatbot_service
+    queries = service.build_queries(messages)
+    intents = service.prerouting_batch(queries)
+    for query, intent in zip(queries, intents):
+        query.intent = intent
+    contexts = service.generate_context_batch(queries, intents)
+
+    def pick(i):
+        return i % len(messages)
+
+    return {
+        "embed": run_concurrent(lambda i: service.build_query(messages[pick(i)]), operations, concurrency),
+        "prerouting": run_concurrent(lambda i: service.prerouting(queries[pick(i)]), operations, concurrency),
+        "generate_context": run_concurrent(
+            lambda i: service.generate_context(queries[pick(i)], intents[pick(i)]), operations, concurrency
+        ),
+        # generate_prompt recorta el contexto en el lugar: cada llamada recibe su copia (sin medir)
+        "generate_prompt": run_concurrent(
+            lambda args: service.generate_prompt(queries[args[0]], intents[args[0]], args[1]), operations, concurrency,
+            prepare=lambda i: (pick(i), copy.deepcopy(contexts[pick(i)]))
+        ),
+        "process_message": run_concurrent(lambda i: controller.process_message(messages[pick(i)]), operations, concurrency),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the chatbot pipeline")
+    parser.add_argument("--embedder", choices=["model", "hashing"], default="model",
+                        help="model: the real SentenceTransformer (local cache); hashing: cheap stand-in")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--operations", type=int, default=200, help="Calls per stage and concurrency level")
+    parser.add_argument("--messages", type=int, default=100, help="Distinct messages sampled from the intent corpus")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Simulated LLM latency")
+    parser.add_argument("--embed-cache-size", type=int, default=0, help="Embedding cache entries (0 measures every encode)")
+    parser.add_argument("--response-cache-size", type=int, default=0, help="Response cache entries (0 calls the LLM every time)")
+    parser.add_argument("--workers", type=int, default=None, help="Ingestion extraction processes")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    fixture = OfflineFixture(embedder=args.embedder, llm_latency_ms=args.llm_latency_ms,
+                             embed_cache_size=args.embed_cache_size)
+    try:
+        ingestion = benchmark_ingestion(fixture, workers=args.workers)
+
+        controller = fixture.controller(response_cache_size=args.response_cache_size)
+        fixture.store.warm()
+        controller.chatbot_service.intent_index.load()
+
+        texts = sorted({item["text"] for item in INTENT_TRAINING_DATA})
+        messages = random.Random(args.seed).sample(texts, min(args.messages, len(texts)))
+
+        results = {}
+        for concurrency in args.concurrency:
+            results[str(concurrency)] = benchmark_stages(controller, messages, args.operations, concurrency)
+
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+            "config": {**fixture.info(), **{k: v for k, v in vars(args).items() if k != "output"}},
+            "ingestion": ingestion,
+            "stages": results,
+            "embedding_batcher": fixture.model.model.stats(),
+        }
+    finally:
+        fixture.close()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Intent routing evaluation and threshold sweep
+Run from src: python -m benchmarks.routing [--folds 5] [--write-config] [--output routing.json]
+
+Measures prerouting on out-of-sample messages:
+- k-fold over INTENT_TRAINING_DATA: each fold is routed against an index of the other folds
+- held-out file (data/intents_holdout.jsonl), which also has "ambiguo" messages,
+  routed against the whole training set
+Every (ambiguous_threshold, gap_threshold) pair is scored with a cost: a wrong
+"ambiguo" wastes a round trip asking the user again, a wrong "sql"/"docs" sends
+the LLM useless context. The cheapest pair is reported (confusion matrix,
+ambiguity rate, classification latency) and, with --write-config, saved to the
+routing config that ChatbotService loads at startup.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+
+from persistence.db_setup.data.intents_data import INTENT_TRAINING_DATA
+from services.intent_index import IntentIndex, classify_neighbours
+from services.intent_prototypes import IntentPrototypes
+from services.routing_config import DEFAULT_ROUTING, load_routing_config, save_routing_config
+
+HOLDOUT_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "persistence", "db_setup", "data", "intents_holdout.jsonl")
+
+LABELS = ("sql", "docs", "ambiguo")
+
+# Vecinos consultados por el prerouting (ChatbotService.prerouting_batch)
+N_RESULTS = 3
+
+
+def load_holdout(path: str) -> List[Dict[str, str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def stratified_folds(labels: List[str], folds: int, seed: int) -> List[int]:
+    """Fold number of each example, balancing intents across folds"""
+    assignment = [0] * len(labels)
+    rng = random.Random(seed)
+    for label in sorted(set(labels)):
+        positions = [i for i, value in enumerate(labels) if value == label]
+        rng.shuffle(positions)
+        for n, i in enumerate(positions):
+            assignment[i] = n % folds
+    return assignment
+
+
+def neighbours(index: IntentIndex, vectors) -> List[Tuple[List[float], List[str]]]:
+    """Top-N (distances, intents) of each vector, as prerouting sees them"""
+    results = index.query(vectors, n_results=N_RESULTS)
+    return [
+        (distances, [meta["intent"] for meta in metadatas])
+        for distances, metadatas in zip(results["distances"], results["metadatas"])
+    ]
+
+
+def grid(start: float, stop: float, step: float) -> List[float]:
+    """Inclusive range of thresholds"""
+    return [round(float(value), 4) for value in np.arange(start, stop + step / 2, step)]
+
+
+def route(samples, thresholds: Dict[str, float]) -> List[str]:
+    return [
+        classify_neighbours(distances, intents, thresholds["ambiguous_threshold"], thresholds["gap_threshold"])
+        for distances, intents in samples
+    ]
+
+
+def fast_path(nearest, knn_decisions: List[str], gold: List[str], thresholds: Dict[str, float], margin: float) -> Dict[str, Any]:
+    """How many messages the prototypes route on their own, and whether they agree with the kNN rule"""
+    prototypes = IntentPrototypes(margin=margin, max_distance=thresholds["ambiguous_threshold"])
+    # Margen 0: camino rápido desactivado, todo va al kNN
+    fast = [prototypes.decide(*candidate) if prototypes.enabled else None for candidate in nearest]
+    taken = [i for i, decision in enumerate(fast) if decision is not None]
+    final = [fast[i] if fast[i] is not None else knn_decisions[i] for i in range(len(gold))]
+    return {
+        "margin": margin,
+        "fast_fraction": len(taken) / len(gold) if gold else 0.0,
+        "disagreements": sum(fast[i] != knn_decisions[i] for i in taken),
+        "accuracy": sum(p == g for p, g in zip(final, gold)) / len(gold) if gold else 0.0,
+    }
+
+
+def score(gold: List[str], predicted: List[str], ambiguous_cost: float, misroute_cost: float) -> Dict[str, Any]:
+    """Accuracy, ambiguity rate, mean cost and confusion matrix (gold -> predicted -> count)"""
+    confusion = {g: {p: 0 for p in LABELS} for g in LABELS}
+    cost = 0.0
+    for g, p in zip(gold, predicted):
+        confusion[g][p] += 1
+        if g == p:
+            continue
+        cost += ambiguous_cost if p == "ambiguo" else misroute_cost
+    total = len(gold)
+    return {
+        "examples": total,
+        "accuracy": sum(confusion[label][label] for label in LABELS) / total if total else 0.0,
+        "ambiguity_rate": sum(confusion[g]["ambiguo"] for g in LABELS) / total if total else 0.0,
+        "mean_cost": cost / total if total else 0.0,
+        "confusion": {g: row for g, row in confusion.items() if any(row.values())},
+    }
+
+
+def classification_latency(index: IntentIndex, vectors, thresholds: Dict[str, float], repeats: int = 5) -> Dict[str, float]:
+    """Per-message latency of an index query + decision (embedding excluded), in microseconds"""
+    latencies = []
+    for _ in range(repeats):
+        for vector in vectors:
+            started = time.perf_counter()
+            distances, intents = neighbours(index, vector[None, :])[0]
+            classify_neighbours(distances, intents, thresholds["ambiguous_threshold"], thresholds["gap_threshold"])
+            latencies.append(time.perf_counter() - started)
+    values = np.array(latencies) * 1e6
+    return {
+        "p50_us": float(np.percentile(values, 50)),
+        "p95_us": float(np.percentile(values, 95)),
+        "p99_us": float(np.percentile(values, 99)),
+    }
+
+
+def load_encoder(name: str):
+    """(encoder, model name) for 'model' (embed_model) or 'hashing' (offline stand-in)"""
+    if name == "hashing":
+        from benchmarks.fixtures import HashingEmbedder
+        return HashingEmbedder(), "hashing"
+    from llm import embed_model
+    return embed_model, embed_model.model_name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate intent routing and choose its thresholds")
+    parser.add_argument("--embedder", choices=["model", "hashing"], default="model")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--holdout", default=HOLDOUT_PATH, help="JSONL file with {'text', 'intent'} lines")
+    parser.add_argument("--ambiguous-range", type=float, nargs=3, default=[0.1, 2.0, 0.05], metavar=("START", "STOP", "STEP"))
+    parser.add_argument("--gap-range", type=float, nargs=3, default=[0.0, 0.3, 0.02], metavar=("START", "STOP", "STEP"))
+    parser.add_argument("--ambiguous-cost", type=float, default=1.0, help="Cost of answering 'ambiguo' to a clear message")
+    parser.add_argument("--misroute-cost", type=float, default=2.0, help="Cost of routing to the wrong context")
+    parser.add_argument("--margin-range", type=float, nargs=3, default=[0.02, 1.0, 0.02], metavar=("START", "STOP", "STEP"),
+                        help="Prototype fast-path margins to try")
+    parser.add_argument("--prototypes", type=int, default=int(os.getenv("INTENT_PROTOTYPES", "3")), help="Prototypes per intent")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--write-config", action="store_true", help="Save the chosen thresholds to the routing config")
+    parser.add_argument("--config", default=None, help="Routing config path (default: ROUTING_CONFIG or persistence/routing_config.json)")
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    encoder, model_name = load_encoder(args.embedder)
+    train_texts = [item["text"] for item in INTENT_TRAINING_DATA]
+    train_labels = [item["intent"] for item in INTENT_TRAINING_DATA]
+    holdout = load_holdout(args.holdout) if os.path.exists(args.holdout) else []
+    holdout_labels = [item["intent"] for item in holdout]
+
+    train_vectors = np.asarray(encoder.encode(train_texts, normalize_embeddings=True), dtype=np.float32)
+    holdout_vectors = np.asarray(encoder.encode([item["text"] for item in holdout], normalize_embeddings=True), dtype=np.float32) \
+        if holdout else np.empty((0, train_vectors.shape[1]), dtype=np.float32)
+
+    # Vecinos de cada ejemplo: se calculan una vez y el barrido solo re-aplica la regla
+    fold_of = stratified_folds(train_labels, args.folds, args.seed)
+    kfold_samples = [None] * len(train_texts)
+    kfold_nearest = [None] * len(train_texts)
+    for fold in range(args.folds):
+        train = [i for i, f in enumerate(fold_of) if f != fold]
+        test = [i for i, f in enumerate(fold_of) if f == fold]
+        index = IntentIndex.from_arrays(train_vectors[train], [train_labels[i] for i in train])
+        prototypes = IntentPrototypes.from_arrays(train_vectors[train], [train_labels[i] for i in train], per_intent=args.prototypes)
+        for i, sample, candidate in zip(test, neighbours(index, train_vectors[test]), prototypes.nearest(train_vectors[test])):
+            kfold_samples[i] = sample
+            kfold_nearest[i] = candidate
+
+    full_index = IntentIndex.from_arrays(train_vectors, train_labels, documents=train_texts)
+    holdout_samples = neighbours(full_index, holdout_vectors) if holdout else []
+    full_prototypes = IntentPrototypes.from_arrays(train_vectors, train_labels, per_intent=args.prototypes)
+    holdout_nearest = full_prototypes.nearest(holdout_vectors) if holdout else []
+
+    gold = train_labels + holdout_labels
+    samples = kfold_samples + holdout_samples
+    nearest = kfold_nearest + holdout_nearest
+
+    sweep = []
+    for ambiguous_threshold in grid(*args.ambiguous_range):
+        for gap_threshold in grid(*args.gap_range):
+            thresholds = {"ambiguous_threshold": ambiguous_threshold, "gap_threshold": gap_threshold}
+            result = score(gold, route(samples, thresholds), args.ambiguous_cost, args.misroute_cost)
+            sweep.append({**thresholds, **{k: result[k] for k in ("accuracy", "ambiguity_rate", "mean_cost")}})
+
+    # Menor costo; a igual costo, mayor accuracy y luego umbrales más cercanos a los actuales
+    current = load_routing_config(model_name, args.config)
+    best = min(sweep, key=lambda row: (
+        round(row["mean_cost"], 9),
+        -row["accuracy"],
+        abs(row["ambiguous_threshold"] - current["ambiguous_threshold"]) + abs(row["gap_threshold"] - current["gap_threshold"]),
+    ))
+    chosen = {"ambiguous_threshold": best["ambiguous_threshold"], "gap_threshold": best["gap_threshold"]}
+
+    def evaluate(thresholds):
+        return {
+            "kfold": score(train_labels, route(kfold_samples, thresholds), args.ambiguous_cost, args.misroute_cost),
+            "holdout": score(holdout_labels, route(holdout_samples, thresholds), args.ambiguous_cost, args.misroute_cost),
+            "combined": score(gold, route(samples, thresholds), args.ambiguous_cost, args.misroute_cost),
+        }
+
+    # Camino rápido: el menor margen con el que los prototipos nunca contradicen al kNN
+    knn_decisions = route(samples, chosen)
+    margins = [fast_path(nearest, knn_decisions, gold, chosen, margin) for margin in grid(*args.margin_range)]
+    safe = [row for row in margins if row["disagreements"] == 0 and row["fast_fraction"] > 0]
+    chosen["fast_path_margin"] = min(safe, key=lambda row: row["margin"])["margin"] if safe else 0.0
+
+    report = {
+        "model": model_name,
+        "examples": {"training": len(train_texts), "holdout": len(holdout), "folds": args.folds},
+        "costs": {"ambiguous": args.ambiguous_cost, "misroute": args.misroute_cost},
+        "current": {"thresholds": current, **evaluate(current)},
+        "chosen": {"thresholds": chosen, **evaluate(chosen)},
+        "defaults": {"thresholds": DEFAULT_ROUTING, "combined": evaluate(DEFAULT_ROUTING)["combined"]},
+        "fast_path": {
+            "current": fast_path(nearest, route(samples, current), gold, current, current["fast_path_margin"]),
+            "chosen": fast_path(nearest, knn_decisions, gold, chosen, chosen["fast_path_margin"]),
+            "margins": margins,
+        },
+        "classification_latency": classification_latency(full_index, np.vstack([train_vectors, holdout_vectors]), chosen),
+        "sweep": sweep,
+    }
+
+    if args.write_config:
+        path = save_routing_config({
+            **chosen,
+            "model": model_name,
+            "n_results": N_RESULTS,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "metrics": {k: report["chosen"]["combined"][k] for k in ("accuracy", "ambiguity_rate", "mean_cost")},
+        }, args.config)
+        report["config_written"] = path
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    summary = {k: report[k] for k in ("model", "examples", "current", "chosen", "classification_latency")}
+    summary["fast_path"] = {k: report["fast_path"][k] for k in ("current", "chosen")}
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    if args.write_config:
+        print(f"✅ Routing thresholds written to {report['config_written']}")
+
+
+if __name__ == "__main__":
+    main()
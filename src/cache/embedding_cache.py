@@ -0,0 +1,240 @@
+"""
+Embedding cache
+Bounded LRU + TTL cache in front of the SentenceTransformer encode call
+"""
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text for cache keys: unicode NFC, collapsed whitespace, stripped"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingCache:
+    """
+    Wraps an embedding model and caches its vectors.
+
+    Exposes the same ``encode`` call as SentenceTransformer so callers keep using
+    ``embed_model.encode(...)``. Vectors are stored as float32 and keyed on the
+    normalized text, the model name and the normalization flag. An optional disk
+    tier (memory-mapped .npy + key index) lets a restarted process start warm.
+    """
+
+    # encode kwargs the cache understands; anything else bypasses the cache
+    _SUPPORTED_KWARGS = {"batch_size", "show_progress_bar", "convert_to_numpy"}
+
+    def __init__(self, model, model_name: str, max_size: int = 2048,
+                 ttl: float = 86400, disk_path: Optional[str] = None):
+        """Initialize the cache around a model"""
+        self.model = model
+        self.model_name = model_name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.disk_path = disk_path
+
+        self._entries = OrderedDict()  # key -> (vector, created_at)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        # Disk tier: key -> row in a memory-mapped matrix
+        self._disk_index: Dict[bytes, int] = {}
+        self._disk_created: List[float] = []
+        self._disk_vectors = None
+        if disk_path:
+            self._load_disk()
+            atexit.register(self.flush)
+
+    def __getattr__(self, name):
+        """Delegate everything else (tokenizer, max_seq_length, ...) to the model"""
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def _key(self, text: str, normalize_embeddings: bool) -> bytes:
+        raw = f"{self.model_name}\0{int(normalize_embeddings)}\0{text}"
+        return hashlib.sha1(raw.encode("utf-8")).digest()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def _get(self, key: bytes, now: float):
+        """Look up a key in memory, then on disk; caller holds the lock"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if not self._expired(entry[1], now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            del self._entries[key]
+            self.expirations += 1
+
+        row = self._disk_index.get(key)
+        if row is not None:
+            created_at = self._disk_created[row]
+            if not self._expired(created_at, now):
+                # Se promueve a memoria (copia, el mmap es de solo lectura)
+                vector = np.array(self._disk_vectors[row], dtype=np.float32)
+                self._put(key, vector, created_at)
+                self.disk_hits += 1
+                return vector
+            del self._disk_index[key]
+            self.expirations += 1
+        return None
+
+    def _put(self, key: bytes, vector, created_at: float):
+        """Store a vector and evict the least recently used entries; caller holds the lock"""
+        self._entries[key] = (vector, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def encode(self, sentences, normalize_embeddings: bool = False, **kwargs):
+        """Encode sentences, only running the model for cache misses"""
+        if self.max_size <= 0 or not set(kwargs) <= self._SUPPORTED_KWARGS \
+                or kwargs.get("convert_to_numpy", True) is False:
+            return self.model.encode(sentences, normalize_embeddings=normalize_embeddings, **kwargs)
+        # Lista vacía: nada que cachear; el modelo devuelve la forma que corresponde
+        if not isinstance(sentences, str) and len(sentences) == 0:
+            return self.model.encode(sentences, normalize_embeddings=normalize_embeddings, **kwargs)
+
+        single = isinstance(sentences, str)
+        texts = [normalize_text(t) for t in ([sentences] if single else sentences)]
+        keys = [self._key(t, normalize_embeddings) for t in texts]
+
+        vectors = [None] * len(texts)
+        now = time.time()
+        with self._lock:
+            for i, key in enumerate(keys):
+                vectors[i] = self._get(key, now)
+
+        # Textos repetidos dentro del mismo lote se codifican una sola vez
+        missing: Dict[bytes, List[int]] = OrderedDict()
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], []).append(i)
+
+        if missing:
+            miss_texts = [texts[positions[0]] for positions in missing.values()]
+            encoded = self.model.encode(
+                miss_texts,
+                normalize_embeddings=normalize_embeddings,
+                convert_to_numpy=True,
+                batch_size=kwargs.get("batch_size", 32),
+                show_progress_bar=kwargs.get("show_progress_bar", False)
+            )
+            encoded = np.asarray(encoded, dtype=np.float32)
+            with self._lock:
+                self.misses += len(missing)
+                for (key, positions), vector in zip(missing.items(), encoded):
+                    self._put(key, vector, now)
+                    for i in positions:
+                        vectors[i] = vector
+
+        result = np.stack(vectors).astype(np.float32, copy=False)
+        return result[0] if single else result
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current sizes"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": len(self._entries),
+                "disk_size": len(self._disk_index),
+            }
+
+    def clear(self):
+        """Drop every in-memory entry"""
+        with self._lock:
+            self._entries.clear()
+
+    # ------------------------------------------------------------------
+    # Disk tier
+    # ------------------------------------------------------------------
+
+    def _disk_files(self):
+        return (os.path.join(self.disk_path, "embeddings.npy"),
+                os.path.join(self.disk_path, "index.json"))
+
+    def _load_disk(self):
+        """Open the memory-mapped disk tier if it exists and matches the model"""
+        vectors_file, index_file = self._disk_files()
+        if not (os.path.exists(vectors_file) and os.path.exists(index_file)):
+            return
+        try:
+            with open(index_file, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("model") != self.model_name:
+                print(f"Embedding cache on disk belongs to {index.get('model')}, ignoring it")
+                return
+            self._disk_vectors = np.load(vectors_file, mmap_mode="r")
+            self._disk_created = index["created"]
+            self._disk_index = {bytes.fromhex(k): row for row, k in enumerate(index["keys"])}
+        except Exception as e:
+            print(f"Error loading embedding cache from {self.disk_path}: {e}")
+            self._disk_index, self._disk_created, self._disk_vectors = {}, [], None
+
+    def flush(self):
+        """Write memory and still-valid disk entries to the disk tier"""
+        if not self.disk_path:
+            return
+        now = time.time()
+        with self._lock:
+            merged = OrderedDict()
+            for key, row in self._disk_index.items():
+                created_at = self._disk_created[row]
+                if not self._expired(created_at, now):
+                    merged[key] = (self._disk_vectors[row], created_at)
+            for key, (vector, created_at) in self._entries.items():
+                if not self._expired(created_at, now):
+                    merged[key] = (vector, created_at)
+                    merged.move_to_end(key)
+            # El tier en disco también está acotado, se quedan los más recientes
+            items = list(merged.items())[-self.max_size:]
+
+        if not items:
+            return
+        os.makedirs(self.disk_path, exist_ok=True)
+        vectors_file, index_file = self._disk_files()
+        keys = [key for key, _ in items]
+        matrix = np.ascontiguousarray(np.stack([v for _, (v, _) in items]), dtype=np.float32)
+        index = {
+            "model": self.model_name,
+            "dim": int(matrix.shape[1]),
+            "keys": [key.hex() for key in keys],
+            "created": [created_at for _, (_, created_at) in items],
+        }
+        # Se sueltan las vistas del mmap anterior antes de reemplazar el archivo
+        del items, merged
+        # Se escribe en temporales y se reemplaza para no dejar archivos a medias
+        np.save(vectors_file + ".tmp.npy", matrix)
+        with open(index_file + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        with self._lock:
+            self._disk_vectors = None
+            os.replace(vectors_file + ".tmp.npy", vectors_file)
+            os.replace(index_file + ".tmp", index_file)
+            self._disk_vectors = np.load(vectors_file, mmap_mode="r")
+            self._disk_created = index["created"]
+            self._disk_index = {key: row for row, key in enumerate(keys)}
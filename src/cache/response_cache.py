@@ -0,0 +1,142 @@
+"""
+Response cache
+Semantic cache of LLM answers keyed on intent, context fingerprint and query embedding
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+
+def context_fingerprint(context: Dict[str, Any], conversation: Optional[Dict[str, Any]] = None) -> str:
+    """Hash of the parts of a context (and of the conversation state) that end up in the prompt"""
+    relevant = {
+        "context_type": context.get("context_type"),
+        "instructions": context.get("instructions"),
+        "specific_guidance": context.get("specific_guidance"),
+        "relevant_docs": [
+            [doc.get("source"), doc.get("page"), doc.get("content")]
+            for doc in context.get("relevant_docs", [])
+        ],
+        "examples": context.get("examples", []),
+    }
+    if conversation:
+        # Con historial la respuesta depende del resumen y de los turnos literales del prompt
+        relevant["conversation"] = [conversation.get("summary"), conversation.get("turns", [])]
+    raw = json.dumps(relevant, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache of LLM answers.
+
+    A lookup hits when an entry has the same intent and context fingerprint and its
+    query embedding has cosine similarity >= ``similarity_threshold`` with the new one.
+    Embeddings are expected to be normalized, so cosine similarity is a dot product.
+    """
+
+    def __init__(self, max_size: int = 512, ttl: float = 3600, similarity_threshold: float = 0.95):
+        """Initialize an empty cache"""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+
+        self._entries = OrderedDict()  # entry_id -> entry dict
+        self._buckets: Dict[tuple, set] = {}  # (intent, fingerprint) -> entry ids
+        self._versions: Dict[str, int] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _remove(self, entry_id: int):
+        """Remove an entry; caller holds the lock"""
+        entry = self._entries.pop(entry_id)
+        bucket = self._buckets.get(entry["bucket"])
+        if bucket is not None:
+            bucket.discard(entry_id)
+            if not bucket:
+                del self._buckets[entry["bucket"]]
+
+    def lookup(self, intent: str, fingerprint: str, embedding) -> Optional[str]:
+        """Return a cached answer for a similar query with the same context, or None"""
+        if self.max_size <= 0:
+            return None
+        query = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        now = time.time()
+        with self._lock:
+            entry_ids = list(self._buckets.get((intent, fingerprint), ()))
+            best_id, best_similarity = None, self.similarity_threshold
+            for entry_id in entry_ids:
+                entry = self._entries[entry_id]
+                if now - entry["created_at"] > self.ttl:
+                    self._remove(entry_id)
+                    continue
+                similarity = float(np.dot(entry["embedding"], query))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id]["answer"]
+
+    def store(self, intent: str, fingerprint: str, embedding, answer: str):
+        """Store an answer, evicting the least recently used entries"""
+        if self.max_size <= 0:
+            return
+        bucket = (intent, fingerprint)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "intent": intent,
+                "bucket": bucket,
+                "embedding": np.asarray(embedding, dtype=np.float32).reshape(-1).copy(),
+                "answer": answer,
+                "created_at": time.time(),
+            }
+            self._buckets.setdefault(bucket, set()).add(entry_id)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, intent: str = None):
+        """Drop every entry, or only the entries of one intent"""
+        with self._lock:
+            for entry_id in [i for i, e in self._entries.items() if intent is None or e["intent"] == intent]:
+                self._remove(entry_id)
+            self.invalidations += 1
+
+    def sync_version(self, collection_name: str, version: int, intent: str = None) -> bool:
+        """
+        Invalidate when a collection's version changed since the last call.
+        Returns True if entries were invalidated.
+        """
+        with self._lock:
+            previous = self._versions.get(collection_name)
+            self._versions[collection_name] = version
+        if previous is None or previous == version:
+            return False
+        self.invalidate(intent)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+            }
@@ -0,0 +1,105 @@
+"""
+Retrieval cache
+LRU cache of collection query results, keyed per query and collection version
+"""
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+from cache.embedding_cache import normalize_text
+
+
+class RetrievalCache:
+    """
+    Caches what a collection returned for one query.
+
+    Keys are (collection, collection version, query, n_results, where filter). The
+    query part is the normalized text when the result depends on it (lexical
+    search), else the embedding quantized to ``resolution`` so vectors that
+    differ only by float noise share an entry. A version bump makes the old
+    entries unreachable; ``sync_version`` also evicts them right away.
+    Independent of the LLM response cache: hits here do not need the same prompt.
+    """
+
+    def __init__(self, max_size: int = 1024, resolution: float = 1e-3):
+        """Initialize an empty cache"""
+        self.max_size = max_size
+        self.resolution = resolution
+
+        self._entries = OrderedDict()  # key -> cached value
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def make_key(self, collection_name: str, version: int, n_results, where: Optional[Dict[str, Any]] = None,
+                 embedding=None, text: Optional[str] = None) -> tuple:
+        """Cache key of a query; ``text`` takes precedence over ``embedding``"""
+        if text is not None:
+            probe = ("text", normalize_text(text))
+        else:
+            vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+            probe = ("embedding", np.round(vector / self.resolution).astype(np.int32).tobytes())
+        where_key = json.dumps(where, sort_keys=True) if where else None
+        return collection_name, version, probe, n_results, where_key
+
+    def get(self, key: tuple) -> Optional[Any]:
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: tuple, value: Any):
+        """Store a result, evicting the least recently used entries"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def sync_version(self, collection_name: str, version: int) -> bool:
+        """
+        Drop the entries of a collection whose version changed since the last call.
+        Returns True if entries were invalidated.
+        """
+        with self._lock:
+            previous = self._versions.get(collection_name)
+            self._versions[collection_name] = version
+            if previous is None or previous == version:
+                return False
+            for key in [key for key in self._entries if key[0] == collection_name and key[1] != version]:
+                del self._entries[key]
+            self.invalidations += 1
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+            }
@@ -2,7 +2,7 @@
 Chatbot controller
 Handles control logic and orchestration
 """
-from typing import Dict, Any
+from typing import Dict, Any, List, Iterator, Optional, Tuple
 from services.chatbot_service import ChatbotService
 
 
@@ -13,40 +13,161 @@ class ChatbotController:
         """Initialize the controller with the service"""
         self.chatbot_service = ChatbotService()
 
-    def process_message(self, message: str) -> Dict[str, Any]:
+    def warm(self) -> Dict[str, float]:
+        """Load models, Chroma and indexes before taking traffic; returns seconds per step"""
+        return self.chatbot_service.warm()
+
+    def preload(self, embeddings: bool = True) -> Dict[str, float]:
+        """Load the state shared by forked workers (indexes, model weights); see serve.py"""
+        return self.chatbot_service.preload(embeddings)
+
+    def process_message(self, message: str, session_id: Optional[str] = None) -> Dict[str, Any]:
         """Process message and return structured result"""
+        return self.process_batch([message], [session_id])[0]
+
+    def process_batch(self, messages: List[str], session_ids: Optional[List[Optional[str]]] = None) -> List[Dict[str, Any]]:
+        """
+        Process many messages in one pass and return one result per message, in order.
+        Encoding, intent routing and retrieval are batched; LLM calls run concurrently.
+        ``session_ids`` (optional, one per message) attach each message to its conversation.
+        """
+        session_ids = session_ids or [None] * len(messages)
+        results: List[Dict[str, Any]] = [None] * len(messages)
+        positions = []
+        for i, message in enumerate(messages):
+            if self.validate_message(message):
+                positions.append(i)
+            else:
+                results[i] = self._error_result(message, ValueError("Invalid message"))
+
+        if not positions:
+            return results
+
+        valid_messages = [messages[i] for i in positions]
         try:
-            prerouting_result = self.chatbot_service.prerouting(message)
+            # Encode every message once; each query carries its embedding through every stage
+            queries = self.chatbot_service.build_queries(valid_messages)
+            self.chatbot_service.load_conversation(queries, [session_ids[i] for i in positions])
+
+            intents = self.chatbot_service.prerouting_batch(queries)
+            for query, intent in zip(queries, intents):
+                query.intent = intent
 
-            print(f"Prerouting result: {prerouting_result}")
-            
             # Generate context based on intent
-            context = self.chatbot_service.generate_context(message, prerouting_result)
-            
-            # Generate prompt with all context
-            prompt = self.chatbot_service.generate_prompt(message, prerouting_result, context)
-            
-            llm_response = self.chatbot_service.process_message(message, prompt)
-            
-            return {
-                "original_message": message,
-                "is_valid": True,
-                "response": llm_response,
-                "prompt_used": prompt,
-                "intent": prerouting_result,
-                "context": context
-            }
+            contexts = self.chatbot_service.generate_context_batch(queries, intents)
+        except Exception as e:
+            for i, message in zip(positions, valid_messages):
+                results[i] = self._error_result(message, e)
+            return results
+
+        # Generate prompt with all context
+        prompts = []
+        for i, query, intent, context in zip(positions, queries, intents, contexts):
+            try:
+                prompts.append(self.chatbot_service.generate_prompt(query, intent, context))
+            except Exception as e:
+                prompts.append(None)
+                results[i] = self._error_result(query.message, e)
+
+        pending = [n for n, prompt in enumerate(prompts) if prompt is not None]
+        llm_responses = self.chatbot_service.process_messages(
+            [queries[n] for n in pending],
+            [prompts[n] for n in pending],
+            [contexts[n] for n in pending]
+        )
+
+        for n, llm_response in zip(pending, llm_responses):
+            query = queries[n]
+            if isinstance(llm_response, Exception):
+                results[positions[n]] = self._llm_error_result(query, prompts[n], contexts[n], llm_response)
+                continue
+            self.chatbot_service.remember(query, llm_response)
+            results[positions[n]] = self._result(query, prompts[n], contexts[n], llm_response)
+        return results
+
+    def _prepare(self, message: str, session_id: Optional[str] = None):
+        """Run the CPU-bound stages for one message: encode, routing, context and prompt"""
+        query = self.chatbot_service.build_query(message)
+        self.chatbot_service.load_conversation([query], [session_id])
+        intent = self.chatbot_service.prerouting(query)
+        query.intent = intent
+        context = self.chatbot_service.generate_context(query, intent)
+        prompt = self.chatbot_service.generate_prompt(query, intent, context)
+        return query, context, prompt
+
+    def stream_message(self, message: str, session_id: Optional[str] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Stream the answer for one message as (event, data) pairs:
+        'meta' with the intent and context, one 'token' per LLM chunk, then 'done'.
+        If the LLM fails, even after some tokens, it ends with 'error' and the turn is not remembered.
+        """
+        try:
+            query, context, prompt = self._prepare(message, session_id)
+        except Exception as e:
+            yield "error", self._error_result(message, e)
+            return
+
+        yield "meta", {"intent": query.intent, "context": context}
+        parts = []
+        try:
+            for delta in self.chatbot_service.stream_message(query, prompt, context):
+                parts.append(delta)
+                yield "token", {"delta": delta}
         except Exception as e:
-            print(f"Error processing message: {str(e)}")
-            return {
-                "original_message": message,
-                "is_valid": False,
-                "response": f"I'm sorry, I encountered an error while processing your message. Please try again.",
-                "prompt_used": "",
-                "intent": "error",
-                "context": {},
-                "error": str(e)
-            }
+            yield "error", self._llm_error_result(query, prompt, context, e)
+            return
+        response = "".join(parts)
+        self.chatbot_service.remember(query, response)
+        yield "done", self._result(query, prompt, context, response)
+
+    def _result(self, query, prompt: str, context: Dict[str, Any], llm_response: str) -> Dict[str, Any]:
+        """Result returned for a processed message"""
+        return {
+            "original_message": query.message,
+            "is_valid": True,
+            "response": llm_response,
+            "prompt_used": prompt,
+            "intent": query.intent,
+            "context": context,
+            "cached": query.response_cached,
+            # Tokens del prompt final y candidatos que el empaquetador dejó afuera (duplicados / presupuesto)
+            "prompt_tokens": query.prompt_tokens,
+            "dropped_candidates": query.dropped_candidates,
+            "session_id": query.session_id,
+            "memory": self._memory_report(query)
+        }
+
+    def _memory_report(self, query) -> Dict[str, Any]:
+        """Conversation state the message was answered with"""
+        conversation = query.conversation or {}
+        return {
+            "turns": len(conversation.get("turns", [])),
+            "summarized_turns": conversation.get("summarized_turns", 0),
+            "tokens": conversation.get("tokens", 0),
+            "steered": query.steered
+        }
+
+    def _llm_error_result(self, query, prompt: str, context: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+        """Result for a message whose LLM call failed: the friendly message plus the error"""
+        print(f"Error processing message: {str(error)}")
+        result = self._result(query, prompt, context, self.chatbot_service.LLM_ERROR_MESSAGE)
+        result.update({"is_valid": False, "error": str(error)})
+        return result
+
+    def _error_result(self, message: str, error: Exception) -> Dict[str, Any]:
+        """Result returned for a message that could not be processed"""
+        print(f"Error processing message: {str(error)}")
+        return {
+            "original_message": message,
+            "is_valid": False,
+            "response": f"I'm sorry, I encountered an error while processing your message. Please try again.",
+            "prompt_used": "",
+            "intent": "error",
+            "context": {},
+            "prompt_tokens": 0,
+            "dropped_candidates": [],
+            "error": str(error)
+        }
 
     def validate_message(self, message: str) -> bool:
         """
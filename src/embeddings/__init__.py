@@ -0,0 +1 @@
+# Embedding backends package
@@ -0,0 +1,169 @@
+"""
+Embedding backends
+Pluggable CPU runtimes for the same SentenceTransformer model
+"""
+import os
+from typing import List, Optional
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Export int8 dinámica incluida en los repos sentence-transformers/* del Hub;
+# EMBED_ONNX_FILE permite elegir otra (p. ej. onnx/model_qint8_avx512_vnni.onnx)
+DEFAULT_ONNX_FILES = {
+    "onnx": "onnx/model.onnx",
+    "onnx-int8": "onnx/model_quint8_avx2.onnx",
+}
+
+
+class EmbeddingBackend:
+    """
+    Interface every backend implements.
+
+    ``encode`` mirrors SentenceTransformer.encode for the arguments this project
+    uses and returns a float32 NumPy array.
+    """
+
+    name = "base"
+
+    def __init__(self, model):
+        self.model = model
+
+    def encode(self, sentences, normalize_embeddings: bool = False, batch_size: int = 32,
+               show_progress_bar: bool = False, convert_to_numpy: bool = True, **kwargs):
+        embeddings = self.model.encode(
+            sentences,
+            normalize_embeddings=normalize_embeddings,
+            batch_size=batch_size,
+            show_progress_bar=show_progress_bar,
+            convert_to_numpy=True,
+            **kwargs
+        )
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def __getattr__(self, name):
+        # tokenizer, max_seq_length, get_sentence_embedding_dimension, ...
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def __repr__(self):
+        return f"<{self.name} embedding backend>"
+
+
+class TorchBackend(EmbeddingBackend):
+    """Full-precision PyTorch SentenceTransformer (reference backend)"""
+
+    name = "torch"
+
+    def __init__(self, model_name: str, threads: Optional[int] = None, inter_op_threads: Optional[int] = None):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        if inter_op_threads:
+            try:
+                torch.set_num_interop_threads(inter_op_threads)
+            except RuntimeError as e:
+                # Solo se puede fijar antes de que torch arranque trabajo en paralelo
+                print(f"Could not set torch inter-op threads: {e}")
+
+        super().__init__(SentenceTransformer(model_name, device="cpu"))
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    ONNX Runtime export of the same model, optionally int8 dynamically quantized.
+
+    Uses the ONNX files published next to the model on the Hub. When the requested
+    file is missing, the model is exported locally and, for int8, quantized with
+    sentence-transformers' export helpers into ``export_dir``.
+    """
+
+    def __init__(self, model_name: str, quantized: bool = False, file_name: Optional[str] = None,
+                 threads: Optional[int] = None, inter_op_threads: Optional[int] = None,
+                 export_dir: Optional[str] = None):
+        self.name = "onnx-int8" if quantized else "onnx"
+        self.file_name = file_name or DEFAULT_ONNX_FILES[self.name]
+        self.session_options = self._session_options(threads, inter_op_threads)
+        try:
+            model = self._load(model_name, self.file_name)
+        except Exception as e:
+            print(f"ONNX file {self.file_name} not available for {model_name} ({e}); exporting locally")
+            model = self._export(model_name, quantized, export_dir)
+        super().__init__(model)
+
+    @staticmethod
+    def _session_options(threads: Optional[int], inter_op_threads: Optional[int]):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+        return options
+
+    def _load(self, model_name_or_path: str, file_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(
+            model_name_or_path,
+            device="cpu",
+            backend="onnx",
+            model_kwargs={
+                "file_name": file_name,
+                "provider": "CPUExecutionProvider",
+                "session_options": self.session_options,
+            }
+        )
+
+    def _export(self, model_name: str, quantized: bool, export_dir: Optional[str]):
+        from sentence_transformers import SentenceTransformer
+
+        export_dir = export_dir or os.path.join(os.path.expanduser("~"), ".cache", "chatbot_onnx", model_name.replace("/", "__"))
+        if not os.path.exists(os.path.join(export_dir, "onnx", "model.onnx")):
+            # export=True: optimum convierte el modelo PyTorch a ONNX
+            model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+            model.save_pretrained(export_dir)
+
+        if not quantized:
+            self.file_name = "onnx/model.onnx"
+            return self._load(export_dir, self.file_name)
+
+        from sentence_transformers.backend import export_dynamic_quantized_onnx_model
+
+        self.file_name = "onnx/model_qint8_avx2.onnx"
+        if not os.path.exists(os.path.join(export_dir, self.file_name)):
+            model = self._load(export_dir, "onnx/model.onnx")
+            export_dynamic_quantized_onnx_model(model, "avx2", export_dir)
+        return self._load(export_dir, self.file_name)
+
+
+def create_backend(backend: str, model_name: str, threads: Optional[int] = None,
+                   inter_op_threads: Optional[int] = None, onnx_file: Optional[str] = None,
+                   export_dir: Optional[str] = None) -> EmbeddingBackend:
+    """Build an embedding backend by name: 'torch', 'onnx' or 'onnx-int8'"""
+    if backend == "torch":
+        return TorchBackend(model_name, threads=threads, inter_op_threads=inter_op_threads)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxBackend(
+            model_name,
+            quantized=backend == "onnx-int8",
+            file_name=onnx_file,
+            threads=threads,
+            inter_op_threads=inter_op_threads,
+            export_dir=export_dir
+        )
+    raise ValueError(f"Unknown embedding backend '{backend}', expected one of {', '.join(BACKENDS)}")
+
+
+def cosine_agreement(reference, candidate) -> List[float]:
+    """Row-wise cosine similarity between two embedding matrices"""
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    return (np.einsum("ij,ij->i", reference, candidate) / np.maximum(norms, 1e-12)).tolist()
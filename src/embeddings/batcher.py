@@ -0,0 +1,172 @@
+"""
+Embedding micro-batcher
+Coalesces concurrent small encode calls into one batched forward pass
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Any, List
+
+import numpy as np
+
+
+class _Request:
+    __slots__ = ("texts", "normalize_embeddings", "future", "enqueued_at")
+
+    def __init__(self, texts: List[str], normalize_embeddings: bool):
+        self.texts = texts
+        self.normalize_embeddings = normalize_embeddings
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class EmbeddingBatcher:
+    """
+    Wraps an embedding model and batches concurrent requests.
+
+    Small ``encode`` calls (up to ``max_batch_size`` texts) are queued; a single
+    worker thread waits up to ``max_wait_ms`` for more requests (or until the batch
+    is full), runs one ``encode`` and hands each caller its rows through a future.
+    Large calls (ingestion) and calls with other kwargs go straight to the model.
+    With ``max_wait_ms=0`` the worker never waits: it batches whatever arrived
+    while the previous batch was running.
+    """
+
+    # encode kwargs that don't change the vectors; anything else bypasses the batcher
+    _SUPPORTED_KWARGS = {"batch_size", "show_progress_bar", "convert_to_numpy"}
+
+    def __init__(self, model, max_batch_size: int = 32, max_wait_ms: float = 2.0):
+        """Initialize the batcher around a model (the worker starts on first use)"""
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = deque()
+        self._queued_texts = 0
+        self._condition = threading.Condition()
+        self._worker = None
+
+        self.requests = 0
+        self.bypassed = 0
+        self.batches = 0
+        self.batched_texts = 0
+        self.batched_requests = 0
+        self.max_batch_seen = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        # Histograma de tamaños de batch: tamaño -> cantidad de batches
+        self.batch_sizes: Dict[int, int] = {}
+
+    def __getattr__(self, name):
+        """Delegate everything else (tokenizer, max_seq_length, ...) to the model"""
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def encode(self, sentences, normalize_embeddings: bool = False, **kwargs):
+        """Encode sentences, sharing the forward pass with concurrent callers"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if self.max_batch_size <= 1 or not texts or len(texts) > self.max_batch_size \
+                or not set(kwargs) <= self._SUPPORTED_KWARGS or kwargs.get("convert_to_numpy", True) is False:
+            with self._condition:
+                self.bypassed += 1
+            return self.model.encode(sentences, normalize_embeddings=normalize_embeddings, **kwargs)
+
+        request = _Request(texts, bool(normalize_embeddings))
+        with self._condition:
+            self._ensure_worker()
+            self._queue.append(request)
+            self._queued_texts += len(texts)
+            self.requests += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queued_texts)
+            self._condition.notify()
+
+        result = request.future.result()
+        return result[0] if single else result
+
+    def _ensure_worker(self):
+        """Start the worker thread; caller holds the condition"""
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+            self._worker.start()
+
+    def _next_batch(self) -> List[_Request]:
+        """Block until there is work, then collect requests for one batch"""
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+
+            # Se espera la ventana (o a llenar el batch) antes de cerrar el batch
+            deadline = time.perf_counter() + self.max_wait
+            while self._queued_texts < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            # Solo se juntan pedidos con el mismo flag de normalización
+            normalize = self._queue[0].normalize_embeddings
+            batch, size, skipped = [], 0, deque()
+            while self._queue:
+                request = self._queue.popleft()
+                if request.normalize_embeddings != normalize:
+                    skipped.append(request)
+                    continue
+                if batch and size + len(request.texts) > self.max_batch_size:
+                    skipped.append(request)
+                    break
+                batch.append(request)
+                size += len(request.texts)
+            skipped.extend(self._queue)
+            self._queue = skipped
+            self._queued_texts -= size
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            texts = [text for request in batch for text in request.texts]
+            started = time.perf_counter()
+            try:
+                vectors = self.model.encode(
+                    texts,
+                    normalize_embeddings=batch[0].normalize_embeddings,
+                    convert_to_numpy=True,
+                    batch_size=len(texts),
+                    show_progress_bar=False
+                )
+                vectors = np.asarray(vectors, dtype=np.float32)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            with self._condition:
+                self.batches += 1
+                self.batched_texts += len(texts)
+                self.batched_requests += len(batch)
+                self.max_batch_seen = max(self.max_batch_seen, len(texts))
+                self.batch_sizes[len(texts)] = self.batch_sizes.get(len(texts), 0) + 1
+                self.total_wait += sum(started - request.enqueued_at for request in batch)
+
+            offset = 0
+            for request in batch:
+                request.future.set_result(vectors[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and batch-size metrics"""
+        with self._condition:
+            return {
+                "queue_depth": self._queued_texts,
+                "max_queue_depth": self.max_queue_depth,
+                "requests": self.requests,
+                "bypassed": self.bypassed,
+                "batches": self.batches,
+                "mean_batch_size": self.batched_texts / self.batches if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "mean_queue_wait_ms": 1000.0 * self.total_wait / self.batched_requests if self.batched_requests else 0.0,
+            }
@@ -0,0 +1,130 @@
+"""
+Parity check between an embedding backend and the PyTorch reference
+Run from src: python -m embeddings.parity --backend onnx-int8 [--min-cosine 0.99] [--output parity.json]
+
+Encodes the intent corpus with both backends and reports:
+- cosine agreement between the two vectors of every example
+- prerouting agreement: leave-one-out decisions (classify_neighbours) with the
+  candidate vectors, both against a re-embedded index and against the current
+  index built with PyTorch (what happens when only the query encoder changes)
+Exits with status 1 when a threshold is not met.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, Any, List
+
+import numpy as np
+
+from embeddings.backends import BACKENDS, create_backend, cosine_agreement
+from llm import EMBED_MODEL_NAME
+from persistence.db_setup.data.intents_data import INTENT_TRAINING_DATA
+from services.intent_index import IntentIndex, classify_neighbours
+
+
+def _encode(backend, texts: List[str]):
+    started = time.perf_counter()
+    vectors = backend.encode(texts, batch_size=64, normalize_embeddings=True)
+    return vectors, time.perf_counter() - started
+
+
+def leave_one_out(index_vectors, query_vectors, intents: List[str], n_results: int = 3,
+                  ambiguous_threshold: float = 0.5, gap_threshold: float = 0.1) -> List[str]:
+    """Prerouting decision for every example, with the example itself left out of the index"""
+    index = IntentIndex.from_arrays(index_vectors, intents)
+    results = index.query(query_vectors, n_results=n_results + 1)
+
+    decisions = []
+    for row, (ids, metadatas, distances) in enumerate(zip(results["ids"], results["metadatas"], results["distances"])):
+        neighbours = [(meta["intent"], distance) for id_, meta, distance in zip(ids, metadatas, distances) if id_ != str(row)]
+        neighbours = neighbours[:n_results]
+        decisions.append(classify_neighbours(
+            [distance for _, distance in neighbours],
+            [intent for intent, _ in neighbours],
+            ambiguous_threshold,
+            gap_threshold
+        ))
+    return decisions
+
+
+def _agreement(reference: List[str], candidate: List[str]) -> Dict[str, Any]:
+    changed = [i for i, (a, b) in enumerate(zip(reference, candidate)) if a != b]
+    return {
+        "agreement": 1.0 - len(changed) / len(reference) if reference else 1.0,
+        "changed": len(changed),
+    }
+
+
+def run(backend_name: str, threads: int = None, ambiguous_threshold: float = 0.5, gap_threshold: float = 0.1) -> Dict[str, Any]:
+    texts = [item["text"] for item in INTENT_TRAINING_DATA]
+    intents = [item["intent"] for item in INTENT_TRAINING_DATA]
+
+    reference, reference_seconds = _encode(create_backend("torch", EMBED_MODEL_NAME, threads=threads), texts)
+    candidate, candidate_seconds = _encode(
+        create_backend(backend_name, EMBED_MODEL_NAME, threads=threads,
+                       onnx_file=os.getenv("EMBED_ONNX_FILE") or None,
+                       export_dir=os.getenv("EMBED_ONNX_DIR") or None),
+        texts
+    )
+
+    cosines = np.array(cosine_agreement(reference, candidate))
+    decisions = {
+        "reference": leave_one_out(reference, reference, intents, ambiguous_threshold=ambiguous_threshold, gap_threshold=gap_threshold),
+        "candidate": leave_one_out(candidate, candidate, intents, ambiguous_threshold=ambiguous_threshold, gap_threshold=gap_threshold),
+        "mixed": leave_one_out(reference, candidate, intents, ambiguous_threshold=ambiguous_threshold, gap_threshold=gap_threshold),
+    }
+    worst = np.argsort(cosines)[:5]
+
+    return {
+        "model": EMBED_MODEL_NAME,
+        "backend": backend_name,
+        "examples": len(texts),
+        "encode_seconds": {"torch": round(reference_seconds, 3), backend_name: round(candidate_seconds, 3)},
+        "cosine": {
+            "min": float(cosines.min()),
+            "mean": float(cosines.mean()),
+            "p01": float(np.percentile(cosines, 1)),
+        },
+        "worst_examples": [{"text": texts[i], "cosine": float(cosines[i])} for i in worst],
+        "routing": {
+            # Índice y consultas re-embebidos con el backend candidato
+            "reembedded_index": _agreement(decisions["reference"], decisions["candidate"]),
+            # Índice existente (torch) consultado con vectores del candidato
+            "existing_index": _agreement(decisions["reference"], decisions["mixed"]),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check an embedding backend against the PyTorch reference")
+    parser.add_argument("--backend", choices=[b for b in BACKENDS if b != "torch"], default="onnx-int8")
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads for both backends")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Minimum per-example cosine similarity")
+    parser.add_argument("--min-agreement", type=float, default=1.0, help="Minimum fraction of unchanged prerouting decisions")
+    parser.add_argument("--ambiguous-threshold", type=float, default=0.5)
+    parser.add_argument("--gap-threshold", type=float, default=0.1)
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(args.backend, args.threads, args.ambiguous_threshold, args.gap_threshold)
+    failures = []
+    if report["cosine"]["min"] < args.min_cosine:
+        failures.append(f"min cosine {report['cosine']['min']:.4f} < {args.min_cosine}")
+    for name, result in report["routing"].items():
+        if result["agreement"] < args.min_agreement:
+            failures.append(f"{name} routing agreement {result['agreement']:.4f} < {args.min_agreement}")
+    report["passed"] = not failures
+    report["failures"] = failures
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,34 @@
 """
-Export all chunks from docs, sql, and intent collections to txt files.
-Run: py src/export_chunks.py
+Export all chunks from docs, sql, and intent collections.
+Run: py src/export_chunks.py [--format jsonl] [--batch-size 500] [--include-embeddings]
 """
+import argparse
+import os
+
+from persistence.chunk_export import FORMATS, EXTENSIONS
 from persistence.db_start import db_start
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the chunks of the ChromaDB collections")
+    parser.add_argument("--collections", nargs="+", default=["docs", "sql", "intent"], help="Collections to export")
+    parser.add_argument("--format", choices=FORMATS, default="txt",
+                        help="txt (readable), jsonl, npy (embeddings matrix + .meta.jsonl) or arrow (needs pyarrow)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per page read from Chroma")
+    parser.add_argument("--include-embeddings", action="store_true", help="Add the embeddings (jsonl/arrow; npy always has them)")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum rows per collection (default: all)")
+    parser.add_argument("--output-dir", default=".", help="Folder for the exported files")
+    parser.add_argument("--quiet", action="store_true", help="Do not print progress per page")
+    args = parser.parse_args()
+
     service = db_start(setup_mode=False)
-    service.export_chunks("docs")
-    service.export_chunks("sql")
-    service.export_chunks("intent")
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name in args.collections:
+        service.export_chunks(
+            name,
+            limit=args.limit,
+            output_file=os.path.join(args.output_dir, f"{name}_chunks{EXTENSIONS[args.format]}"),
+            format=args.format,
+            batch_size=args.batch_size,
+            include_embeddings=args.include_embeddings,
+            progress=not args.quiet
+        )
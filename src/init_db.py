@@ -2,17 +2,26 @@
 Initialization script for ChromaDB collections and embeddings
 Run this from the project root: py src/init_db.py
 """
-from persistence.db_start import db_start
+import argparse
+
+from persistence.vector_store import get_vector_store
 from persistence.db_setup.docs_to_embed_service import DocsToEmbedService
 from persistence.db_setup.intent_to_embed_service import IntentToEmbedService
 
 if __name__ == "__main__":
-    service = db_start(setup_mode=True)
+    parser = argparse.ArgumentParser(description="Initialize ChromaDB collections and embeddings")
+    parser.add_argument("--full", action="store_true", help="Re-embed every document and intent, even unchanged ones")
+    parser.add_argument("--workers", type=int, default=None, help="Processes used to extract documents")
+    args = parser.parse_args()
+
+    # Abre el cliente y crea las colecciones; los servicios reutilizan la misma instancia
+    store = get_vector_store().warm()
 
-    docs_service = DocsToEmbedService()
-    docs_service.process_docs()
+    docs_service = DocsToEmbedService(workers=args.workers)
+    docs_service.process_docs(incremental=not args.full)
     
     intent_service = IntentToEmbedService()
-    intent_service.process_intents()
+    intent_service.process_intents(reembed=args.full)
 
+    store.close()
     print("✅ ChromaDB initialized")
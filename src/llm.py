@@ -1,21 +1,134 @@
 # models.py
-from llama_index.llms.google_genai import GoogleGenAI
-from sentence_transformers import SentenceTransformer
 import os
+import threading
+import time
 from dotenv import load_dotenv
+from cache.embedding_cache import EmbeddingCache
+from embeddings.batcher import EmbeddingBatcher
 
 load_dotenv()
 
-google_api_key = os.getenv("GOOGLE_API_KEY")
+EMBED_MODEL_NAME = 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2'
+LLM_MODEL_NAME = "gemini-2.0-flash"
 
-if not google_api_key:
-    raise ValueError("❌ GOOGLE_API_KEY no encontrada en el archivo .env")
+# Backend de embeddings: torch (referencia), onnx u onnx-int8 (ver embeddings/backends.py)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
 
-# Instancia global de embeddings
-embed_model = SentenceTransformer('sentence-transformers/paraphrase-multilingual-mpnet-base-v2')
 
-# Instancia global de LLM
-llm = GoogleGenAI(
-    model="gemini-2.0-flash",
-    api_key=google_api_key
+class LazyProvider:
+    """Builds an object on first use (thread-safe) and records how long it took"""
+
+    def __init__(self, name: str, factory):
+        self.name = name
+        self.factory = factory
+        self.load_seconds = None
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    started = time.perf_counter()
+                    instance = self.factory()
+                    self.load_seconds = time.perf_counter() - started
+                    self._instance = instance
+        return self._instance
+
+    def set(self, instance):
+        """Replace the instance (e.g. a stub LLM in offline benchmarks)"""
+        with self._lock:
+            self._instance = instance
+            self.load_seconds = 0.0
+
+
+class LazyProxy:
+    """Forwards attribute access to the provider's instance, loading it on first use"""
+
+    def __init__(self, provider: LazyProvider):
+        object.__setattr__(self, "_provider", provider)
+
+    def __getattr__(self, name):
+        return getattr(self._provider.get(), name)
+
+    def __repr__(self):
+        state = "loaded" if self._provider.loaded else "not loaded"
+        return f"<lazy {self._provider.name} ({state})>"
+
+
+def _env_int(name: str):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def _load_embed_model():
+    # Import diferido: sentence_transformers/torch/onnxruntime tardan varios segundos en importarse
+    from embeddings.backends import create_backend
+    return create_backend(
+        EMBED_BACKEND,
+        EMBED_MODEL_NAME,
+        threads=_env_int("EMBED_THREADS"),
+        inter_op_threads=_env_int("EMBED_INTER_OP_THREADS"),
+        onnx_file=os.getenv("EMBED_ONNX_FILE") or None,
+        export_dir=os.getenv("EMBED_ONNX_DIR") or None
+    )
+
+
+def _load_llm():
+    from llama_index.llms.google_genai import GoogleGenAI
+
+    google_api_key = os.getenv("GOOGLE_API_KEY")
+
+    if not google_api_key:
+        raise ValueError("❌ GOOGLE_API_KEY no encontrada en el archivo .env")
+
+    return GoogleGenAI(
+        model=LLM_MODEL_NAME,
+        api_key=google_api_key
+    )
+
+
+embed_model_provider = LazyProvider("embed_model", _load_embed_model)
+llm_provider = LazyProvider("llm", _load_llm)
+
+# Micro-batching: los encode concurrentes de pocos textos comparten un forward pass
+embed_batcher = EmbeddingBatcher(
+    LazyProxy(embed_model_provider),
+    max_batch_size=int(os.getenv("EMBED_BATCH_MAX_SIZE", "32")),
+    max_wait_ms=float(os.getenv("EMBED_BATCH_WINDOW_MS", "2"))
+)
+
+# Instancia global de embeddings: cache LRU + TTL -> micro-batcher -> backend.
+# ChatbotService, DocsToEmbedService e IntentToEmbedService usan esta instancia.
+# El modelo se carga recién en el primer encode (o en warm_up).
+# La clave del cache incluye el backend: los vectores int8 no son idénticos a los de torch.
+embed_model = EmbeddingCache(
+    embed_batcher,
+    model_name=f"{EMBED_MODEL_NAME}@{EMBED_BACKEND}",
+    max_size=int(os.getenv("EMBED_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("EMBED_CACHE_TTL", "86400")),
+    disk_path=os.getenv("EMBED_CACHE_DIR") or None
 )
+
+# Instancia global de LLM (el cliente se crea en el primer uso o en warm_up)
+llm = LazyProxy(llm_provider)
+
+
+def warm_up(embeddings: bool = True, llm_client: bool = True) -> dict:
+    """Load the models now instead of on the first request; returns seconds per step"""
+    timings = {}
+    if embeddings:
+        embed_model_provider.get()
+        started = time.perf_counter()
+        # Primer forward pass: inicializa kernels y buffers del modelo
+        embed_model.model.encode(["warm up"], normalize_embeddings=True)
+        timings["embed_model_load"] = embed_model_provider.load_seconds
+        timings["embed_first_encode"] = time.perf_counter() - started
+    if llm_client:
+        llm_provider.get()
+        timings["llm_client"] = llm_provider.load_seconds
+    return timings
@@ -0,0 +1,122 @@
+"""
+Process memory
+RSS / PSS / USS of the server processes read from /proc (Linux), to size the worker count
+"""
+import os
+from typing import Dict, Any, List, Optional
+
+# Campos de /proc/<pid>/status y /proc/<pid>/smaps_rollup (en kB) -> claves del reporte
+_STATUS_FIELDS = {"VmRSS": "rss_bytes", "RssAnon": "rss_anon_bytes", "RssFile": "rss_file_bytes",
+                  "RssShmem": "rss_shmem_bytes"}
+_ROLLUP_FIELDS = {"Pss": "pss_bytes", "Private_Clean": "private_clean", "Private_Dirty": "private_dirty",
+                  "Shared_Clean": "shared_clean", "Shared_Dirty": "shared_dirty"}
+
+
+def _read_kb_fields(path: str, fields: Dict[str, str]) -> Dict[str, int]:
+    values = {}
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in fields:
+                    values[fields[name]] = int(rest.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return values
+
+
+def process_memory(pid: Optional[int] = None) -> Dict[str, int]:
+    """
+    Memory of one process in bytes: rss (counts shared pages in full), pss (shared
+    pages split among the processes mapping them) and uss (private pages: what the
+    process would free on exit). Empty where /proc is not available.
+    """
+    pid = pid or os.getpid()
+    memory = _read_kb_fields(f"/proc/{pid}/status", _STATUS_FIELDS)
+    rollup = _read_kb_fields(f"/proc/{pid}/smaps_rollup", _ROLLUP_FIELDS)
+    if "pss_bytes" in rollup:
+        memory["pss_bytes"] = rollup["pss_bytes"]
+        memory["uss_bytes"] = rollup.get("private_clean", 0) + rollup.get("private_dirty", 0)
+        memory["shared_bytes"] = rollup.get("shared_clean", 0) + rollup.get("shared_dirty", 0)
+    return memory
+
+
+def child_pids(parent: int) -> List[int]:
+    """Direct children of a process (scans /proc/<pid>/stat)"""
+    children = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return children
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # El nombre del proceso va entre paréntesis y puede tener espacios: ppid es el 2º campo después
+        fields = stat[stat.rfind(")") + 2:].split()
+        if len(fields) > 1 and int(fields[1]) == parent:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def _mem_total() -> Optional[int]:
+    values = _read_kb_fields("/proc/meminfo", {"MemTotal": "total"})
+    return values.get("total")
+
+
+def server_memory(master_pid: int, worker_pids: Optional[List[int]] = None) -> Dict[str, Any]:
+    """
+    Per-process and total memory of a pre-forked server (master + workers).
+
+    ``total.rss_bytes`` overstates the footprint (shared pages are counted once per
+    worker); ``total.pss_bytes`` is the real one. ``worker_uss_bytes`` (mean private
+    memory of a worker) is the cost of one more worker, used to project the
+    footprint of one worker per core against the machine's memory.
+    """
+    worker_pids = child_pids(master_pid) if worker_pids is None else list(worker_pids)
+    master = process_memory(master_pid)
+    workers = {pid: process_memory(pid) for pid in worker_pids}
+    workers = {pid: memory for pid, memory in workers.items() if memory}
+
+    processes = [master] + list(workers.values())
+    total = {key: sum(memory.get(key, 0) for memory in processes) for key in ("rss_bytes", "pss_bytes", "uss_bytes")}
+    worker_uss = [memory["uss_bytes"] for memory in workers.values() if "uss_bytes" in memory]
+    marginal = sum(worker_uss) / len(worker_uss) if worker_uss else 0.0
+
+    cores = os.cpu_count() or 1
+    projected = total["pss_bytes"] + max(cores - len(workers), 0) * marginal
+    mem_total = _mem_total()
+    return {
+        "master": {"pid": master_pid, **master},
+        "workers": [{"pid": pid, **memory} for pid, memory in sorted(workers.items())],
+        "total": total,
+        "worker_uss_bytes": marginal,
+        "cpu_count": cores,
+        "projected_one_per_core_bytes": projected,
+        "mem_total_bytes": mem_total,
+        "fits_one_per_core": projected <= mem_total if mem_total and marginal else None,
+    }
+
+
+def format_server_memory(report: Dict[str, Any]) -> str:
+    """One-screen summary of server_memory() for the logs"""
+    def mb(value) -> str:
+        return f"{(value or 0) / 1e6:.0f} MB"
+
+    lines = [f"master {report['master']['pid']}: rss {mb(report['master'].get('rss_bytes'))}, "
+             f"pss {mb(report['master'].get('pss_bytes'))}"]
+    for worker in report["workers"]:
+        lines.append(f"worker {worker['pid']}: rss {mb(worker.get('rss_bytes'))}, pss {mb(worker.get('pss_bytes'))}, "
+                     f"private {mb(worker.get('uss_bytes'))}, shared {mb(worker.get('shared_bytes'))}")
+    total = report["total"]
+    lines.append(f"total: rss {mb(total['rss_bytes'])} (counts shared pages per process), "
+                 f"pss {mb(total['pss_bytes'])} (actual footprint)")
+    fits = report["fits_one_per_core"]
+    verdict = "unknown" if fits is None else ("fits" if fits else "does NOT fit")
+    lines.append(f"one worker per core ({report['cpu_count']}): ~{mb(report['projected_one_per_core_bytes'])} "
+                 f"of {mb(report['mem_total_bytes'])} -> {verdict}")
+    return "\n".join(lines)
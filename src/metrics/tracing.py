@@ -0,0 +1,134 @@
+"""
+Request tracing
+Timing spans per pipeline stage, aggregated into the registry histograms
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Tuple
+
+from metrics.registry import REGISTRY
+
+STAGES = ("embed", "intent_query", "context_query", "prompt_build", "llm", "render")
+
+stage_seconds = REGISTRY.histogram(
+    "chatbot_stage_seconds", "Latency of each pipeline stage", labels=("stage",)
+)
+chroma_query_seconds = REGISTRY.histogram(
+    "chatbot_chroma_query_seconds", "Latency of ChromaDB queries", labels=("collection",)
+)
+request_seconds = REGISTRY.histogram(
+    "chatbot_request_seconds", "End-to-end latency of HTTP requests", labels=("endpoint", "status")
+)
+llm_tokens = REGISTRY.counter(
+    "chatbot_llm_tokens_total", "LLM tokens reported by the provider", labels=("kind",)
+)
+intents_total = REGISTRY.counter(
+    "chatbot_intent_total", "Prerouting decisions", labels=("intent",)
+)
+prerouting_path_total = REGISTRY.counter(
+    "chatbot_prerouting_path_total", "Prerouting decisions by path (fast: prototypes, knn: neighbour analysis, steered: follow-up routed with the conversation)", labels=("path",)
+)
+
+
+class RequestTrace:
+    """Spans and attributes recorded while serving one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+        self.attributes: Dict[str, Any] = {}
+
+    def add(self, name: str, seconds: float):
+        self.spans.append((name, seconds))
+
+    def add_count(self, name: str, amount: int):
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+
+    def totals(self) -> Dict[str, float]:
+        """Seconds per span name (a batch or parallel LLM calls add up)"""
+        totals: Dict[str, float] = {}
+        for name, seconds in self.spans:
+            totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def server_timing(self) -> str:
+        """Value for the Server-Timing response header"""
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.totals().items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("chatbot_trace", default=None)
+
+
+def start_trace() -> RequestTrace:
+    """Start a trace for the current request (context)"""
+    trace = RequestTrace()
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def bind_trace(trace: Optional[RequestTrace]):
+    """Make ``trace`` current, e.g. in a streamed body iterated after the view returned"""
+    _current_trace.set(trace)
+
+
+@contextmanager
+def span(stage: str):
+    """Time a pipeline stage into chatbot_stage_seconds and the current trace"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        stage_seconds.observe(seconds, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, seconds)
+
+
+@contextmanager
+def chroma_span(collection: str):
+    """Time a ChromaDB query into chatbot_chroma_query_seconds and the current trace"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        chroma_query_seconds.observe(seconds, collection=collection)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(f"chroma_{collection}", seconds)
+
+
+def _usage_counts(usage) -> Tuple[Optional[int], Optional[int]]:
+    if usage is None:
+        return None, None
+    if not isinstance(usage, dict):
+        usage = {key: getattr(usage, key, None) for key in ("prompt_token_count", "candidates_token_count")}
+    return usage.get("prompt_token_count"), usage.get("candidates_token_count")
+
+
+def record_llm_usage(response):
+    """
+    Count prompt/completion tokens of a llama-index completion response.
+    Gemini reports them in usage_metadata (cumulative on the last streamed chunk).
+    """
+    raw = getattr(response, "raw", None) or {}
+    usage = raw.get("usage_metadata") if isinstance(raw, dict) else getattr(raw, "usage_metadata", None)
+    prompt_tokens, completion_tokens = _usage_counts(usage)
+    if prompt_tokens is None and completion_tokens is None:
+        extra = getattr(response, "additional_kwargs", None) or {}
+        prompt_tokens, completion_tokens = extra.get("prompt_tokens"), extra.get("completion_tokens")
+
+    trace = _current_trace.get()
+    for kind, count in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+        if count:
+            llm_tokens.inc(count, kind=kind)
+            if trace is not None:
+                trace.add_count(f"{kind}_tokens", count)
@@ -0,0 +1,192 @@
+"""
+Chunk export
+Streams a collection page by page (offset/limit) to txt, JSONL, NumPy or Arrow files
+"""
+import json
+import os
+import time
+from typing import Dict, Any, Iterator, Optional
+
+import numpy as np
+
+FORMATS = ("txt", "jsonl", "npy", "arrow")
+EXTENSIONS = {"txt": ".txt", "jsonl": ".jsonl", "npy": ".npy", "arrow": ".arrow"}
+
+
+def iter_pages(collection, batch_size: int = 500, limit: Optional[int] = None,
+               include_embeddings: bool = False) -> Iterator[Dict[str, Any]]:
+    """Yield ``collection.get`` pages of at most batch_size rows; only one page is held at a time"""
+    include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+    offset = 0
+    while limit is None or offset < limit:
+        size = batch_size if limit is None else min(batch_size, limit - offset)
+        page = collection.get(offset=offset, limit=size, include=include)
+        rows = len(page["ids"])
+        if not rows:
+            return
+        yield page
+        offset += rows
+        if rows < size:
+            return
+
+
+class _TxtWriter:
+    """Human-readable dump (the original export layout)"""
+
+    def __init__(self, path: str, collection_name: str, total: int, include_embeddings: bool):
+        self.file = open(path, "w", encoding="utf-8")
+        self.file.write(f"=== CHUNKS EXPORT - Collection: {collection_name} ===\n")
+        self.file.write(f"Total chunks: {total}\n")
+        self.file.write("=" * 60 + "\n\n")
+        self.rows = 0
+
+    def write(self, page):
+        for doc, metadata in zip(page["documents"], page["metadatas"]):
+            metadata = metadata or {}
+            self.rows += 1
+            self.file.write(f"CHUNK #{self.rows}\n")
+            self.file.write(f"Source: {metadata.get('source', 'Unknown')}\n")
+            self.file.write(f"Chunk ID: {metadata.get('chunk', 'Unknown')}\n")
+            self.file.write(f"Length: {len(doc)} characters\n")
+            self.file.write("-" * 40 + "\n")
+            self.file.write(f"{doc}\n")
+            self.file.write("-" * 40 + "\n\n")
+
+    def close(self):
+        self.file.close()
+
+
+class _JsonlWriter:
+    """One JSON object per row: id, document, metadata and optionally embedding"""
+
+    def __init__(self, path: str, collection_name: str, total: int, include_embeddings: bool):
+        self.file = open(path, "w", encoding="utf-8")
+        self.include_embeddings = include_embeddings
+
+    def write(self, page):
+        embeddings = page.get("embeddings") if self.include_embeddings else None
+        for i, (doc_id, doc, metadata) in enumerate(zip(page["ids"], page["documents"], page["metadatas"])):
+            row = {"id": doc_id, "document": doc, "metadata": metadata or {}}
+            if embeddings is not None:
+                row["embedding"] = np.asarray(embeddings[i], dtype=np.float32).tolist()
+            self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class _NpyWriter:
+    """
+    Embeddings as a float32 .npy matrix (memory-mapped, filled page by page) plus
+    a ``.meta.jsonl`` file with the id, document and metadata of each row.
+    """
+
+    def __init__(self, path: str, collection_name: str, total: int, include_embeddings: bool):
+        self.path = path
+        self.total = total
+        self.matrix = None
+        self.rows = 0
+        self.meta = open(os.path.splitext(path)[0] + ".meta.jsonl", "w", encoding="utf-8")
+
+    def write(self, page):
+        vectors = np.asarray(page["embeddings"], dtype=np.float32)
+        if self.matrix is None:
+            self.matrix = np.lib.format.open_memmap(self.path, mode="w+", dtype=np.float32,
+                                                    shape=(self.total, vectors.shape[1]))
+        # La colección puede haber crecido desde el count(): lo que no entra se descarta
+        vectors = vectors[:self.total - self.rows]
+        self.matrix[self.rows:self.rows + len(vectors)] = vectors
+        for row, (doc_id, doc, metadata) in enumerate(zip(page["ids"], page["documents"], page["metadatas"])):
+            if row >= len(vectors):
+                break
+            self.meta.write(json.dumps(
+                {"row": self.rows + row, "id": doc_id, "document": doc, "metadata": metadata or {}},
+                ensure_ascii=False
+            ) + "\n")
+        self.rows += len(vectors)
+
+    def close(self):
+        if self.matrix is not None:
+            self.matrix.flush()
+            del self.matrix
+            if self.rows < self.total:
+                print(f"⚠️  Collection shrank during the export: rows {self.rows}..{self.total - 1} of {self.path} are empty")
+        self.meta.close()
+
+
+class _ArrowWriter:
+    """Arrow IPC file with one record batch per page (requires pyarrow)"""
+
+    def __init__(self, path: str, collection_name: str, total: int, include_embeddings: bool):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("The arrow format needs pyarrow: pip install pyarrow")
+        self.pa = pa
+        self.path = path
+        self.include_embeddings = include_embeddings
+        self.writer = None
+
+    def write(self, page):
+        pa = self.pa
+        columns = {
+            "id": pa.array(page["ids"], type=pa.string()),
+            "document": pa.array(page["documents"], type=pa.string()),
+            "metadata": pa.array([json.dumps(m or {}, ensure_ascii=False) for m in page["metadatas"]], type=pa.string()),
+        }
+        if self.include_embeddings:
+            vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            columns["embedding"] = pa.FixedSizeListArray.from_arrays(pa.array(vectors.reshape(-1)), vectors.shape[1])
+        batch = pa.record_batch(list(columns.values()), names=list(columns))
+        if self.writer is None:
+            self.writer = pa.ipc.new_file(self.path, batch.schema)
+        self.writer.write_batch(batch)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+WRITERS = {"txt": _TxtWriter, "jsonl": _JsonlWriter, "npy": _NpyWriter, "arrow": _ArrowWriter}
+
+
+def export_collection(collection, collection_name: str, output_file: str, format: str = "jsonl",
+                      batch_size: int = 500, include_embeddings: bool = False, limit: Optional[int] = None,
+                      progress: bool = True) -> Dict[str, Any]:
+    """
+    Export a collection page by page; memory stays bounded by batch_size.
+    Returns rows, seconds, rows/sec and bytes written.
+    """
+    if format not in WRITERS:
+        raise ValueError(f"Unknown export format '{format}' (expected one of {', '.join(FORMATS)})")
+    if format == "npy":
+        include_embeddings = True  # El .npy es la matriz de embeddings
+
+    total = collection.count()
+    if limit is not None:
+        total = min(total, limit)
+
+    started = time.perf_counter()
+    writer = WRITERS[format](output_file, collection_name, total, include_embeddings)
+    rows = 0
+    try:
+        for page in iter_pages(collection, batch_size, total, include_embeddings):
+            writer.write(page)
+            rows += len(page["ids"])
+            if progress:
+                elapsed = time.perf_counter() - started
+                print(f"  {collection_name}: {rows}/{total} rows ({rows / elapsed if elapsed else 0.0:.0f} rows/s)")
+    finally:
+        writer.close()
+
+    seconds = time.perf_counter() - started
+    written = [output_file] + ([os.path.splitext(output_file)[0] + ".meta.jsonl"] if format == "npy" else [])
+    return {
+        "collection": collection_name,
+        "format": format,
+        "output": output_file,
+        "rows": min(rows, total),
+        "seconds": seconds,
+        "rows_per_sec": rows / seconds if seconds else 0.0,
+        "bytes": sum(os.path.getsize(path) for path in written if os.path.exists(path)),
+    }
@@ -0,0 +1,63 @@
+"""
+Collection version counters
+Ingestion bumps a per-collection counter so caches in other processes can detect re-ingestion
+"""
+import json
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Directorio del store por defecto (persistence.vector_store.DB_DIR)
+DEFAULT_STORE_DIR = os.path.join(BASE_DIR, "chroma_db")
+VERSIONS_FILE_NAME = "collection_versions.json"
+
+_lock = threading.Lock()
+# Archivo de versiones -> (mtime, versiones) de la última lectura
+_cache: Dict[str, Tuple[int, Dict[str, int]]] = {}
+
+
+def versions_path(store_path: Optional[str] = None) -> str:
+    """Versions file of a store directory (the default store if None)"""
+    return os.path.join(store_path or DEFAULT_STORE_DIR, VERSIONS_FILE_NAME)
+
+
+def _read_versions(path: str) -> Dict[str, int]:
+    """Read a versions file, re-parsing it only when its mtime changes"""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    with _lock:
+        cached_mtime, versions = _cache.get(path, (None, {}))
+        if mtime != cached_mtime:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    versions = json.load(f)
+                _cache[path] = (mtime, versions)
+            except (OSError, ValueError) as e:
+                print(f"Error reading collection versions: {e}")
+        return dict(versions)
+
+
+def get_version(collection_name: str, store_path: Optional[str] = None) -> int:
+    """Current version of a collection of the store (0 if it was never bumped)"""
+    return int(_read_versions(versions_path(store_path)).get(collection_name, 0))
+
+
+def get_versions(store_path: Optional[str] = None) -> Dict[str, int]:
+    """Current version of every collection of the store that was bumped at least once"""
+    return _read_versions(versions_path(store_path))
+
+
+def bump_version(collection_name: str, store_path: Optional[str] = None) -> int:
+    """Increment a collection's version after its contents changed"""
+    path = versions_path(store_path)
+    versions = _read_versions(path)
+    versions[collection_name] = int(versions.get(collection_name, 0)) + 1
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(versions, f)
+    os.replace(tmp_file, path)
+    return versions[collection_name]
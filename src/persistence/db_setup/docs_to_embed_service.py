@@ -1,115 +1,288 @@
 """
 Service for processing PDF documents and converting them to embeddings
 """
+import hashlib
+import json
 import os
-import re
-from typing import List
-import PyPDF2
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any
 from pathlib import Path
-from llm import embed_model
+from llm import embed_model, EMBED_MODEL_NAME
+from persistence.collection_versions import bump_version
+from persistence.lexical_index import BM25Index, lexical_index_path
+from persistence.vector_store import get_vector_store
+from . import text_extraction
+
+
+def docs_manifest_path(store_path: str) -> str:
+    """Ingestion manifest stored next to the ChromaDB files"""
+    return os.path.join(store_path, "docs_manifest.json")
+
+
+def content_hash(text: str) -> str:
+    """SHA-1 of a chunk's text"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(source: str, offset: int, text: str) -> str:
+    """Deterministic id from source file, chunk offset and content hash"""
+    raw = f"{source}\0{offset}\0{content_hash(text)}"
+    return "doc_" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
 
 
 class DocsToEmbedService:
     """Service for processing PDF documents and storing them as embeddings"""
-    
-    def __init__(self):
+
+    def __init__(self, workers: int = None, encode_batch_size: int = 256, add_batch_size: int = 1000,
+                 chunking: str = "tokens", chunk_tokens: int = None, overlap_tokens: int = None):
         """Initialize the document embedding service"""
         self.model = embed_model
 
         BASE_DIR = Path(__file__).parent # src/persistence/db_setup
         self.docs_path = BASE_DIR / "data" / "docs"
-        self.chunk_counter = 0
-    
+        # Hash de cada archivo ya ingerido, para saltear los que no cambiaron
+        self.manifest_path = Path(docs_manifest_path(get_vector_store().path))
+
+        self.workers = workers or os.cpu_count() or 1
+        self.encode_batch_size = encode_batch_size  # Chunks por llamada a encode (entre archivos)
+        self.add_batch_size = add_batch_size  # Chunks por llamada a add en Chroma
+
+        # "tokens": chunks medidos con el tokenizer del modelo; "chars": splitter por caracteres
+        self.chunking = chunking
+        self.chunk_tokens = chunk_tokens or int(os.getenv("DOCS_CHUNK_TOKENS", "0"))
+        self.overlap_tokens = overlap_tokens if overlap_tokens is not None else int(os.getenv("DOCS_CHUNK_OVERLAP", "24"))
+
+    def token_config(self) -> Dict[str, Any]:
+        """Picklable token chunker config, or None for the character splitter"""
+        if self.chunking != "tokens":
+            return None
+        # Por defecto se llena la ventana del modelo (menos los tokens especiales)
+        chunk_tokens = self.chunk_tokens or getattr(self.model, "max_seq_length", 128) - 2
+        return {
+            "tokenizer": EMBED_MODEL_NAME,
+            "chunk_tokens": chunk_tokens,
+            "overlap_tokens": self.overlap_tokens,
+        }
+
     def extract_text_from_pdf(self, file_path: str) -> str:
         """Extract text from a PDF file"""
-        text = ""
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text()
-        except Exception as e:
-            print(f"Error reading PDF {file_path}: {e}")
-        return text
-    
+        return text_extraction.extract_text_from_pdf(file_path)
+
     def extract_text_from_txt(self, file_path: str) -> str:
         """Extract text from a TXT file"""
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                return f.read()
-        except Exception as e:
-            print(f"Error reading TXT {file_path}: {e}")
-            return ""
-    
+        return text_extraction.extract_text_from_txt(file_path)
+
     def chunk_text(self, text: str, max_length: int = 500) -> List[str]:
         """Split text into chunks based on sentences, avoiding cutting ideas"""
-        text = text.replace("\n", " ").strip()
-        sentences = re.split(r'(?<=[.!?]) +', text)
-        chunks = []
-        current_chunk = ""
-        
-        for sentence in sentences:
-            if len(current_chunk) + len(sentence) > max_length:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = sentence
-            else:
-                current_chunk += " " + sentence
-        
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        
-        return chunks
-    
-    def process_docs(self):
-        """Process all PDF and TXT files in the docs folder"""
+        return text_extraction.chunk_text(text, max_length=max_length)
+
+    def load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        """Read the per-file content hashes recorded by previous runs"""
+        if not self.manifest_path.exists():
+            return {}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading manifest {self.manifest_path}: {e}")
+            return {}
+
+    def save_manifest(self, manifest: Dict[str, Dict[str, Any]]):
+        """Write the manifest atomically"""
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def process_docs(self, incremental: bool = True):
+        """
+        Process all PDF and TXT files in the docs folder.
+
+        Extraction runs in a process pool and is streamed page -> sentence -> chunk,
+        so memory is bounded by the batch size, not the document size. Chunks are
+        encoded in large batches that span files and written to Chroma in bulk. In incremental mode, files whose
+        content hash matches the manifest are skipped.
+
+        Chunk ids are content-addressed and written with upsert: chunks that already
+        exist are not re-embedded (unless incremental=False) and stale chunks of a
+        changed file are deleted, so re-running never duplicates rows.
+        """
         if not os.path.exists(self.docs_path):
             print(f"Docs folder not found: {self.docs_path}")
             return
 
-        from persistence.db_start import db_start
-        vector_service = db_start()
+        store = get_vector_store()
+        collection = store.docs_collection
+        # Índice BM25 junto a la colección; se actualiza con los mismos agregados y borrados
+        lexical = self.load_lexical_index(store, collection)
 
         # Buscar archivos PDF y TXT (corregido con tupla)
-        files = [f for f in os.listdir(self.docs_path) if f.endswith(('.pdf', '.txt'))]
+        files = sorted(f for f in os.listdir(self.docs_path) if f.endswith(('.pdf', '.txt')))
         print("Files found:", files)
 
-        for file in files:
-            file_path = os.path.join(self.docs_path, file)
-            print(f"Processing: {file}")
+        previous = self.load_manifest()
+        manifest = dict(previous) if incremental else {}
+        hashes = {f: text_extraction.file_hash(os.path.join(self.docs_path, f)) for f in files}
+
+        # Un archivo se re-procesa si cambió su contenido o la configuración de chunking
+        chunking = self.token_config() or {"max_length": 500}
+        changed = [f for f in files
+                   if manifest.get(f, {}).get("hash") != hashes[f] or manifest[f].get("chunking") != chunking]
+        removed = [f for f in previous if f not in hashes]
+        skipped = len(files) - len(changed)
+        if skipped:
+            print(f"⏭️  Skipping {skipped} unchanged files")
 
-            if file.endswith('.pdf'):
-                text = self.extract_text_from_pdf(file_path)
-            elif file.endswith('.txt'):
-                text = self.extract_text_from_txt(file_path)
-            else:
-                continue
+        # Los chunks de archivos borrados se eliminan
+        for file in removed:
+            collection.delete(where={"source": file})
+            lexical.remove_source(file)
+            manifest.pop(file, None)
 
-            print(f"Extracted {len(text)} characters from {file}")
+        if not changed:
+            if removed:
+                lexical.save()
+                self.save_manifest(manifest)
+                bump_version("docs", store.path)
+            print("✅ Docs collection already up to date")
+            return
 
-            if text:
-                chunks = self.chunk_text(text, max_length=500)
+        buffer = []  # chunks a embeber: (id, file, chunk index, page, chunk)
+        kept = []  # chunks ya almacenados: solo se refresca su metadata
+        pending_files = []  # archivos cuyo stream terminó y esperan el próximo flush
 
-                embeddings = self.model.encode(
-                    chunks,
-                    show_progress_bar=True,
-                    convert_to_numpy=True,
-                    normalize_embeddings=True
+        def flush(final: bool = False):
+            if buffer:
+                self._store_chunks(collection, buffer)
+                lexical.add(
+                    [entry[0] for entry in buffer],
+                    [entry[4] for entry in buffer],
+                    [entry[1] for entry in buffer]
                 )
+            if kept:
+                self._update_metadata(collection, kept)
+            for file, total in pending_files:
+                manifest[file] = {"hash": hashes[file], "chunks": total, "chunking": chunking}
+                print(f"✅ Stored {total} chunks from {file}")
+            # Reescribir el índice léxico entero en cada batch haría la ingesta cuadrática:
+            # se guarda solo cuando se completan archivos y al final. Va antes que el
+            # manifest: un archivo marcado como procesado siempre tiene sus chunks en ambos índices
+            if pending_files or final:
+                lexical.save()
+                self.save_manifest(manifest)
+            buffer.clear()
+            kept.clear()
+            pending_files.clear()
+
+        paths = [os.path.join(self.docs_path, f) for f in changed]
+        workers = max(1, min(self.workers, len(paths)))
+        with tempfile.TemporaryDirectory(prefix="docs_spool_") as spool_dir:
+            executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+            try:
+                for file, chunks in self._iter_sources(paths, executor, spool_dir):
+                    print(f"Processing: {file}")
+                    existing = set(collection.get(where={"source": file}, include=[])["ids"])
+                    seen = set()
+                    total = 0
+                    for i, (chunk, page) in enumerate(chunks):
+                        entry = (chunk_id(file, i, chunk), file, i, page, chunk)
+                        seen.add(entry[0])
+                        total += 1
+                        if incremental and entry[0] in existing:
+                            kept.append(entry)
+                        else:
+                            buffer.append(entry)
+                        # La memoria queda acotada por el tamaño del batch, no del documento
+                        if len(buffer) + len(kept) >= self.encode_batch_size:
+                            flush()
 
-                for i, chunk in enumerate(chunks):
-                    vector_service.docs_collection.add(
-                        ids=[f"chunk_{self.chunk_counter}"],
-                        documents=[chunk],
-                        embeddings=[embeddings[i].tolist()],
-                        metadatas=[{
-                            "source": file,
-                            "chunk": i,
-                            "total_chunks": len(chunks)
-                        }]
-                    )
-                    self.chunk_counter += 1
-
-                print(f"✅ Added {len(chunks)} chunks from {file}")
+                    stale = existing - seen
+                    if stale:
+                        collection.delete(ids=list(stale))
+                        lexical.remove(stale)
+                        print(f"🗑️  Removed {len(stale)} stale chunks from {file}")
+                    pending_files.append((file, total))
+            finally:
+                if executor:
+                    executor.shutdown()
+            flush(final=True)
+
+        # Avisa a los caches (respuestas del chatbot) que docs cambió
+        bump_version("docs", store.path)
 
         print("✅ All embeddings generated and stored in ChromaDB")
+
+    def load_lexical_index(self, store, collection) -> BM25Index:
+        """Open the BM25 index, building it from the collection if it is missing (older stores)"""
+        lexical = BM25Index(lexical_index_path(store.path))
+        lexical.load()
+        if not len(lexical) and collection.count():
+            stored = collection.get(include=["documents", "metadatas"])
+            lexical.add(
+                stored["ids"],
+                stored["documents"],
+                [(meta or {}).get("source") for meta in stored["metadatas"]]
+            )
+            lexical.save()
+            print(f"✅ Built lexical index from {len(lexical)} existing chunks")
+        return lexical
+
+    def _iter_sources(self, paths: List[str], executor, spool_dir: str):
+        """
+        Yield (file name, lazy (chunk, page) iterator) per file, in order.
+        With a process pool, workers spool each file's chunks to disk and the
+        parent streams them back; otherwise files are chunked lazily in-process.
+        """
+        token_config = self.token_config()
+        if executor is None:
+            for path in paths:
+                yield os.path.basename(path), text_extraction.iter_file_chunks(path, token_config=token_config)
+            return
+        spooled = executor.map(
+            text_extraction.spool_chunks,
+            paths,
+            [spool_dir] * len(paths),
+            [500] * len(paths),
+            [token_config] * len(paths)
+        )
+        for file, spool_path in spooled:
+            yield file, text_extraction.iter_spool(spool_path)
+
+    def _update_metadata(self, collection, entries):
+        """Refresh metadata of chunks whose id (position + content) did not change"""
+        for start in range(0, len(entries), self.add_batch_size):
+            batch = entries[start:start + self.add_batch_size]
+            collection.update(
+                ids=[entry[0] for entry in batch],
+                metadatas=[self._chunk_metadata(entry) for entry in batch]
+            )
+
+    def _chunk_metadata(self, entry) -> Dict[str, Any]:
+        _, file, i, page, chunk = entry
+        return {
+            "source": file,
+            "chunk": i,
+            "page": page,
+            "content_hash": content_hash(chunk)
+        }
+
+    def _store_chunks(self, collection, buffer):
+        """Encode a cross-file batch of chunks and upsert it into Chroma in bulk"""
+        embeddings = self.model.encode(
+            [entry[4] for entry in buffer],
+            batch_size=64,
+            show_progress_bar=True,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+
+        for start in range(0, len(buffer), self.add_batch_size):
+            batch = buffer[start:start + self.add_batch_size]
+            collection.upsert(
+                ids=[entry[0] for entry in batch],
+                documents=[entry[4] for entry in batch],
+                embeddings=embeddings[start:start + len(batch)].tolist(),
+                metadatas=[self._chunk_metadata(entry) for entry in batch]
+            )
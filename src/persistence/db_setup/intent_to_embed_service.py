@@ -1,56 +1,89 @@
 """
 Service for processing intent data and converting them to embeddings
 """
+import hashlib
 import os
 import sys
 from llm import embed_model
+from persistence.collection_versions import bump_version, get_version
+from persistence.vector_store import get_vector_store
+from services.intent_prototypes import build_prototypes, save_prototypes, prototypes_path
 
 # Add the project root to the path to import from chroma_utils
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from .data.intents_data import INTENT_TRAINING_DATA
 
 
+def intent_id(text: str, intent: str) -> str:
+    """Deterministic id from the example text and its intent"""
+    raw = f"{intent}\0{text}"
+    return "intent_" + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24]
+
+
 class IntentToEmbedService:
     """Service for processing intent data and storing them as embeddings"""
     
-    def __init__(self):
+    def __init__(self, prototypes_per_intent: int = None):
         """Initialize the intent embedding service"""
         self.model = embed_model
-        self.chunk_counter = 0
+        # Centroides por intención para el camino rápido del prerouting
+        self.prototypes_per_intent = prototypes_per_intent or int(os.getenv("INTENT_PROTOTYPES", "3"))
     
-    def process_intents(self):
-        """Process all intent training data (only sql and docs, ambiguo is determined by distance)"""
-        from persistence.db_start import db_start
-        vector_service = db_start()
+    def process_intents(self, reembed: bool = False):
+        """
+        Process all intent training data (only sql and docs, ambiguo is determined by distance).
+        Ids are derived from text + intent: existing examples are not re-embedded
+        (unless reembed=True) and examples no longer in the data are deleted.
+        """
+        collection = get_vector_store().intent_collection
 
         print("Processing intent training data...")
-        
-        # Extract texts for batch embedding generation
-        texts = [item["text"] for item in INTENT_TRAINING_DATA]
-        
-        # Generate embeddings in batch for efficiency
-        embeddings = self.model.encode(
-            texts, 
-            show_progress_bar=True, 
-            convert_to_numpy=True, 
-            normalize_embeddings=True
-        )
-        
-        # Store each intent with its embedding
-        for i, item in enumerate(INTENT_TRAINING_DATA):
-            vector_service.intent_collection.add(
-                ids=[f"intent_{self.chunk_counter}"],
-                documents=[item["text"]],
-                embeddings=[embeddings[i].tolist()],
-                metadatas=[{
-                    "intent": item["intent"],
-                    "example_id": i,
-                    "total_examples": len(INTENT_TRAINING_DATA)
-                }]
+
+        ids = [intent_id(item["text"], item["intent"]) for item in INTENT_TRAINING_DATA]
+        metadatas = [{
+            "intent": item["intent"],
+            "example_id": i,
+            "total_examples": len(INTENT_TRAINING_DATA)
+        } for i, item in enumerate(INTENT_TRAINING_DATA)]
+
+        existing = set(collection.get(include=[])["ids"])
+        stale = existing - set(ids)
+        if stale:
+            collection.delete(ids=list(stale))
+            print(f"🗑️  Removed {len(stale)} stale intent examples")
+
+        new = [i for i, example_id in enumerate(ids) if reembed or example_id not in existing]
+        kept = [i for i, example_id in enumerate(ids) if not reembed and example_id in existing]
+
+        if kept:
+            # Mismo texto e intención: solo se actualiza la metadata
+            collection.update(
+                ids=[ids[i] for i in kept],
+                metadatas=[metadatas[i] for i in kept]
             )
-            self.chunk_counter += 1
-        
-        print(f"✅ Added {len(INTENT_TRAINING_DATA)} intent examples to ChromaDB")
+
+        if new:
+            # Generate embeddings in batch for efficiency
+            embeddings = self.model.encode(
+                [INTENT_TRAINING_DATA[i]["text"] for i in new],
+                show_progress_bar=True,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
+            collection.upsert(
+                ids=[ids[i] for i in new],
+                documents=[INTENT_TRAINING_DATA[i]["text"] for i in new],
+                embeddings=embeddings.tolist(),
+                metadatas=[metadatas[i] for i in new]
+            )
+
+        if new or stale:
+            # Avisa a los caches (respuestas del chatbot) que intent cambió
+            bump_version("intent", get_vector_store().path)
+
+        self.build_prototypes(collection)
+
+        print(f"✅ Stored {len(INTENT_TRAINING_DATA)} intent examples in ChromaDB ({len(new)} embedded, {len(kept)} unchanged)")
         
         # Show summary by intent type
         intent_counts = {}
@@ -64,3 +97,15 @@ class IntentToEmbedService:
         
         print("✅ Intent embeddings generated and stored in ChromaDB")
         print("ℹ️  Note: 'ambiguo' intent will be determined automatically based on distance thresholds")
+
+    def build_prototypes(self, collection):
+        """Compute per-intent k-means prototypes from the stored embeddings and save them next to the store"""
+        results = collection.get(include=["embeddings", "metadatas"])
+        if results.get("embeddings") is None or not len(results["embeddings"]):
+            return
+        labels = [meta.get("intent") for meta in results["metadatas"]]
+        matrix, prototype_labels = build_prototypes(results["embeddings"], labels, self.prototypes_per_intent)
+        store_path = get_vector_store().path
+        path = prototypes_path(store_path)
+        save_prototypes(matrix, prototype_labels, get_version("intent", store_path), path)
+        print(f"✅ Stored {len(prototype_labels)} intent prototypes in {path}")
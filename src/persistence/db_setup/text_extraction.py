@@ -0,0 +1,180 @@
+"""
+Text extraction and chunking helpers for document ingestion
+Kept free of model imports so process-pool workers start fast
+
+Extraction is a lazy pipeline: pages -> sentences -> chunks. Each stage is a
+generator, so memory is bounded by a page and a chunk, not by the document.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+import PyPDF2
+
+from .token_chunker import TokenChunker
+
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?]) +')
+
+
+def iter_pdf_pages(file_path: str) -> Iterator[Tuple[int, str]]:
+    """Yield (page number, text) for each page of a PDF, starting at 1"""
+    try:
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            for number, page in enumerate(pdf_reader.pages, 1):
+                yield number, page.extract_text() or ""
+    except Exception as e:
+        print(f"Error reading PDF {file_path}: {e}")
+
+
+def iter_txt_pages(file_path: str) -> Iterator[Tuple[int, str]]:
+    """Yield (page number, line) for a TXT file; form feeds start a new page"""
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            number = 1
+            for line in f:
+                *previous, line = line.split("\f")
+                for part in previous:
+                    yield number, part
+                    number += 1
+                yield number, line
+    except Exception as e:
+        print(f"Error reading TXT {file_path}: {e}")
+
+
+def iter_pages(file_path: str) -> Iterator[Tuple[int, str]]:
+    """Yield (page number, text fragment) for a PDF or TXT file"""
+    if file_path.endswith('.pdf'):
+        return iter_pdf_pages(file_path)
+    if file_path.endswith('.txt'):
+        return iter_txt_pages(file_path)
+    return iter(())
+
+
+def iter_sentences(fragments: Iterable[Tuple[int, str]], max_sentence_length: int = 2000) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page number, sentence) from a stream of (page number, text fragment).
+    A sentence never spans two pages; text without punctuation is cut at
+    max_sentence_length so the carry-over buffer stays bounded.
+    """
+    carry, carry_page = "", None
+    for page, fragment in fragments:
+        if page != carry_page and carry.strip():
+            yield carry_page, carry.strip()
+            carry = ""
+        carry_page = page
+        parts = SENTENCE_SPLIT.split((carry + " " + fragment.replace("\n", " ")).strip())
+        # La última parte puede continuar en el siguiente fragmento
+        carry = parts.pop()
+        for sentence in parts:
+            yield page, sentence
+        if len(carry) > max_sentence_length:
+            yield page, carry
+            carry = ""
+    if carry.strip():
+        yield carry_page, carry.strip()
+
+
+def iter_chunks(sentences: Iterable[Tuple[int, str]], max_length: int = 500) -> Iterator[Tuple[str, int]]:
+    """Group sentences into chunks of up to max_length characters; yields (chunk, first page)"""
+    current_chunk, current_page = "", None
+
+    for page, sentence in sentences:
+        if len(current_chunk) + len(sentence) > max_length:
+            if current_chunk.strip():
+                yield current_chunk.strip(), current_page
+            current_chunk, current_page = sentence, page
+        else:
+            current_chunk += " " + sentence
+            if current_page is None:
+                current_page = page
+
+    if current_chunk.strip():
+        yield current_chunk.strip(), current_page
+
+
+def iter_file_chunks(file_path: str, max_length: int = 500,
+                     token_config: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[str, int]]:
+    """
+    Lazily extract and chunk one file; yields (chunk, page).
+    With a token_config (see TokenChunker.from_config) chunks are sized in model
+    tokens; otherwise the character-based splitter with max_length is used.
+    """
+    sentences = iter_sentences(iter_pages(file_path))
+    if token_config:
+        return TokenChunker.from_config(token_config).chunks(sentences)
+    return iter_chunks(sentences, max_length=max_length)
+
+
+def extract_text_from_pdf(file_path: str) -> str:
+    """Extract text from a PDF file"""
+    return "".join(text for _, text in iter_pdf_pages(file_path))
+
+
+def extract_text_from_txt(file_path: str) -> str:
+    """Extract text from a TXT file"""
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return f.read()
+    except Exception as e:
+        print(f"Error reading TXT {file_path}: {e}")
+        return ""
+
+
+def chunk_text(text: str, max_length: int = 500) -> List[str]:
+    """Split text into chunks based on sentences, avoiding cutting ideas"""
+    text = text.replace("\n", " ").strip()
+    sentences = re.split(r'(?<=[.!?]) +', text)
+    chunks = []
+    current_chunk = ""
+
+    for sentence in sentences:
+        if len(current_chunk) + len(sentence) > max_length:
+            if current_chunk:
+                chunks.append(current_chunk.strip())
+            current_chunk = sentence
+        else:
+            current_chunk += " " + sentence
+
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+
+    return chunks
+
+
+def file_hash(file_path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's contents, read in blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def spool_chunks(file_path: str, spool_dir: str, max_length: int = 500,
+                 token_config: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
+    """
+    Extract and chunk one file into a JSONL spool file; runs inside the ingestion
+    process pool. Returns (file name, spool path) so the parent can stream the chunks
+    back without holding the whole document in memory.
+    """
+    file = os.path.basename(file_path)
+    fd, spool_path = tempfile.mkstemp(suffix=".jsonl", dir=spool_dir)
+    with os.fdopen(fd, "w", encoding="utf-8") as spool:
+        for chunk, page in iter_file_chunks(file_path, max_length=max_length, token_config=token_config):
+            spool.write(json.dumps([chunk, page], ensure_ascii=False) + "\n")
+    return file, spool_path
+
+
+def iter_spool(spool_path: str) -> Iterator[Tuple[str, int]]:
+    """Read back the (chunk, page) pairs written by spool_chunks and delete the spool"""
+    try:
+        with open(spool_path, "r", encoding="utf-8") as spool:
+            for line in spool:
+                chunk, page = json.loads(line)
+                yield chunk, page
+    finally:
+        os.remove(spool_path)
@@ -0,0 +1,128 @@
+"""
+Token-aware chunker driven by the embedding model's tokenizer
+"""
+from typing import Dict, Any, Iterable, Iterator, List, Tuple
+
+_tokenizers: Dict[str, Any] = {}
+
+
+def get_tokenizer(name: str):
+    """Load (once per process) the fast tokenizer of an embedding model"""
+    if name not in _tokenizers:
+        from transformers import AutoTokenizer
+        _tokenizers[name] = AutoTokenizer.from_pretrained(name, use_fast=True)
+    return _tokenizers[name]
+
+
+class TokenChunker:
+    """
+    Packs sentences into chunks of at most ``chunk_tokens`` tokens.
+
+    - Chunks end on sentence boundaries and never span two pages.
+    - Consecutive chunks of a page share up to ``overlap_tokens`` tokens of whole
+      trailing sentences.
+    - A single sentence longer than ``chunk_tokens`` is cut into overlapping token
+      windows using the tokenizer's offset mapping.
+    - Sentences are tokenized in batches of ``batch_size`` with the fast tokenizer.
+    """
+
+    def __init__(self, tokenizer, chunk_tokens: int = 126, overlap_tokens: int = 24, batch_size: int = 256):
+        """Initialize the chunker"""
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        self.tokenizer = tokenizer
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.batch_size = batch_size
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "TokenChunker":
+        """Build a chunker from a picklable config (used by process-pool workers)"""
+        return cls(
+            get_tokenizer(config["tokenizer"]),
+            chunk_tokens=config["chunk_tokens"],
+            overlap_tokens=config["overlap_tokens"],
+            batch_size=config.get("batch_size", 256)
+        )
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Token count of each text, without special tokens"""
+        encoded = self.tokenizer(texts, add_special_tokens=False)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def _tokenized(self, sentences: Iterable[Tuple[int, str]]):
+        """Yield (page, sentence, token count, offsets) tokenizing in batches"""
+        batch = []
+
+        def run():
+            encoded = self.tokenizer(
+                [sentence for _, sentence in batch],
+                add_special_tokens=False,
+                return_offsets_mapping=True
+            )
+            for (page, sentence), ids, offsets in zip(batch, encoded["input_ids"], encoded["offset_mapping"]):
+                yield page, sentence, len(ids), offsets
+
+        for page, sentence in sentences:
+            batch.append((page, sentence))
+            if len(batch) >= self.batch_size:
+                yield from run()
+                batch = []
+        if batch:
+            yield from run()
+
+    def _windows(self, sentence: str, offsets) -> Iterator[str]:
+        """Cut an over-long sentence into overlapping token windows"""
+        stride = self.chunk_tokens - self.overlap_tokens
+        total = len(offsets)
+        for start in range(0, total, stride):
+            end = min(start + self.chunk_tokens, total)
+            yield sentence[offsets[start][0]:offsets[end - 1][1]].strip()
+            if end == total:
+                break
+
+    def chunks(self, sentences: Iterable[Tuple[int, str]]) -> Iterator[Tuple[str, int]]:
+        """Group (page, sentence) pairs into (chunk, page) pairs"""
+        current: List[Tuple[str, int]] = []  # (sentence, tokens)
+        current_tokens = 0
+        current_page = None
+
+        def emit():
+            return " ".join(sentence for sentence, _ in current), current_page
+
+        for page, sentence, n_tokens, offsets in self._tokenized(sentences):
+            if not n_tokens:
+                continue
+
+            # Cambio de página: se cierra el chunk y no hay solapamiento entre páginas
+            if page != current_page:
+                if current:
+                    yield emit()
+                current, current_tokens, current_page = [], 0, page
+
+            if n_tokens > self.chunk_tokens:
+                if current:
+                    yield emit()
+                    current, current_tokens = [], 0
+                for window in self._windows(sentence, offsets):
+                    yield window, page
+                continue
+
+            if current and current_tokens + n_tokens > self.chunk_tokens:
+                yield emit()
+                # Solapamiento: se arrastran las últimas oraciones completas que entran
+                tail, tail_tokens = [], 0
+                for previous, previous_tokens in reversed(current):
+                    if tail_tokens + previous_tokens > self.overlap_tokens:
+                        break
+                    tail.insert(0, (previous, previous_tokens))
+                    tail_tokens += previous_tokens
+                while tail and tail_tokens + n_tokens > self.chunk_tokens:
+                    tail_tokens -= tail.pop(0)[1]
+                current, current_tokens = tail, tail_tokens
+
+            current.append((sentence, n_tokens))
+            current_tokens += n_tokens
+
+        if current:
+            yield emit()
@@ -1,52 +1,53 @@
 """
 Start script to initialize ChromaDB with embeddings
 """
-import os
-from pathlib import Path
-import chromadb
-from .db_setup.docs_to_embed_service import DocsToEmbedService
-from .db_setup.intent_to_embed_service import IntentToEmbedService
-from llm import embed_model
+from .chunk_export import EXTENSIONS, export_collection
+from .vector_store import get_vector_store
 
 class db_start:
     """Service for managing vector embeddings with ChromaDB"""
 
     def __init__(self, setup_mode: bool = True):
-        self.model = embed_model
+        # Todas las instancias comparten el mismo cliente y colecciones del proceso
+        self.store = get_vector_store()
+        self.setup_mode = setup_mode
 
-        BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-        DB_DIR = os.path.join(BASE_DIR, "chroma_db")
+    @property
+    def client(self):
+        return self.store.client
 
-        self.client = chromadb.PersistentClient(path=DB_DIR)
+    @property
+    def docs_collection(self):
+        return self.store.collection("docs", create=self.setup_mode)
 
-        if setup_mode:
-            self.docs_collection = self.client.get_or_create_collection("docs")
-            self.sql_collection = self.client.get_or_create_collection("sql")
-            self.intent_collection = self.client.get_or_create_collection("intent")
-        else:
-            self.docs_collection = self.client.get_collection("docs")
-            self.sql_collection = self.client.get_collection("sql")
-            self.intent_collection = self.client.get_collection("intent")
+    @property
+    def sql_collection(self):
+        return self.store.collection("sql", create=self.setup_mode)
 
-    def export_chunks(self, collection_name: str, limit: int = 100, output_file: str = None):
-        """Export chunks from a collection to a txt file"""
+    @property
+    def intent_collection(self):
+        return self.store.collection("intent", create=self.setup_mode)
+
+    def export_chunks(self, collection_name: str, limit: int = None, output_file: str = None,
+                      format: str = "txt", batch_size: int = 500, include_embeddings: bool = False,
+                      progress: bool = True):
+        """
+        Export the chunks of a collection, paging with offset/limit (memory bounded by batch_size).
+        Formats: txt (readable dump), jsonl, npy (embeddings + .meta.jsonl) and arrow (needs pyarrow).
+        """
         collection = getattr(self, f"{collection_name}_collection", None)
         if collection is None:
             print(f"Collection '{collection_name}' not found.")
-            return
-        results = collection.get(limit=limit, include=["documents", "metadatas"])
+            return None
         if not output_file:
-            output_file = f"{collection_name}_chunks.txt"
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(f"=== CHUNKS EXPORT - Collection: {collection_name} ===\n")
-            f.write(f"Total chunks retrieved: {len(results['documents'])}\n")
-            f.write("="*60 + "\n\n")
-            for i, (doc, metadata) in enumerate(zip(results['documents'], results['metadatas'])):
-                f.write(f"CHUNK #{i+1}\n")
-                f.write(f"Source: {metadata.get('source', 'Unknown')}\n")
-                f.write(f"Chunk ID: {metadata.get('chunk', 'Unknown')}\n")
-                f.write(f"Length: {len(doc)} characters\n")
-                f.write("-" * 40 + "\n")
-                f.write(f"{doc}\n")
-                f.write("-" * 40 + "\n\n")
-        print(f"✅ {len(results['documents'])} chunks exported to {output_file}")
\ No newline at end of file
+            output_file = f"{collection_name}_chunks{EXTENSIONS.get(format, '.' + format)}"
+        report = export_collection(
+            collection, collection_name, output_file,
+            format=format, batch_size=batch_size, include_embeddings=include_embeddings,
+            limit=limit, progress=progress
+        )
+        print(
+            f"✅ {report['rows']} chunks exported to {output_file} "
+            f"({report['rows_per_sec']:.0f} rows/s, {report['bytes'] / 1e6:.1f} MB)"
+        )
+        return report
@@ -0,0 +1,186 @@
+"""
+Lexical index
+BM25 inverted index over the docs chunks, persisted next to the Chroma collection
+"""
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from persistence.collection_versions import get_version
+
+LEXICAL_INDEX_FILENAME = "docs_bm25.json"
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, accent-free word tokens; identifiers like ABC123 stay whole"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(text)
+
+
+def lexical_index_path(store_path: str) -> str:
+    return os.path.join(store_path, LEXICAL_INDEX_FILENAME)
+
+
+class BM25Index:
+    """
+    Okapi BM25 over chunk ids.
+
+    Only term frequencies, lengths and sources are kept (texts stay in Chroma).
+    ``add``/``remove``/``remove_source`` update it incrementally during ingestion
+    and ``save`` writes it atomically; serving processes ``refresh_if_changed``
+    when the docs collection version moves.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75,
+                 collection_name: str = "docs"):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.collection_name = collection_name
+        # El índice vive junto al store: sus contadores de versión son los de ese directorio
+        self.store_path = os.path.dirname(path) if path else None
+        self.version = None
+        self.loaded = False
+
+        self._docs: Dict[str, Dict] = {}  # id -> {"source": ..., "tf": {term: count}, "length": n}
+        self._postings: Dict[str, Dict[str, int]] = {}  # term -> {id: count}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+
+    def add(self, ids: Iterable[str], texts: Iterable[str], sources: Iterable[str] = None):
+        """Index chunks; an existing id is replaced"""
+        ids, texts = list(ids), list(texts)
+        sources = list(sources) if sources is not None else [None] * len(ids)
+        with self._lock:
+            for doc_id, text, source in zip(ids, texts, sources):
+                self._remove(doc_id)
+                tf = Counter(tokenize(text))
+                length = sum(tf.values())
+                self._docs[doc_id] = {"source": source, "tf": dict(tf), "length": length}
+                self._total_length += length
+                for term, count in tf.items():
+                    self._postings.setdefault(term, {})[doc_id] = count
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    def remove_source(self, source: str):
+        """Drop every chunk of a source file"""
+        with self._lock:
+            for doc_id in [i for i, doc in self._docs.items() if doc["source"] == source]:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        """Remove one chunk; caller holds the lock"""
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self._total_length -= doc["length"]
+        for term in doc["tf"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            self._postings.clear()
+            self._total_length = 0
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self):
+        """Write the index atomically"""
+        if not self.path:
+            return
+        with self._lock:
+            payload = {
+                "k1": self.k1,
+                "b": self.b,
+                "docs": {doc_id: [doc["source"], doc["tf"]] for doc_id, doc in self._docs.items()},
+            }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Read the index from disk (empty if the file does not exist)"""
+        version = get_version(self.collection_name, self.store_path)
+        docs = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    docs = json.load(f).get("docs", {})
+            except (OSError, ValueError) as e:
+                print(f"Error loading lexical index from {self.path}: {e}")
+        with self._lock:
+            self.clear()
+            for doc_id, (source, tf) in docs.items():
+                length = sum(tf.values())
+                self._docs[doc_id] = {"source": source, "tf": tf, "length": length}
+                self._total_length += length
+                for term, count in tf.items():
+                    self._postings.setdefault(term, {})[doc_id] = count
+            self.version = version
+            self.loaded = True
+
+    def refresh_if_changed(self):
+        """Reload when ingestion bumped the docs collection's version"""
+        if not self.loaded or get_version(self.collection_name, self.store_path) != self.version:
+            self.load()
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def search(self, query: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """Top chunk ids by BM25 score, best first"""
+        terms = set(tokenize(query))
+        with self._lock:
+            total = len(self._docs)
+            if not total or not terms:
+                return []
+            average_length = self._total_length / total
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1.0 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, count in postings.items():
+                    length = self._docs[doc_id]["length"]
+                    norm = count + self.k1 * (1.0 - self.b + self.b * length / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * count * (self.k1 + 1.0) / norm
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:n_results]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60, n_results: int = 5) -> List[Tuple[str, float]]:
+    """Merge ranked id lists: score(id) = sum of 1 / (k + rank) over the lists it appears in"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])[:n_results]
@@ -0,0 +1,221 @@
+"""
+Snapshot / restore
+Versioned bundles of the vector collections (embeddings, ids, documents, metadata) that
+restore into a fresh store without running the embedding model
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterable, Optional
+
+import numpy as np
+
+from llm import EMBED_MODEL_NAME, EMBED_BACKEND
+from persistence.chunk_export import export_collection
+from persistence.collection_versions import get_version, bump_version
+from persistence.vector_store import COLLECTION_NAMES
+
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_FILE = "snapshot.json"
+# Archivos derivados que viven junto a la base y se copian tal cual
+SIDE_FILES = ("intent_prototypes.npz", "docs_bm25.json", "docs_manifest.json")
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json(path: str, data: Dict[str, Any]):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def create_snapshot(store, output_dir: str, collections: Iterable[str] = COLLECTION_NAMES,
+                    batch_size: int = 1000, progress: bool = True) -> Dict[str, Any]:
+    """
+    Write a bundle: per collection a float32 ``<name>.npy`` matrix (memory-mappable)
+    and ``<name>.meta.jsonl`` rows (id, document, metadata), the derived files next
+    to the store, and ``snapshot.json`` with the model, versions and sha256 checksums.
+    The manifest is written last, so a bundle without it is incomplete.
+    """
+    if os.path.exists(os.path.join(output_dir, MANIFEST_FILE)):
+        raise FileExistsError(f"{output_dir} already contains a snapshot")
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "model": EMBED_MODEL_NAME,
+        "backend": EMBED_BACKEND,
+        "collections": {},
+        "side_files": {},
+    }
+    for name in collections:
+        try:
+            collection = store.collection(name, create=False)
+        except Exception as e:
+            print(f"Collection '{name}' not found, skipped: {e}")
+            continue
+        version = get_version(name, store.path)
+        matrix_file = os.path.join(output_dir, f"{name}.npy")
+        report = export_collection(collection, name, matrix_file, format="npy", batch_size=batch_size, progress=progress)
+
+        files = [f"{name}.meta.jsonl"] + ([f"{name}.npy"] if os.path.exists(matrix_file) else [])
+        dim = int(np.load(matrix_file, mmap_mode="r").shape[1]) if os.path.exists(matrix_file) else 0
+        manifest["collections"][name] = {
+            "rows": report["rows"],
+            "dim": dim,
+            "version": version,
+            "metadata": getattr(collection, "metadata", None),
+            "sha256": {file: file_sha256(os.path.join(output_dir, file)) for file in files},
+        }
+        print(f"✅ {name}: {report['rows']} rows ({report['bytes'] / 1e6:.1f} MB)")
+
+    for file in SIDE_FILES:
+        source = os.path.join(store.path, file)
+        if os.path.exists(source):
+            shutil.copyfile(source, os.path.join(output_dir, file))
+            manifest["side_files"][file] = file_sha256(source)
+
+    manifest["seconds"] = time.perf_counter() - started
+    _write_json(os.path.join(output_dir, MANIFEST_FILE), manifest)
+    return manifest
+
+
+def read_manifest(bundle_dir: str) -> Dict[str, Any]:
+    path = os.path.join(bundle_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No {MANIFEST_FILE} in {bundle_dir} (missing or incomplete snapshot)")
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format_version')} (expected {SNAPSHOT_FORMAT_VERSION})")
+    return manifest
+
+
+def verify_snapshot(bundle_dir: str, manifest: Optional[Dict[str, Any]] = None):
+    """Raise ValueError if a file of the bundle does not match its checksum"""
+    manifest = manifest or read_manifest(bundle_dir)
+    expected = dict(manifest["side_files"])
+    for info in manifest["collections"].values():
+        expected.update(info["sha256"])
+    for file, checksum in expected.items():
+        if file_sha256(os.path.join(bundle_dir, file)) != checksum:
+            raise ValueError(f"Checksum mismatch for {file}")
+
+
+def _iter_rows(meta_path: str, batch_size: int):
+    """Batches of (ids, documents, metadatas) read line by line"""
+    ids, documents, metadatas = [], [], []
+    with open(meta_path, "r", encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            ids.append(row["id"])
+            documents.append(row["document"])
+            # Chroma no acepta metadata vacía
+            metadatas.append(row["metadata"] or None)
+            if len(ids) == batch_size:
+                yield ids, documents, metadatas
+                ids, documents, metadatas = [], [], []
+    if ids:
+        yield ids, documents, metadatas
+
+
+def restore_snapshot(bundle_dir: str, store, batch_size: int = 1000, force: bool = False, verify: bool = True,
+                     allow_model_mismatch: bool = False, progress: bool = True) -> Dict[str, Any]:
+    """
+    Bulk-load a bundle into ``store``: embeddings are read from the memory-mapped
+    matrices and added as-is (no model inference). Collections that already have
+    rows are refused unless ``force`` (then they are replaced). Afterwards the
+    collection versions are bumped so running caches of the node invalidate.
+    """
+    manifest = read_manifest(bundle_dir)
+    if manifest["model"] != EMBED_MODEL_NAME and not allow_model_mismatch:
+        raise ValueError(
+            f"Snapshot embeddings come from {manifest['model']}, this node uses {EMBED_MODEL_NAME}; "
+            "queries would not match (use allow_model_mismatch to restore anyway)"
+        )
+    if manifest.get("backend") != EMBED_BACKEND:
+        print(f"⚠️  Snapshot was built with the {manifest.get('backend')} backend, this node uses {EMBED_BACKEND}")
+
+    started = time.perf_counter()
+    if verify:
+        verify_snapshot(bundle_dir, manifest)
+        print(f"✅ Checksums verified ({time.perf_counter() - started:.1f}s)")
+
+    client = store.client
+    max_batch = getattr(client, "get_max_batch_size", None)
+    if max_batch is not None:
+        batch_size = min(batch_size, max_batch())
+
+    # Se revisa antes de tocar nada: un restore rechazado no deja colecciones a medias
+    if not force:
+        for name in manifest["collections"]:
+            existing = store.collection(name).count()
+            if existing:
+                raise FileExistsError(f"Collection '{name}' already has {existing} rows (use force to replace it)")
+
+    report = {"collections": {}, "bytes": 0}
+    for name, info in manifest["collections"].items():
+        collection_started = time.perf_counter()
+        collection = store.recreate_collection(name, metadata=info.get("metadata") or None)
+
+        matrix_path = os.path.join(bundle_dir, f"{name}.npy")
+        matrix = np.load(matrix_path, mmap_mode="r") if os.path.exists(matrix_path) else None
+        restored = 0
+        for ids, documents, metadatas in _iter_rows(os.path.join(bundle_dir, f"{name}.meta.jsonl"), batch_size):
+            collection.add(
+                ids=ids,
+                embeddings=np.ascontiguousarray(matrix[restored:restored + len(ids)]),
+                documents=documents,
+                metadatas=metadatas
+            )
+            restored += len(ids)
+            if progress:
+                elapsed = time.perf_counter() - collection_started
+                print(f"  {name}: {restored}/{info['rows']} rows ({restored / elapsed if elapsed else 0.0:.0f} rows/s)")
+
+        seconds = time.perf_counter() - collection_started
+        size = sum(os.path.getsize(os.path.join(bundle_dir, file)) for file in info["sha256"])
+        report["bytes"] += size
+        report["collections"][name] = {
+            "rows": restored,
+            "seconds": seconds,
+            "rows_per_sec": restored / seconds if seconds else 0.0,
+            "mb_per_sec": size / 1e6 / seconds if seconds else 0.0,
+        }
+        print(f"✅ {name}: {restored} rows restored in {seconds:.1f}s")
+
+    for file in manifest["side_files"]:
+        os.makedirs(store.path, exist_ok=True)
+        shutil.copyfile(os.path.join(bundle_dir, file), os.path.join(store.path, file))
+
+    # Cachés y procesos que ya corren en el nodo ven colecciones nuevas
+    versions = {name: bump_version(name, store.path) for name in manifest["collections"]}
+    _restamp_prototypes(store.path, versions.get("intent"))
+
+    report["seconds"] = time.perf_counter() - started
+    report["mb_per_sec"] = report["bytes"] / 1e6 / report["seconds"] if report["seconds"] else 0.0
+    report["versions"] = versions
+    return report
+
+
+def _restamp_prototypes(store_path: str, version: Optional[int]):
+    """The copied prototypes belong to the restored intents: record the new collection version"""
+    from services.intent_prototypes import load_prototypes, save_prototypes, prototypes_path
+
+    path = prototypes_path(store_path)
+    stored = load_prototypes(path) if version is not None else None
+    if stored is not None:
+        matrix, labels, _ = stored
+        save_prototypes(matrix, labels, version, path)
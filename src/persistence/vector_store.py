@@ -0,0 +1,121 @@
+"""
+Process-wide vector store
+A single ChromaDB client per process, shared by every service, with lazily opened collections
+"""
+import os
+import threading
+from typing import Dict, Optional
+
+import chromadb
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_DIR = os.path.join(BASE_DIR, "chroma_db")
+
+COLLECTION_NAMES = ("docs", "sql", "intent")
+
+
+class VectorStore:
+    """
+    Thread-safe holder of the ChromaDB client and its collections.
+
+    Nothing is opened until first use; ``warm()`` opens the client and every
+    collection up front (e.g. at startup) and ``close()`` releases them.
+    """
+
+    def __init__(self, path: str = DB_DIR):
+        """Initialize the store for a ChromaDB directory (nothing is opened yet)"""
+        self.path = path
+        self._client = None
+        self._collections: Dict[str, object] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def client(self):
+        """The ChromaDB client, opened on first access"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = chromadb.PersistentClient(path=self.path)
+        return self._client
+
+    def collection(self, name: str, create: bool = True):
+        """
+        A collection, opened on first access.
+        With create=False the collection must already exist.
+        """
+        collection = self._collections.get(name)
+        if collection is None:
+            with self._lock:
+                collection = self._collections.get(name)
+                if collection is None:
+                    if create:
+                        collection = self.client.get_or_create_collection(name)
+                    else:
+                        collection = self.client.get_collection(name)
+                    self._collections[name] = collection
+        return collection
+
+    def recreate_collection(self, name: str, metadata: Optional[Dict] = None):
+        """Drop a collection if it exists and create it empty (e.g. before a bulk restore)"""
+        with self._lock:
+            self._collections.pop(name, None)
+            try:
+                self.client.delete_collection(name)
+            except Exception:
+                pass  # No existía
+            collection = self.client.create_collection(name, metadata=metadata)
+            self._collections[name] = collection
+        return collection
+
+    @property
+    def docs_collection(self):
+        return self.collection("docs")
+
+    @property
+    def sql_collection(self):
+        return self.collection("sql")
+
+    @property
+    def intent_collection(self):
+        return self.collection("intent")
+
+    def warm(self, create: bool = True):
+        """Open the client and every collection now instead of on the first request"""
+        for name in COLLECTION_NAMES:
+            self.collection(name, create=create)
+        return self
+
+    def close(self):
+        """Release the collections and the client"""
+        with self._lock:
+            self._collections.clear()
+            if self._client is not None:
+                try:
+                    # Libera el sistema (sqlite, índices) asociado al cliente
+                    self._client.clear_system_cache()
+                except Exception as e:
+                    print(f"Error closing ChromaDB client: {e}")
+                self._client = None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_vector_store() -> VectorStore:
+    """The process-wide vector store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = VectorStore()
+    return _store
+
+
+def set_vector_store(store: VectorStore):
+    """Replace the process-wide vector store (e.g. to point at another directory)"""
+    global _store
+    with _store_lock:
+        if _store is not None and _store is not store:
+            _store.close()
+        _store = store
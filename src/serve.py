@@ -0,0 +1,117 @@
+"""
+Production server: pre-forking gunicorn (Linux/macOS).
+The parent loads the embedding model weights and the read-only indexes once (the
+intent matrix in shared memory) and then forks the workers, which share those pages
+instead of loading a copy each. Run from src:
+    python serve.py --workers 8 --bind 0.0.0.0:5000
+"""
+import argparse
+import gc
+import os
+import sys
+import threading
+import time
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    raise SystemExit("serve.py needs gunicorn (not available on Windows): pip install -e .[serve]")
+
+from metrics.process_memory import server_memory, format_server_memory, process_memory
+
+# Backends cuyos pesos se pueden cargar antes del fork. onnxruntime crea sus thread
+# pools al abrir la sesión y no sobreviven al fork: con ONNX cada worker carga su modelo.
+FORK_SAFE_BACKENDS = ("torch",)
+
+# Tomado por el hilo de reporte mientras lee /proc e imprime; el master no forkea en ese momento
+_report_lock = threading.Lock()
+
+
+class ChatbotServer(BaseApplication):
+    """Gunicorn application serving the already imported (and preloaded) Flask app"""
+
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def report_memory(server, interval: float):
+    """Master thread: per-worker and total RSS/PSS every interval seconds"""
+    while True:
+        time.sleep(interval)
+        with _report_lock:
+            report = server_memory(os.getpid(), list(server.WORKERS))
+            print(f"🧮 Memory\n{format_server_memory(report)}", flush=True)
+
+
+def build_options(args, chatbot_app) -> dict:
+    def when_ready(server):
+        master = process_memory()
+        print(f"🌐 Serving on {args.bind} with {args.workers} workers x {args.threads} threads "
+              f"(master after preload: rss {master.get('rss_bytes', 0) / 1e6:.0f} MB)", flush=True)
+        if args.memory_report > 0:
+            threading.Thread(target=report_memory, args=(server, args.memory_report),
+                             name="memory-report", daemon=True).start()
+
+    def post_fork(server, worker):
+        # Cada worker usa su parte de los núcleos para el encoder
+        torch = sys.modules.get("torch")
+        if torch is not None:
+            torch.set_num_threads(int(os.environ["EMBED_THREADS"]))
+
+    def post_worker_init(worker):
+        # Chroma, primer encode y cliente del LLM: por worker, en segundo plano (readiness en /healthz)
+        chatbot_app.start_warm_up()
+
+    return {
+        "bind": args.bind,
+        "workers": args.workers,
+        "worker_class": "gthread",
+        "threads": args.threads,
+        "timeout": args.timeout,
+        # La app ya está importada y precargada en este proceso
+        "preload_app": True,
+        "when_ready": when_ready,
+        "post_fork": post_fork,
+        "post_worker_init": post_worker_init,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-forking production server for the chatbot")
+    parser.add_argument("--bind", default=os.getenv("SERVE_BIND", "0.0.0.0:5000"), help="host:port to listen on")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVE_WORKERS", "0")) or os.cpu_count() or 1,
+                        help="Worker processes (default: one per core)")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("SERVE_THREADS", "4")),
+                        help="Request threads per worker")
+    parser.add_argument("--timeout", type=int, default=120, help="Seconds before a silent worker is restarted")
+    parser.add_argument("--memory-report", type=float, default=float(os.getenv("SERVE_MEMORY_REPORT", "60")),
+                        help="Seconds between memory reports of the master (0 disables them)")
+    args = parser.parse_args()
+
+    # Sin configurar, los workers se reparten los núcleos en vez de usar todos cada uno
+    os.environ.setdefault("EMBED_THREADS", str(max(1, (os.cpu_count() or 1) // args.workers)))
+
+    import app as chatbot_app
+    from llm import EMBED_BACKEND
+
+    chatbot_app.preload(embeddings=EMBED_BACKEND in FORK_SAFE_BACKENDS)
+    breakdown = " | ".join(f"{name}: {seconds:.2f}s" for name, seconds in chatbot_app.startup_timings.items())
+    print(f"⏱️  Preload breakdown: {breakdown}")
+
+    # Lo precargado no se vuelve a recorrer en cada colección del GC, que escribiría
+    # en sus páginas y las copiaría en cada worker
+    gc.collect()
+    gc.freeze()
+    os.register_at_fork(before=_report_lock.acquire, after_in_parent=_report_lock.release,
+                        after_in_child=_report_lock.release)
+
+    ChatbotServer(chatbot_app.app, build_options(args, chatbot_app)).run()
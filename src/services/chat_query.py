@@ -0,0 +1,37 @@
+"""
+Chat query
+Objeto por request que transporta el mensaje y su embedding a través del pipeline
+"""
+from typing import Dict, Any, List, Optional
+
+
+class ChatQuery:
+    """Per-request query: message, its embedding and the intent-query results"""
+
+    def __init__(self, message: str, embedding):
+        """Create a query from a message and its (normalized) embedding"""
+        self.message = message
+        # Embedding con forma (1, dim), listo para query_embeddings de Chroma
+        self.embedding = embedding
+        # Resultados crudos de la consulta a intent_collection hecha en prerouting
+        self.intent_results: Optional[Dict[str, Any]] = None
+        self.intent: Optional[str] = None
+        # True si la respuesta salió del cache de respuestas
+        self.response_cached = False
+        # Embeddings de los fragmentos recuperados (id -> vector), para descartar casi duplicados
+        self.doc_embeddings: Dict[str, Any] = {}
+        # Resultado del empaquetado del contexto en el presupuesto de tokens
+        self.prompt_tokens: Optional[int] = None
+        self.dropped_candidates: List[Dict[str, Any]] = []
+        # Conversación de la sesión (ConversationMemory.snapshot) y si orientó el ruteo
+        self.session_id: Optional[str] = None
+        self.conversation: Optional[Dict[str, Any]] = None
+        self.steered = False
+
+    def intent_neighbours(self, intent: str):
+        """Documents of the prerouting neighbours labelled with the given intent, closest first"""
+        if not self.intent_results or not self.intent_results.get('documents'):
+            return []
+        documents = self.intent_results['documents'][0] or []
+        metadatas = self.intent_results['metadatas'][0] or []
+        return [doc for doc, meta in zip(documents, metadatas) if meta.get('intent') == intent]
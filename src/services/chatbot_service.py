@@ -2,22 +2,164 @@
 Chatbot service
 Contiene la lógica principal del chatbot
 """
-from typing import Dict, Any
-from persistence.db_start import db_start
-from llm import llm
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+import numpy as np
+from persistence.vector_store import get_vector_store
+from persistence.collection_versions import get_version
+from persistence.lexical_index import BM25Index, lexical_index_path, reciprocal_rank_fusion
+from cache.response_cache import ResponseCache, context_fingerprint
+from cache.retrieval_cache import RetrievalCache
+from llm import llm, LLM_MODEL_NAME
 from llm import embed_model
+from llm import warm_up as warm_up_models, embed_model_provider
+from metrics.tracing import span, chroma_span, intents_total, prerouting_path_total, record_llm_usage
+from services.chat_query import ChatQuery
+from services.context_packer import ContextPacker, TokenCounter
+from services.conversation_memory import ConversationMemory
+from services.intent_index import IntentIndex, classify_neighbours
+from services.intent_prototypes import IntentPrototypes, prototypes_path
+from services.routing_config import load_routing_config
 
 
 class ChatbotService:
 
+    LLM_ERROR_MESSAGE = "Lo siento, ocurrió un error al procesar tu solicitud. Intenta nuevamente."
+
     def __init__(self):
 
         """Initialize the chatbot service"""
-        self.db_start = db_start()
+        # Cliente y colecciones compartidos por todo el proceso (se abren en warm())
+        self.vector_store = get_vector_store()
         self.model = embed_model
-        self.ambiguous_threshold = 0.5  # Threshold for determining ambiguous intent
-    
-    def prerouting(self, message: str) -> str:
+        # Umbrales del prerouting: los elegidos por benchmarks.routing si existe la config
+        routing = load_routing_config(getattr(self.model, "model_name", None))
+        self.ambiguous_threshold = routing["ambiguous_threshold"]  # Threshold for determining ambiguous intent
+        self.intent_gap_threshold = routing["gap_threshold"]  # Diferencia mínima entre las 2 intenciones más cercanas
+
+        # Copia en memoria de intent_collection; se carga en warm() o en el primer
+        # prerouting y se recarga si la colección cambia
+        self.intent_index = IntentIndex(lambda: self.vector_store.intent_collection, store_path=self.vector_store.path)
+        # Camino rápido: centroides por intención; los casos dudosos van al kNN
+        self.intent_prototypes = IntentPrototypes(
+            margin=routing["fast_path_margin"],
+            max_distance=self.ambiguous_threshold,
+            per_intent=int(os.getenv("INTENT_PROTOTYPES", "3")),
+            path=prototypes_path(self.vector_store.path)
+        )
+        self.sql_examples = 2  # Ejemplos SQL que se agregan al prompt
+
+        # Cache de recuperación por colección y versión (independiente del cache de respuestas)
+        self.retrieval_cache = RetrievalCache(
+            max_size=int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024")),
+            resolution=float(os.getenv("RETRIEVAL_CACHE_RESOLUTION", "0.001"))
+        )
+
+        # Recuperación híbrida de documentación: vecinos densos + BM25, fusionados por RRF
+        self.lexical_index = BM25Index(lexical_index_path(self.vector_store.path))
+        self.docs_hybrid = os.getenv("DOCS_HYBRID", "1") == "1"
+        self.docs_top_k = int(os.getenv("DOCS_TOP_K", "5"))  # Fragmentos que llegan al prompt
+        self.docs_candidates = int(os.getenv("DOCS_CANDIDATES", "20"))  # Candidatos de cada ranking
+        self.docs_rrf_k = int(os.getenv("DOCS_RRF_K", "60"))
+
+        # Presupuesto de tokens del prompt: sin duplicados, chunks contiguos unidos, mejores primero
+        self.context_packer = ContextPacker(
+            TokenCounter(LLM_MODEL_NAME, use_tokenizer=os.getenv("PROMPT_TOKENIZER", "gemini") == "gemini"),
+            budget=int(os.getenv("PROMPT_TOKEN_BUDGET", "1500")),
+            dedup_threshold=float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.95"))
+        )
+
+        # Memoria de conversación por sesión, acotada en sesiones y en tokens
+        self.conversation_memory = ConversationMemory(
+            self.context_packer.counter.count,
+            max_sessions=int(os.getenv("MEMORY_MAX_SESSIONS", "1000")),
+            session_ttl=float(os.getenv("MEMORY_SESSION_TTL", "1800")),
+            token_budget=int(os.getenv("MEMORY_TOKEN_BUDGET", "400")),
+            summary_tokens=int(os.getenv("MEMORY_SUMMARY_TOKENS", "150")),
+            routing_turns=int(os.getenv("MEMORY_ROUTING_TURNS", "3")),
+            summarizer=self._summarize_conversation if os.getenv("MEMORY_SUMMARIZER", "extractive") == "llm" else None
+        )
+        # Peso de los turnos anteriores al re-rutear un seguimiento ambiguo
+        self.steering_weight = float(os.getenv("MEMORY_STEERING_WEIGHT", "0.5"))
+
+        # Cache semántico de respuestas del LLM
+        self.response_cache = ResponseCache(
+            max_size=int(os.getenv("RESPONSE_CACHE_SIZE", "512")),
+            ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+            similarity_threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+        )
+
+        # Máximo de llamadas concurrentes al LLM en un batch
+        self.llm_concurrency = int(os.getenv("CHAT_BATCH_LLM_CONCURRENCY", "4"))
+
+    def warm(self) -> Dict[str, float]:
+        """Abre Chroma, carga el índice de intenciones y los modelos; devuelve segundos por paso."""
+        timings = {}
+        started = time.perf_counter()
+        self.vector_store.warm()
+        timings["chroma_open"] = time.perf_counter() - started
+
+        # Si preload() ya los cargó (servidor pre-fork) solo se recargan si cambió la versión
+        started = time.perf_counter()
+        self.intent_index.refresh_if_changed()
+        self.intent_prototypes.sync(self.intent_index)
+        timings["intent_index_load"] = time.perf_counter() - started
+
+        if self.docs_hybrid:
+            started = time.perf_counter()
+            self.lexical_index.refresh_if_changed()
+            timings["lexical_index_load"] = time.perf_counter() - started
+
+        # El tokenizer local de Gemini descarga su vocabulario la primera vez que se usa
+        started = time.perf_counter()
+        self.context_packer.counter.warm()
+        timings["tokenizer_load"] = time.perf_counter() - started
+
+        timings.update(warm_up_models())
+        return timings
+
+    def preload(self, embeddings: bool = True) -> Dict[str, float]:
+        """
+        Carga lo que comparten los workers de un servidor pre-fork (ver serve.py): índice
+        de intenciones (matriz en memoria compartida), prototipos, BM25 y los pesos del
+        modelo de embeddings. Sin inferencia ni clientes abiertos: Chroma se cierra y
+        cada worker lo reabre en warm(). Devuelve segundos por paso.
+        """
+        timings = {}
+        started = time.perf_counter()
+        self.intent_index.load()
+        self.intent_prototypes.sync(self.intent_index)
+        shared = self.intent_index.share()
+        timings["intent_index_load"] = time.perf_counter() - started
+
+        if self.docs_hybrid:
+            started = time.perf_counter()
+            self.lexical_index.load()
+            timings["lexical_index_load"] = time.perf_counter() - started
+
+        if embeddings:
+            embed_model_provider.get()
+            timings["embed_model_load"] = embed_model_provider.load_seconds
+
+        # El cliente de Chroma (sqlite, hilos propios) no sobrevive a un fork
+        self.vector_store.close()
+        print(f"Preloaded for workers: intent matrix in shared memory ({shared / 1e6:.1f} MB)")
+        return timings
+
+    def build_query(self, message: str) -> ChatQuery:
+        """Genera el embedding del mensaje una sola vez para todo el pipeline."""
+        return self.build_queries([message])[0]
+
+    def build_queries(self, messages: List[str]) -> List[ChatQuery]:
+        """Genera los embeddings de varios mensajes con una sola llamada al modelo."""
+        with span("embed"):
+            embeddings = self.model.encode(messages, normalize_embeddings=True)
+        return [ChatQuery(message, embeddings[i:i + 1]) for i, message in enumerate(messages)]
+
+    def prerouting(self, query: ChatQuery) -> str:
         """
         Determina la intención del mensaje usando embeddings y análisis de distancias.
 
@@ -26,96 +168,231 @@ class ChatbotService:
         - "docs" -> si el mensaje está relacionado a documentación
         - "ambiguo" -> si no se puede determinar con confianza
         """
+        return self.prerouting_batch([query])[0]
+
+    def prerouting_batch(self, queries: List[ChatQuery]) -> List[str]:
+        """
+        Prerouting de varios mensajes.
+        Primero se comparan con los prototipos de cada intención; solo los casos
+        dudosos pasan por una consulta (única) al índice de intenciones.
+        """
+        try:
+            with span("intent_query"):
+                embeddings = np.vstack([query.embedding for query in queries])
+                self.intent_index.refresh_if_changed()
+                self.intent_prototypes.sync(self.intent_index)
+                intents = self.intent_prototypes.route(embeddings)
+                pending = [i for i, intent in enumerate(intents) if intent is None]
+
+                # Buscar las intenciones más parecidas en el índice en memoria
+                if pending:
+                    results = self.intent_index.query(
+                        embeddings[pending],
+                        n_results=3  # Se buscan las 3 más cercanas para analizar ambigüedad
+                    )
+        except Exception as e:
+            print(f"Error en prerouting: {str(e)}")
+            return ["ambiguo"] * len(queries)
+
+        for row, i in enumerate(pending):
+            # Se guardan para reutilizarlos como ejemplos SQL en _get_sql_context
+            queries[i].intent_results = {key: [values[row]] for key, values in results.items()}
+            intents[i] = self._classify_intent(queries[i].intent_results)
+        prerouting_path_total.inc(len(pending), path="knn")
+
+        # Seguimientos ("¿y para el otro depósito?"): si el mensaje solo es ambiguo se
+        # vuelve a rutear orientado por los embeddings de los últimos turnos
+        followups = [
+            i for i, intent in enumerate(intents)
+            if intent == "ambiguo" and queries[i].conversation and queries[i].conversation["steering"] is not None
+        ]
+        if followups:
+            try:
+                with span("intent_query"):
+                    self._steer_intents(queries, intents, followups)
+            except Exception as e:
+                print(f"Error en prerouting de seguimiento: {str(e)}")
+        prerouting_path_total.inc(len(queries) - len(pending), path="fast")
+        for intent in intents:
+            intents_total.inc(intent=intent)
+        return intents
+
+    def _steer_intents(self, queries: List[ChatQuery], intents: List[str], rows: List[int]):
+        """Re-rutea mensajes ambiguos con su embedding sumado al de la conversación."""
+        vectors = np.vstack([
+            queries[i].embedding.reshape(-1) + self.steering_weight * queries[i].conversation["steering"]
+            for i in rows
+        ]).astype(np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        results = self.intent_index.query(vectors, n_results=3)
+
+        steered = 0
+        for row, i in enumerate(rows):
+            row_results = {key: [values[row]] for key, values in results.items()}
+            intent = self._classify_intent(row_results)
+            if intent != "ambiguo":
+                intents[i] = intent
+                queries[i].intent_results = row_results
+                queries[i].steered = True
+                steered += 1
+        prerouting_path_total.inc(steered, path="steered")
+
+    def load_conversation(self, queries: List[ChatQuery], session_ids: List[str]):
+        """Adjunta a cada mensaje el estado de su sesión (resumen, últimos turnos, orientación)."""
+        for query, session_id in zip(queries, session_ids):
+            query.session_id = session_id
+            query.conversation = self.conversation_memory.snapshot(session_id)
+
+    def remember(self, query: ChatQuery, response: str):
+        """Agrega el turno a la memoria de la sesión (las respuestas de error no se guardan)."""
+        if query.session_id and response and response != self.LLM_ERROR_MESSAGE:
+            self.conversation_memory.record(query.session_id, query.message, response, query.embedding)
+
+    def _summarize_conversation(self, summary: str, turns) -> str:
+        """Resumen con el LLM (MEMORY_SUMMARIZER=llm): corre en segundo plano cuando se excede el presupuesto."""
+        lines = [f"Resumen previo: {summary}"] if summary else []
+        for message, response in turns:
+            lines.append(f"Usuario: {message}\nAsistente: {response}")
+        prompt = (
+            "Resume la siguiente conversación en español, en menos de "
+            f"{self.conversation_memory.summary_tokens // 2} palabras. Conserva nombres, números, "
+            "tablas y decisiones que el usuario pueda retomar.\n\n" + "\n".join(lines)
+        )
+        with span("llm"):
+            completion = llm.complete(prompt)
+        record_llm_usage(completion)
+        return str(completion).strip()
+
+    def _classify_intent(self, results: Dict[str, Any]) -> str:
+        """Decide la intención a partir de los vecinos más cercanos de un mensaje."""
         try:
-            # Generar embedding para el mensaje del usuario
-            message_embedding = self.model.encode([message], normalize_embeddings=True)
-            
-            # Buscar las intenciones más parecidas en la colección vectorial
-            results = self.db_start.intent_collection.query(
-                query_embeddings=message_embedding.tolist(),
-                n_results=3,  # Se buscan las 3 más cercanas para analizar ambigüedad
-                include=["metadatas", "distances"]
-            )
-            
             # Si no hay resultados válidos, se marca como ambiguo
             if not results['distances'] or not results['distances'][0]:
                 return "ambiguo"
-            
-            distances = results['distances'][0]  # Lista de distancias obtenidas
-            metadatas = results['metadatas'][0]  # Metadatos (ej. intenciones asociadas)
-            
-            # Primer resultado (el más cercano)
-            best_distance = distances[0]
-            best_intent = metadatas[0]['intent']
-            
-            # Si la distancia es muy grande, la coincidencia no es confiable
-            if best_distance > self.ambiguous_threshold:
-                return "ambiguo"
-            
-            # Si hay más de un resultado, compara el segundo
-            if len(distances) > 1:
-                second_distance = distances[1]
-                second_intent = metadatas[1]['intent']
-                
-                # Si la diferencia entre ambos es poca pero las intenciones son diferentes → ambiguo
-                distance_diff = second_distance - best_distance
-                if distance_diff < 0.1 and best_intent != second_intent:
-                    return "ambiguo"
-            
-             # Si pasó todas las validaciones, se devuelve la más confiable
-            return best_intent
-            
+
+            return classify_neighbours(
+                results['distances'][0],  # Lista de distancias obtenidas
+                [meta['intent'] for meta in results['metadatas'][0]],  # Intenciones asociadas
+                self.ambiguous_threshold,
+                self.intent_gap_threshold
+            )
+
         except Exception as e:
             print(f"Error en prerouting: {str(e)}")
             return "ambiguo"
     
-    def generate_context(self, message: str, intent: str) -> Dict[str, Any]:
+    def generate_context(self, query: ChatQuery, intent: str) -> Dict[str, Any]:
         """Genera el contexto relevante según la intención detectada."""
-        try:
+        return self.generate_context_batch([query], [intent])[0]
+
+    def generate_context_batch(self, queries: List[ChatQuery], intents: List[str]) -> List[Dict[str, Any]]:
+        """
+        Genera el contexto de varios mensajes.
+        Se hace una sola consulta por colección para todos los mensajes que la necesitan.
+        """
+        with span("context_query"):
+            return self._generate_context_batch(queries, intents)
+
+    def _generate_context_batch(self, queries: List[ChatQuery], intents: List[str]) -> List[Dict[str, Any]]:
+        contexts = [None] * len(queries)
+        sql_positions, docs_positions = [], []
+
+        for i, (query, intent) in enumerate(zip(queries, intents)):
             if intent == "ambiguo":
                 # Caso en el que el sistema no entiende bien la intención
-                return {
+                contexts[i] = {
                     "context_type": "general",
                     "instructions": "La intención del usuario no está clara. Vuelve a preguntar de forma amable para clarificar su intención.",
                     "relevant_docs": [],
                     "examples": []
                 }
-            
-            # Se genera embedding del mensaje para buscar contexto más específico
-            message_embedding = self.model.encode([message], normalize_embeddings=True)
-            
             # Según la intención se elige la estrategia de contexto
-            if intent == "sql":
-                return self._get_sql_context(message_embedding)
+            elif intent == "sql":
+                sql_positions.append(i)
             elif intent == "docs":
-                return self._get_docs_context(message_embedding)
+                docs_positions.append(i)
             else:
-                return self._get_general_context(message_embedding, intent)
-                
+                contexts[i] = self._safe_context(lambda: self._get_general_context(query, intent))
+
+        if sql_positions:
+            sql_contexts = self._safe_batch(lambda: self._get_sql_context_batch([queries[i] for i in sql_positions]), len(sql_positions))
+            for i, context in zip(sql_positions, sql_contexts):
+                contexts[i] = context
+
+        if docs_positions:
+            docs_contexts = self._safe_batch(lambda: self._get_docs_context_batch([queries[i] for i in docs_positions]), len(docs_positions))
+            for i, context in zip(docs_positions, docs_contexts):
+                contexts[i] = context
+
+        return contexts
+
+    def _error_context(self, error: Exception) -> Dict[str, Any]:
+        """Contexto de respaldo cuando falla la generación de contexto."""
+        print(f"Error generando contexto: {str(error)}")
+        return {
+            "context_type": "error",
+            "instructions": "Hubo un error generando el contexto. Da una respuesta general y útil.",
+            "relevant_docs": [],
+            "examples": [],
+            "error": str(error)
+        }
+
+    def _safe_context(self, build) -> Dict[str, Any]:
+        try:
+            return build()
         except Exception as e:
-            print(f"Error generando contexto: {str(e)}")
-            return {
-                "context_type": "error",
-                "instructions": "Hubo un error generando el contexto. Da una respuesta general y útil.",
-                "relevant_docs": [],
-                "examples": [],
-                "error": str(e)
-            }
-    
-    def _get_sql_context(self, message_embedding) -> Dict[str, Any]:
+            return self._error_context(e)
+
+    def _safe_batch(self, build, size: int) -> List[Dict[str, Any]]:
+        try:
+            return build()
+        except Exception as e:
+            return [self._error_context(e) for _ in range(size)]
+
+    def _get_sql_context(self, query: ChatQuery) -> Dict[str, Any]:
         """Contexto específico para consultas SQL."""
-        # Busca ejemplos en la base de datos de intenciones que tengan 'intent=sql'.
-        sql_results = self.db_start.intent_collection.query(
-            query_embeddings=message_embedding.tolist(),
-            n_results=3, # Top 3 para tener variedad
-            where={"intent": "sql"},
-            include=["documents", "metadatas"]
-        )
-        
-        examples = []
-        if sql_results['documents'] and sql_results['documents'][0]:
-            examples = sql_results['documents'][0][:2]  # Toma los 2 ejemplos mas cercanos
-        
+        return self._get_sql_context_batch([query])[0]
+
+    def _get_sql_context_batch(self, queries: List[ChatQuery]) -> List[Dict[str, Any]]:
+        """Contexto SQL para varios mensajes."""
+        # Si los vecinos de prerouting ya tienen suficientes 'intent=sql', son
+        # exactamente los más cercanos de ese intent y se evita otra consulta.
+        examples = [query.intent_neighbours("sql")[:self.sql_examples] for query in queries]
+        missing = [i for i, found in enumerate(examples) if len(found) < self.sql_examples]
+
+        n_results = 3  # Top 3 para tener variedad
+        if missing:
+            version = get_version("intent", self.vector_store.path)
+            self.retrieval_cache.sync_version("intent", version)
+            # La clave lleva lo pedido, no lo devuelto: una colección con menos ejemplos
+            # que sql_examples también sale del cache
+            keys = {
+                i: self.retrieval_cache.make_key("intent", version, (n_results, self.sql_examples),
+                                                 where={"intent": "sql"}, embedding=queries[i].embedding)
+                for i in missing
+            }
+            hits = set()
+            for i in missing:
+                cached = self.retrieval_cache.get(keys[i])
+                if cached is not None:
+                    examples[i] = list(cached)
+                    hits.add(i)
+            missing = [i for i in missing if i not in hits]
+
+        if missing:
+            # Busca ejemplos en la base de datos de intenciones que tengan 'intent=sql'.
+            sql_results = self.intent_index.query(
+                np.vstack([queries[i].embedding for i in missing]),
+                n_results=n_results,
+                intent="sql"
+            )
+            for row, i in enumerate(missing):
+                examples[i] = sql_results['documents'][row][:self.sql_examples]  # Toma los 2 ejemplos mas cercanos
+                self.retrieval_cache.put(keys[i], tuple(examples[i]))
+
+        return [self._sql_context(found) for found in examples]
+
+    def _sql_context(self, examples: List[str]) -> Dict[str, Any]:
         return {
             "context_type": "sql",
             "instructions": "Ayuda al usuario con consultas SQL. Proporciona código SQL claro y ejecutable con explicaciones sencillas. Considera la estructura de la base de datos y buenas prácticas.",
@@ -124,23 +401,134 @@ class ChatbotService:
             "specific_guidance": "Enfócate en la sintaxis SQL, optimización de consultas y ejemplos prácticos."
         }
     
-    def _get_docs_context(self, message_embedding) -> Dict[str, Any]:
+    def _get_docs_context(self, query: ChatQuery) -> Dict[str, Any]:
         """Contexto específico para documentación."""
+        return self._get_docs_context_batch([query])[0]
+
+    def _get_docs_context_batch(self, queries: List[ChatQuery]) -> List[Dict[str, Any]]:
+        """
+        Contexto de documentación para varios mensajes con una sola consulta.
+        Los mensajes repetidos salen del cache de recuperación sin consultar Chroma.
+        """
+        hybrid = self.docs_hybrid
+        if hybrid:
+            self.lexical_index.refresh_if_changed()
+            hybrid = len(self.lexical_index) > 0
+
+        version = get_version("docs", self.vector_store.path)
+        self.retrieval_cache.sync_version("docs", version)
+        # Con BM25 el resultado depende del texto, no solo del embedding
+        n_results = (self.docs_top_k, self.docs_candidates, self.docs_rrf_k) if hybrid else self.docs_top_k
+        keys = [
+            self.retrieval_cache.make_key(
+                "docs", version, n_results,
+                embedding=query.embedding,
+                text=query.message if hybrid else None
+            )
+            for query in queries
+        ]
+        rows = [self.retrieval_cache.get(key) for key in keys]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if missing:
+            retrieved = self._retrieve_docs([queries[i] for i in missing], hybrid)
+            for i, row in zip(missing, retrieved):
+                rows[i] = row
+                self.retrieval_cache.put(keys[i], row)
+
+        contexts = []
+        for query, row in zip(queries, rows):
+            query.doc_embeddings = row["embeddings"]
+            contexts.append(self._docs_context(row["ids"], row["documents"], row["metadatas"], row["scores"]))
+        return contexts
+
+    def _retrieve_docs(self, queries: List[ChatQuery], hybrid: bool) -> List[Dict[str, Any]]:
+        """
+        Fragmentos de documentación de cada mensaje: ids, documentos, metadatos, puntajes y embeddings.
+        Con hybrid los vecinos densos se fusionan (RRF) con el ranking BM25,
+        así los códigos, nombres de tablas e identificadores exactos no se pierden.
+        """
         # Busca fragmentos relevantes en la colección de documentos.
-        docs_results = self.db_start.docs_collection.query(
-            query_embeddings=message_embedding.tolist(),
-            n_results=5,
-            include=["documents", "metadatas"]
-        )
-        
+        with chroma_span("docs"):
+            docs_results = self.vector_store.docs_collection.query(
+                query_embeddings=np.vstack([query.embedding for query in queries]).tolist(),
+                n_results=self.docs_candidates if hybrid else self.docs_top_k,
+                # Los embeddings permiten al empaquetador descartar fragmentos casi duplicados
+                include=["documents", "metadatas", "distances", "embeddings"]
+            )
+
+        rows = []
+        for row in range(len(queries)):
+            ids = self._result_row(docs_results, 'ids', row)
+            distances = self._result_row(docs_results, 'distances', row)
+            rows.append({
+                "ids": ids,
+                "documents": self._result_row(docs_results, 'documents', row),
+                "metadatas": [meta or {} for meta in self._result_row(docs_results, 'metadatas', row)],
+                # Distancia L2 al cuadrado entre vectores normalizados -> similitud coseno
+                "scores": [1.0 - distance / 2.0 for distance in distances] or [None] * len(ids),
+                "embeddings": dict(zip(ids, self._result_row(docs_results, 'embeddings', row))),
+            })
+
+        if not hybrid:
+            return rows
+
+        # Fusión por posición: RRF no depende de la escala de las distancias ni de los puntajes BM25
+        chunks = {}  # id -> (documento, metadatos)
+        embeddings = {}
+        fused = []
+        for query, row in zip(queries, rows):
+            chunks.update(zip(row["ids"], zip(row["documents"], row["metadatas"])))
+            embeddings.update(row["embeddings"])
+            lexical_ids = [doc_id for doc_id, _ in self.lexical_index.search(query.message, self.docs_candidates)]
+            fused.append(reciprocal_rank_fusion([row["ids"], lexical_ids], k=self.docs_rrf_k, n_results=self.docs_top_k))
+
+        # Los fragmentos que solo encontró BM25 se traen en una única lectura por id
+        missing = list(dict.fromkeys(doc_id for ranking in fused for doc_id, _ in ranking if doc_id not in chunks))
+        if missing:
+            with chroma_span("docs"):
+                fetched = self.vector_store.docs_collection.get(ids=missing, include=["documents", "metadatas", "embeddings"])
+            chunks.update(zip(fetched['ids'], zip(fetched['documents'], [meta or {} for meta in fetched['metadatas']])))
+            embeddings.update(zip(fetched['ids'], self._result_column(fetched, 'embeddings')))
+
+        fused_rows = []
+        for ranking in fused:
+            selected = [(doc_id, score) for doc_id, score in ranking if doc_id in chunks]
+            fused_rows.append({
+                "ids": [doc_id for doc_id, _ in selected],
+                "documents": [chunks[doc_id][0] for doc_id, _ in selected],
+                "metadatas": [chunks[doc_id][1] for doc_id, _ in selected],
+                "scores": [score for _, score in selected],
+                "embeddings": {doc_id: embeddings[doc_id] for doc_id, _ in selected if doc_id in embeddings},
+            })
+        return fused_rows
+
+    @staticmethod
+    def _result_column(results: Dict[str, Any], key: str) -> List[Any]:
+        """A field of a Chroma get() result (None or missing -> [])"""
+        values = results.get(key)
+        return list(values) if values is not None else []
+
+    @staticmethod
+    def _result_row(results: Dict[str, Any], key: str, row: int) -> List[Any]:
+        """Row ``row`` of a field of a Chroma query() result (None or missing -> [])"""
+        values = results.get(key)
+        if values is None or len(values) <= row or values[row] is None:
+            return []
+        return list(values[row])
+
+    def _docs_context(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]],
+                      scores: List[float]) -> Dict[str, Any]:
         relevant_docs = []
-        if docs_results['documents'] and docs_results['documents'][0]:
+        if documents:
              # Se recorren documentos y metadatos y se formatea la salida
-            for doc, meta in zip(docs_results['documents'][0], docs_results['metadatas'][0]):
+            for doc_id, doc, meta, score in zip(ids, documents, metadatas, scores):
                 relevant_docs.append({
-                    "content": doc[:500],  # Limita el contenido para no desbordar tokens
+                    "id": doc_id,
+                    "content": doc,  # Los chunks ya vienen acotados en tokens por la ingesta
                     "source": meta.get('source', 'Unknown'),
-                    "page": meta.get('page', 'N/A')
+                    "page": meta.get('page', 'N/A'),
+                    "chunk": meta.get('chunk'),
+                    "score": score  # Similitud coseno, o puntaje RRF en la búsqueda híbrida
                 })
         
         return {
@@ -151,7 +539,7 @@ class ChatbotService:
             "specific_guidance": "Utiliza la documentación para dar respuestas precisas y detalladas."
         }
     
-    def generate_prompt(self, message: str, intent: str, context: Dict[str, Any]) -> str:
+    def generate_prompt(self, query: ChatQuery, intent: str, context: Dict[str, Any]) -> str:
         """
         Construye el prompt final para enviar al LLM.
         Este prompt incluye:
@@ -160,6 +548,26 @@ class ChatbotService:
         - Contexto (docs, ejemplos)
         - Mensaje del usuario
         """
+        with span("prompt_build"):
+            self._pack_context(query, intent, context)
+            prompt = self._build_prompt(query, intent, context)
+            query.prompt_tokens = self.context_packer.counter.count(prompt)
+            return prompt
+
+    def _pack_context(self, query: ChatQuery, intent: str, context: Dict[str, Any]):
+        """Deja en el contexto solo los docs y ejemplos que entran en el presupuesto de tokens."""
+        base_prompt = self._build_prompt(query, intent, {**context, "relevant_docs": [], "examples": []})
+        packed = self.context_packer.pack(
+            self.context_packer.counter.count(base_prompt),
+            context.get("relevant_docs", []),
+            context.get("examples", []),
+            query.doc_embeddings
+        )
+        context["relevant_docs"] = packed["relevant_docs"]
+        context["examples"] = packed["examples"]
+        query.dropped_candidates = packed["dropped"]
+
+    def _build_prompt(self, query: ChatQuery, intent: str, context: Dict[str, Any]) -> str:
         prompt_parts = []
         
         # Instrucciones principales del sistema
@@ -185,23 +593,121 @@ class ChatbotService:
             for i, example in enumerate(context['examples'], 1):
                 prompt_parts.append(f"Example {i}: {example}")
         
+        # Agrega la conversación previa de la sesión (resumen + últimos turnos)
+        if query.conversation:
+            prompt_parts.append("\nConversación previa:")
+            if query.conversation["summary"]:
+                prompt_parts.append(f"Resumen: {query.conversation['summary']}")
+            for message, response in query.conversation["turns"]:
+                prompt_parts.append(f"Usuario: {message}")
+                prompt_parts.append(f"Asistente: {response}")
+
         # Agrega mensaje original del usuario
-        prompt_parts.append(f"\nMensaje del usuario: {message}")
+        prompt_parts.append(f"\nMensaje del usuario: {query.message}")
         prompt_parts.append("\nPor favor, proporciona una respuesta útil y clara basándote en el contexto anterior.")
         
         return "\n".join(prompt_parts)
     
-    def process_message(self, message: str, prompt: str = None) -> str:
+    def _sync_response_cache(self):
+        """Invalida el cache de respuestas si se re-ingirieron colecciones."""
+        # Re-ingesta de docs: solo quedan obsoletas las respuestas de docs.
+        self.response_cache.sync_version("docs", get_version("docs", self.vector_store.path), intent="docs")
+        # Re-ingesta de intents: puede cambiar el ruteo de cualquier mensaje.
+        self.response_cache.sync_version("intent", get_version("intent", self.vector_store.path))
+
+    def process_message(self, query: ChatQuery, prompt: str = None, context: Dict[str, Any] = None) -> str:
         """Procesa el mensaje y genera la respuesta usando el LLM."""
         #   - Si se recibe un prompt generado → se pasa al modelo.
         #   - Si no → se usan respuestas simples por defecto (fallback).
         try:
             if prompt:
-                # Llama al LLM con el prompt generado
-                response = llm.complete(prompt)
-                return str(response)
+                return self._complete(query, prompt, context)
+
+        except Exception as e:
+            print(f"Error en el procesamiento del LLM {str(e)}")
+            return self.LLM_ERROR_MESSAGE
+
+    def _complete(self, query: ChatQuery, prompt: str, context: Dict[str, Any] = None) -> str:
+        """Respuesta del cache o del LLM; a diferencia de process_message, los errores del LLM se propagan."""
+        fingerprint, cached = self._lookup_response(query, context)
+        if cached is not None:
+            return cached
+
+        # Llama al LLM con el prompt generado
+        with span("llm"):
+            completion = llm.complete(prompt)
+        record_llm_usage(completion)
+        response = str(completion)
+
+        self._store_response(query, fingerprint, response)
+        return response
 
+    def stream_message(self, query: ChatQuery, prompt: str, context: Dict[str, Any] = None):
+        """
+        Generador con los fragmentos de la respuesta del LLM a medida que llegan.
+        Si el LLM falla (también a mitad de la respuesta) la excepción se propaga.
+        """
+        fingerprint, cached = self._lookup_response(query, context)
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        chunk = None
+        try:
+            with span("llm"):
+                for chunk in llm.stream_complete(prompt):
+                    if chunk.delta:
+                        parts.append(chunk.delta)
+                        yield chunk.delta
         except Exception as e:
             print(f"Error en el procesamiento del LLM {str(e)}")
-            return "Lo siento, ocurrió un error al procesar tu solicitud. Intenta nuevamente."
+            raise
+        # El último fragmento trae el uso acumulado de tokens
+        if chunk is not None:
+            record_llm_usage(chunk)
+
+        self._store_response(query, fingerprint, "".join(parts))
+
+    def _lookup_response(self, query: ChatQuery, context: Dict[str, Any] = None):
+        """Busca una respuesta cacheada; devuelve (fingerprint, respuesta o None)."""
+        if context is None:
+            return None, None
+        # Una pregunta casi idéntica con el mismo contexto (y el mismo historial) reutiliza la respuesta
+        self._sync_response_cache()
+        fingerprint = context_fingerprint(context, query.conversation)
+        cached = self.response_cache.lookup(query.intent, fingerprint, query.embedding)
+        if cached is not None:
+            query.response_cached = True
+        return fingerprint, cached
+
+    def _store_response(self, query: ChatQuery, fingerprint: str, response: str):
+        if fingerprint is not None and response:
+            self.response_cache.store(query.intent, fingerprint, query.embedding, response)
+
+    def process_messages(self, queries: List[ChatQuery], prompts: List[str], contexts: List[Dict[str, Any]]) -> List[str]:
+        """
+        Llama al LLM para varios mensajes en paralelo (hasta llm_concurrency a la vez).
+        Devuelve las respuestas en el mismo orden; si una llamada falla se devuelve la excepción.
+        """
+        if len(queries) == 1:
+            try:
+                return [self._complete(queries[0], prompts[0], contexts[0])]
+            except Exception as e:
+                return [e]
+
+        workers = max(1, min(self.llm_concurrency, len(queries)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Cada llamada corre en el contexto del request (spans de la traza actual)
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._complete, query, prompt, context)
+                for query, prompt, context in zip(queries, prompts, contexts)
+            ]
+        responses = []
+        for future in futures:
+            try:
+                responses.append(future.result())
+            except Exception as e:
+                responses.append(e)
+        return responses
 
@@ -0,0 +1,182 @@
+"""
+Context packer
+Fits the retrieved docs and examples of a context into a token budget for the LLM prompt
+"""
+import math
+import threading
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+
+class TokenCounter:
+    """
+    Token counts for the target LLM.
+
+    Uses Gemini's local tokenizer (``google.genai.local_tokenizer``, no API call)
+    when it is installed and ``use_tokenizer`` is set; otherwise, or if it fails
+    to load, tokens are estimated from the text length.
+    """
+
+    def __init__(self, model_name: str, chars_per_token: float = 4.0, use_tokenizer: bool = True,
+                 cache_size: int = 4096):
+        self.model_name = model_name
+        self.chars_per_token = chars_per_token
+        self._tokenizer = None
+        self._unavailable = not use_tokenizer
+        self._lock = threading.Lock()
+        # Los mismos chunks vuelven en muchas consultas: se cuenta una vez por texto
+        self.count = lru_cache(maxsize=cache_size)(self._count)
+
+    @property
+    def method(self) -> str:
+        return "tokenizer" if self._tokenizer is not None else "estimate"
+
+    def warm(self) -> str:
+        """Load the tokenizer now (its first use downloads the vocabulary), not on a request"""
+        self._load_tokenizer()
+        return self.method
+
+    def _load_tokenizer(self):
+        if self._tokenizer is not None or self._unavailable:
+            return self._tokenizer
+        with self._lock:
+            if self._tokenizer is None and not self._unavailable:
+                try:
+                    from google.genai.local_tokenizer import LocalTokenizer
+                    self._tokenizer = LocalTokenizer(model_name=self.model_name)
+                except Exception as e:
+                    print(f"Local tokenizer for {self.model_name} not available ({e}); estimating tokens")
+                    self._unavailable = True
+        return self._tokenizer
+
+    def _count(self, text: str) -> int:
+        if not text:
+            return 0
+        tokenizer = self._load_tokenizer()
+        if tokenizer is not None:
+            try:
+                return int(tokenizer.count_tokens(text).total_tokens)
+            except Exception as e:
+                print(f"Error counting tokens: {e}")
+        return int(math.ceil(len(text) / self.chars_per_token))
+
+
+def join_chunks(first: str, second: str, min_overlap: int = 10, max_overlap: int = 600) -> str:
+    """Concatenate consecutive chunks, removing the overlap the chunker repeated"""
+    for size in range(min(len(first), len(second), max_overlap), min_overlap - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+class ContextPacker:
+    """
+    Selects what goes into the prompt.
+
+    Docs are ranked by retrieval score; a doc whose embedding has cosine similarity
+    >= ``dedup_threshold`` with a better-ranked one is dropped, consecutive chunks
+    of the same source are merged into one block, and blocks (then examples) are
+    added best first while they fit in ``budget`` tokens. Everything left out is
+    reported with the reason.
+    """
+
+    def __init__(self, counter: TokenCounter, budget: int = 1500, dedup_threshold: float = 0.95):
+        self.counter = counter
+        self.budget = budget
+        self.dedup_threshold = dedup_threshold
+
+    def pack(self, base_tokens: int, docs: List[Dict[str, Any]], examples: List[str],
+             embeddings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Fit docs and examples in the budget left after ``base_tokens`` (the prompt without them).
+        Returns the kept docs and examples and the dropped candidates.
+        """
+        dropped: List[Dict[str, Any]] = []
+        ranked = sorted(docs, key=lambda doc: -(doc.get("score") or 0.0))
+        unique = self._deduplicate(ranked, embeddings or {}, dropped)
+        blocks = self._merge_adjacent(unique)
+
+        remaining = self.budget - base_tokens
+        kept_docs = []
+        for doc in blocks:
+            tokens = self.counter.count(f"Doc 0 (Source: {doc['source']}, Page: {doc['page']}):\n{doc['content']}\n---")
+            if tokens <= remaining:
+                kept_docs.append(doc)
+                remaining -= tokens
+            else:
+                dropped.append(self._dropped(doc, "budget", tokens))
+
+        kept_examples = []
+        for example in examples:
+            tokens = self.counter.count(f"Example 0: {example}")
+            if tokens <= remaining:
+                kept_examples.append(example)
+                remaining -= tokens
+            else:
+                dropped.append({"kind": "example", "content": example, "reason": "budget", "tokens": tokens})
+
+        return {"relevant_docs": kept_docs, "examples": kept_examples, "dropped": dropped}
+
+    def _deduplicate(self, ranked, embeddings, dropped):
+        kept, kept_vectors, seen_contents = [], [], set()
+        for doc in ranked:
+            vector = embeddings.get(doc.get("id"))
+            duplicate = doc["content"] in seen_contents
+            if not duplicate and vector is not None and kept_vectors:
+                vector = np.asarray(vector, dtype=np.float32)
+                # Embeddings normalizados: la similitud coseno es el producto punto
+                duplicate = float(np.max(np.stack(kept_vectors) @ vector)) >= self.dedup_threshold
+            if duplicate:
+                dropped.append(self._dropped(doc, "duplicate"))
+                continue
+            kept.append(doc)
+            seen_contents.add(doc["content"])
+            if vector is not None:
+                kept_vectors.append(np.asarray(vector, dtype=np.float32))
+        return kept
+
+    def _merge_adjacent(self, ranked):
+        """Merge runs of consecutive chunks of a source; a run takes the rank of its best chunk"""
+        rank = {id(doc): position for position, doc in enumerate(ranked)}
+        ordered = sorted(
+            (doc for doc in ranked if isinstance(doc.get("chunk"), int)),
+            key=lambda doc: (str(doc["source"]), doc["chunk"])
+        )
+        runs = []
+        for doc in ordered:
+            last = runs[-1][-1] if runs else None
+            if last is not None and last["source"] == doc["source"] and doc["chunk"] == last["chunk"] + 1:
+                runs[-1].append(doc)
+            else:
+                runs.append([doc])
+
+        blocks = [(rank[id(doc)], doc) for doc in ranked if not isinstance(doc.get("chunk"), int)]
+        for run in runs:
+            if len(run) == 1:
+                blocks.append((rank[id(run[0])], run[0]))
+                continue
+            content = run[0]["content"]
+            for doc in run[1:]:
+                content = join_chunks(content, doc["content"])
+            pages = [doc["page"] for doc in run]
+            blocks.append((min(rank[id(doc)] for doc in run), {
+                **run[0],
+                "content": content,
+                "page": pages[0] if pages[0] == pages[-1] else f"{pages[0]}-{pages[-1]}",
+                "score": max(doc.get("score") or 0.0 for doc in run),
+                "chunks": [doc["chunk"] for doc in run],
+            }))
+        return [doc for _, doc in sorted(blocks, key=lambda block: block[0])]
+
+    def _dropped(self, doc, reason: str, tokens: int = None) -> Dict[str, Any]:
+        return {
+            "kind": "doc",
+            "id": doc.get("id"),
+            "source": doc.get("source"),
+            "page": doc.get("page"),
+            "score": doc.get("score"),
+            "reason": reason,
+            "tokens": tokens if tokens is not None else self.counter.count(doc["content"]),
+        }
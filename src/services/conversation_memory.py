@@ -0,0 +1,274 @@
+"""
+Conversation memory
+Bounded per-session state: recent turns, a rolling summary and the embeddings that steer follow-up routing
+"""
+import re
+import textwrap
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def _first_sentence(text: str) -> str:
+    return _SENTENCE_END_RE.split(text.strip(), 1)[0]
+
+
+def extractive_summary(summary: str, turns: List[Tuple[str, str]], count_tokens: Callable[[str], int],
+                       max_tokens: int) -> str:
+    """
+    Summary without an LLM call: one line per folded turn (question and first
+    sentence of the answer); the oldest lines go first when it exceeds max_tokens.
+    """
+    lines = summary.split("\n") if summary else []
+    for message, response in turns:
+        lines.append(
+            f"- Usuario: {textwrap.shorten(message, 160, placeholder='...')} | "
+            f"Asistente: {textwrap.shorten(_first_sentence(response), 160, placeholder='...')}"
+        )
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class _Session:
+    """State of one conversation"""
+
+    __slots__ = ("turns", "summary", "summarized_turns", "base_summary", "pending_folds", "summarizing",
+                 "embeddings", "tokens", "last_access", "lock")
+
+    def __init__(self, routing_turns: int):
+        self.turns: List[Tuple[str, str, int]] = []  # (mensaje, respuesta, tokens) en orden
+        self.summary = ""
+        self.summarized_turns = 0
+        # Resumidor en segundo plano: último resumen que devolvió y turnos plegados que aún no incluye
+        self.base_summary = ""
+        self.pending_folds: List[Tuple[str, str]] = []
+        self.summarizing = False
+        # float16: solo se usan para orientar el ruteo, no hace falta más precisión
+        self.embeddings = deque(maxlen=routing_turns)
+        self.tokens = 0
+        self.last_access = time.time()
+        self.lock = threading.Lock()
+
+    def nbytes(self) -> int:
+        text = sum(len(message) + len(response) for message, response, _ in self.turns) + len(self.summary)
+        return text + sum(vector.nbytes for vector in self.embeddings)
+
+
+class ConversationMemory:
+    """
+    Per-session conversation state, bounded in sessions and in tokens.
+
+    Sessions are evicted least recently used beyond ``max_sessions`` and expire
+    after ``session_ttl`` seconds without activity. Within a session, recent turns
+    are kept verbatim while summary + turns fit in ``token_budget``; older turns
+    are folded into the summary, so the conversation part of the prompt has a
+    fixed ceiling. The default summary is extractive and built in place; a custom
+    ``summarizer(summary, turns)`` (e.g. an LLM call) runs in a background thread,
+    off the request and without holding the session lock, and the extractive
+    summary stands in until it returns.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int], max_sessions: int = 1000, session_ttl: float = 1800,
+                 token_budget: int = 400, summary_tokens: int = 150, routing_turns: int = 3,
+                 summarizer: Optional[Callable[[str, List[Tuple[str, str]]], str]] = None):
+        self.count_tokens = count_tokens
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.token_budget = token_budget
+        # El resumen ocupa como mucho la mitad del presupuesto; el resto es para turnos literales
+        self.summary_tokens = min(summary_tokens, token_budget // 2)
+        # Al plegar, los turnos literales bajan hasta esta marca: el resumen se regenera
+        # cada varios turnos. Un turno más grande se recorta antes de guardarlo.
+        self.low_water_tokens = max(1, (token_budget - self.summary_tokens) // 2)
+        self.routing_turns = routing_turns
+        self.summarizer = summarizer
+        # Se crea con el primer resumen: sin hilos antes del fork de un servidor pre-fork
+        self._summary_executor: Optional[ThreadPoolExecutor] = None
+
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()  # orden de último acceso
+        self._lock = threading.Lock()
+
+        self.evictions = 0
+        self.expirations = 0
+        self.summaries = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_sessions > 0
+
+    def _expire(self, now: float):
+        """Drop idle sessions; caller holds the lock. The oldest accesses are at the front."""
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access <= self.session_ttl:
+                break
+            del self._sessions[session_id]
+            self.expirations += 1
+
+    def _get(self, session_id: str, create: bool) -> Optional[_Session]:
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None and create:
+                session = self._sessions[session_id] = _Session(self.routing_turns)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            if session is not None:
+                session.last_access = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def snapshot(self, session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        What the next turn of a session needs: summary, verbatim turns and the
+        steering vector (decayed mean of the last turns' embeddings). None if empty.
+        """
+        if not session_id or not self.enabled:
+            return None
+        session = self._get(session_id, create=False)
+        if session is None:
+            return None
+        with session.lock:
+            if not session.turns and not session.summary:
+                return None
+            steering = None
+            if session.embeddings:
+                # El turno más reciente pesa más: 1, 1/2, 1/4, ...
+                vectors = np.stack(list(session.embeddings)).astype(np.float32)
+                weights = 0.5 ** np.arange(len(vectors))[::-1]
+                steering = (weights[:, None] * vectors).sum(axis=0)
+                steering /= max(float(np.linalg.norm(steering)), 1e-12)
+            return {
+                "summary": session.summary,
+                "turns": [(message, response) for message, response, _ in session.turns],
+                "summarized_turns": session.summarized_turns,
+                "tokens": session.tokens,
+                "steering": steering,
+            }
+
+    def record(self, session_id: Optional[str], message: str, response: str, embedding=None):
+        """Add a turn; folds the oldest turns into the summary when over the token budget"""
+        if not session_id or not self.enabled:
+            return
+        session = self._get(session_id, create=True)
+        with session.lock:
+            message, response, turn_tokens = self._cap_turn(message, response)
+            session.turns.append((message, response, turn_tokens))
+            if embedding is not None:
+                session.embeddings.append(np.asarray(embedding, dtype=np.float16).reshape(-1))
+
+            summary_tokens = self.count_tokens(session.summary)
+            turns_tokens = sum(tokens for _, _, tokens in session.turns)
+            folded = []
+            # Se pliegan turnos hasta bajar a la marca: así el resumen se regenera cada
+            # varios turnos, no en cada uno. El último turno (recortado a la marca) queda literal.
+            if summary_tokens + turns_tokens > self.token_budget:
+                while len(session.turns) > 1 and turns_tokens > self.low_water_tokens:
+                    folded_message, folded_response, tokens = session.turns.pop(0)
+                    folded.append((folded_message, folded_response))
+                    turns_tokens -= tokens
+            if folded:
+                # Resumen extractivo inmediato; con un resumidor propio es provisional hasta que responda
+                session.summary = self._extractive(session.summary, folded)
+                session.summarized_turns += len(folded)
+                summary_tokens = self.count_tokens(session.summary)
+                if self.summarizer is not None:
+                    session.pending_folds.extend(folded)
+                    self._submit_summary(session)
+                else:
+                    with self._lock:
+                        self.summaries += 1
+            session.tokens = summary_tokens + turns_tokens
+
+    def _extractive(self, summary: str, turns: List[Tuple[str, str]]) -> str:
+        return self._cap_summary(extractive_summary(summary, turns, self.count_tokens, self.summary_tokens))
+
+    def _submit_summary(self, session: _Session):
+        """Start summarizing the session's pending folds unless a run is in flight; caller holds session.lock"""
+        if session.summarizing or not session.pending_folds:
+            return
+        session.summarizing = True
+        base, turns = session.base_summary, session.pending_folds
+        session.pending_folds = []
+        with self._lock:
+            if self._summary_executor is None:
+                self._summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+            executor = self._summary_executor
+        executor.submit(self._summarize, session, base, turns)
+
+    def _summarize(self, session: _Session, base: str, turns: List[Tuple[str, str]]):
+        """Background thread: runs the summarizer outside the lock and writes the result back"""
+        try:
+            summary = self.summarizer(base, turns)
+        except Exception as e:
+            print(f"Error summarizing conversation: {e}")
+            summary = self._extractive(base, turns)
+        summary = self._cap_summary(summary)
+        with session.lock:
+            session.base_summary = summary
+            # Lo plegado mientras tanto se agrega de forma extractiva y va en la próxima corrida
+            session.summary = self._extractive(summary, session.pending_folds) if session.pending_folds else summary
+            session.tokens = self.count_tokens(session.summary) + sum(tokens for _, _, tokens in session.turns)
+            session.summarizing = False
+            self._submit_summary(session)
+        with self._lock:
+            self.summaries += 1
+
+    def _cap_turn(self, message: str, response: str) -> Tuple[str, str, int]:
+        """Shorten a turn over low_water_tokens (the answer first); returns message, response and tokens"""
+        tokens = self.count_tokens(f"Usuario: {message}\nAsistente: {response}")
+        while tokens > self.low_water_tokens and (message or response):
+            ratio = self.low_water_tokens / tokens * 0.95
+            if response:
+                response = response[:int(len(response) * ratio)]
+            else:
+                message = message[:int(len(message) * ratio)]
+            tokens = self.count_tokens(f"Usuario: {message}\nAsistente: {response}")
+        return message, response, tokens
+
+    def _cap_summary(self, summary: str) -> str:
+        """Trim a summary (e.g. a long LLM one) to summary_tokens, keeping its most recent part"""
+        tokens = self.count_tokens(summary)
+        while summary and tokens > self.summary_tokens:
+            keep = int(len(summary) * self.summary_tokens / tokens * 0.95)
+            summary = summary[len(summary) - keep:] if keep > 0 else ""
+            tokens = self.count_tokens(summary)
+        return summary
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Sessions, memory per session and eviction counters"""
+        with self._lock:
+            self._expire(time.time())
+            sessions = list(self._sessions.values())
+            stats = {
+                "policy": "lru+ttl",
+                "max_sessions": self.max_sessions,
+                "session_ttl": self.session_ttl,
+                "token_budget": self.token_budget,
+                "sessions": len(sessions),
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "summaries": self.summaries,
+            }
+        sizes = [session.nbytes() for session in sessions]
+        tokens = [session.tokens for session in sessions]
+        stats.update({
+            "bytes": sum(sizes),
+            "mean_session_bytes": sum(sizes) / len(sizes) if sizes else 0.0,
+            "mean_session_tokens": sum(tokens) / len(tokens) if tokens else 0.0,
+            "max_session_tokens": max(tokens) if tokens else 0,
+        })
+        return stats
@@ -0,0 +1,194 @@
+"""
+Intent index
+Índice en memoria (NumPy) de los ejemplos de intent_collection para el prerouting
+"""
+import threading
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from persistence.collection_versions import get_version
+from services.shared_memory import share_array
+
+
+def classify_neighbours(distances: List[float], intents: List[str],
+                        ambiguous_threshold: float = 0.5, gap_threshold: float = 0.1) -> str:
+    """
+    Regla de decisión del prerouting sobre los vecinos más cercanos (ordenados por distancia).
+
+    Retorna el intent del más cercano, o "ambiguo" si está demasiado lejos o si el
+    segundo vecino es de otro intent y está a menos de gap_threshold.
+    """
+    if not distances:
+        return "ambiguo"
+
+    # Primer resultado (el más cercano)
+    best_distance = distances[0]
+    best_intent = intents[0]
+
+    # Si la distancia es muy grande, la coincidencia no es confiable
+    if best_distance > ambiguous_threshold:
+        return "ambiguo"
+
+    # Si hay más de un resultado, compara el segundo
+    if len(distances) > 1:
+        second_distance = distances[1]
+        second_intent = intents[1]
+
+        # Si la diferencia entre ambos es poca pero las intenciones son diferentes → ambiguo
+        distance_diff = second_distance - best_distance
+        if distance_diff < gap_threshold and best_intent != second_intent:
+            return "ambiguo"
+
+    # Si pasó todas las validaciones, se devuelve la más confiable
+    return best_intent
+
+
+class IntentIndex:
+    """
+    In-process copy of the intent collection.
+
+    Holds a contiguous float32 matrix of the example embeddings plus their intent
+    labels, and answers top-k queries with one matrix product + ``argpartition``.
+    Distances use the collection's own space (Chroma's default is squared L2), so
+    thresholds tuned against Chroma results keep their meaning.
+    """
+
+    def __init__(self, collection, collection_name: str = "intent", store_path: Optional[str] = None):
+        """
+        Initialize the index for a Chroma collection, or a zero-argument callable
+        returning it so the collection is only opened on load(). ``store_path`` is
+        the store directory whose version counters the index follows.
+        """
+        self._collection = collection
+        self.collection_name = collection_name
+        self.store_path = store_path
+        self.space = "l2"
+        self.version = None
+        # Índices construidos con from_arrays no están ligados a una colección
+        self.detached = False
+        # True mientras matrix y sq_norms viven en memoria compartida (ver share())
+        self.shared = False
+
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.labels = np.empty(0, dtype=object)
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.sq_norms = np.empty(0, dtype=np.float32)
+
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_arrays(cls, matrix, intents: List[str], documents: List[str] = None, space: str = "l2") -> "IntentIndex":
+        """Build a detached index from embeddings and labels (offline tools, no Chroma)"""
+        index = cls(None)
+        matrix = np.ascontiguousarray(np.asarray(matrix, dtype=np.float32))
+        index.space = space
+        index.ids = [str(i) for i in range(len(matrix))]
+        index.documents = list(documents) if documents is not None else []
+        index.metadatas = [{"intent": intent} for intent in intents]
+        index.labels = np.array(list(intents), dtype=object)
+        index.matrix = matrix
+        index.sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+        index.detached = True
+        return index
+
+    @property
+    def collection(self):
+        return self._collection() if callable(self._collection) else self._collection
+
+    def load(self):
+        """Read every example from the collection and build the matrix"""
+        version = get_version(self.collection_name, self.store_path)
+        collection = self.collection
+        results = collection.get(include=["embeddings", "documents", "metadatas"])
+        metadata = getattr(collection, "metadata", None) or {}
+        embeddings = results.get("embeddings")
+
+        if embeddings is None or len(embeddings) == 0:
+            matrix = np.empty((0, 0), dtype=np.float32)
+        else:
+            matrix = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32))
+        metadatas = results.get("metadatas") or [{} for _ in results["ids"]]
+
+        with self._lock:
+            self.space = metadata.get("hnsw:space", "l2")
+            self.ids = list(results["ids"])
+            self.documents = list(results.get("documents") or [])
+            self.metadatas = list(metadatas)
+            self.labels = np.array([meta.get("intent") for meta in self.metadatas], dtype=object)
+            self.matrix = matrix
+            self.sq_norms = np.einsum("ij,ij->i", matrix, matrix) if len(matrix) else np.empty(0, dtype=np.float32)
+            self.version = version
+            self.shared = False
+
+        print(f"Intent index loaded: {len(self.ids)} examples (space={self.space})")
+
+    def share(self) -> int:
+        """
+        Move the matrix and norms to shared memory, before forking workers; returns
+        the bytes shared. A reload after a version bump builds private arrays again.
+        """
+        with self._lock:
+            self.matrix = share_array(self.matrix)
+            self.sq_norms = share_array(self.sq_norms)
+            self.shared = True
+            return self.matrix.nbytes + self.sq_norms.nbytes
+
+    def refresh_if_changed(self):
+        """Reload when ingestion bumped the intent collection's version"""
+        if self.detached:
+            return
+        if get_version(self.collection_name, self.store_path) != self.version:
+            self.load()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _distances(self, queries):
+        """Distances between each query row and every example, in the collection's space"""
+        products = queries @ self.matrix.T
+        if self.space == "cosine":
+            norms = np.sqrt(self.sq_norms)[None, :] * np.linalg.norm(queries, axis=1)[:, None]
+            return 1.0 - products / np.maximum(norms, 1e-12)
+        if self.space == "ip":
+            return 1.0 - products
+        # Chroma "l2" es la distancia euclídea al cuadrado
+        q_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+        return np.maximum(q_norms + self.sq_norms[None, :] - 2.0 * products, 0.0)
+
+    def query(self, query_embeddings, n_results: int = 3, intent: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Top-k neighbours for each query embedding.
+        Returns a dict shaped like Chroma's query() result (ids, documents, metadatas, distances).
+        """
+        self.refresh_if_changed()
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+
+        with self._lock:
+            if not len(self.ids):
+                for key in results:
+                    results[key] = [[] for _ in range(len(queries))]
+                return results
+
+            distances = self._distances(queries)
+            if intent is not None:
+                # Equivalente a where={"intent": intent}
+                distances = np.where(self.labels == intent, distances, np.inf)
+
+            k = min(n_results, distances.shape[1])
+            for row in distances:
+                if k < len(row):
+                    top = np.argpartition(row, k - 1)[:k]
+                else:
+                    top = np.arange(len(row))
+                top = top[np.argsort(row[top], kind="stable")]
+                top = top[np.isfinite(row[top])]
+
+                results["ids"].append([self.ids[i] for i in top])
+                results["documents"].append([self.documents[i] for i in top] if self.documents else [])
+                results["metadatas"].append([self.metadatas[i] for i in top])
+                results["distances"].append([float(row[i]) for i in top])
+        return results
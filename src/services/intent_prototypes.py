@@ -0,0 +1,188 @@
+"""
+Intent prototypes
+Per-intent k-means centroids for a fast prerouting path; close calls fall back to the kNN rule
+"""
+import os
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+# Se guarda junto a la base Chroma (VectorStore.path)
+PROTOTYPES_FILENAME = "intent_prototypes.npz"
+
+
+def kmeans(vectors, k: int, iterations: int = 25, seed: int = 0):
+    """Spherical k-means: unit-norm centroids maximizing cosine similarity to their members"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    k = max(1, min(k, len(vectors)))
+    rng = np.random.RandomState(seed)
+
+    # Inicialización k-means++ (en similitud coseno)
+    centroids = [vectors[rng.randint(len(vectors))]]
+    for _ in range(1, k):
+        similarity = np.max(vectors @ np.stack(centroids).T, axis=1)
+        weights = np.maximum(1.0 - similarity, 0.0).astype(np.float64)
+        if weights.sum() <= 0:
+            break
+        centroids.append(vectors[rng.choice(len(vectors), p=weights / weights.sum())])
+    centroids = np.stack(centroids)
+
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        updated = np.stack([
+            vectors[assignment == c].sum(axis=0) if np.any(assignment == c) else centroids[c]
+            for c in range(len(centroids))
+        ])
+        updated /= np.maximum(np.linalg.norm(updated, axis=1, keepdims=True), 1e-12)
+        if np.allclose(updated, centroids, atol=1e-6):
+            break
+        centroids = updated
+    return centroids.astype(np.float32)
+
+
+def build_prototypes(matrix, labels: List[str], per_intent: int = 3, seed: int = 0) -> Tuple[np.ndarray, List[str]]:
+    """Prototypes of every intent: (matrix, intent label per row)"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    labels = np.asarray(labels, dtype=object)
+    prototypes, prototype_labels = [], []
+    for intent in sorted(set(labels.tolist())):
+        if intent is None:
+            continue
+        centroids = kmeans(matrix[labels == intent], per_intent, seed=seed)
+        prototypes.append(centroids)
+        prototype_labels.extend([intent] * len(centroids))
+    if not prototypes:
+        return np.empty((0, matrix.shape[1] if matrix.ndim == 2 else 0), dtype=np.float32), []
+    return np.vstack(prototypes), prototype_labels
+
+
+def prototypes_path(store_path: str) -> str:
+    return os.path.join(store_path, PROTOTYPES_FILENAME)
+
+
+def save_prototypes(matrix, labels: List[str], version: int, path: str):
+    """Write prototypes with the intent collection version they were built from"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, matrix=np.asarray(matrix, dtype=np.float32), labels=np.array(labels, dtype=str), version=np.int64(version))
+    os.replace(tmp_path, path)
+
+
+def load_prototypes(path: str) -> Optional[Tuple[np.ndarray, List[str], int]]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return data["matrix"].astype(np.float32), data["labels"].tolist(), int(data["version"])
+    except Exception as e:
+        print(f"Error loading intent prototypes from {path}: {e}")
+        return None
+
+
+class IntentPrototypes:
+    """
+    Tier one of prerouting.
+
+    A message is routed without the kNN analysis when its nearest prototype is
+    within ``max_distance`` and every other intent's nearest prototype is at least
+    ``margin`` further away (squared L2 on normalized vectors, like the index);
+    a margin of 0 disables the fast path. Prototypes come from the file written
+    at ingest time; if it is missing or belongs to another version of the intent
+    collection they are rebuilt from the in-memory index.
+    """
+
+    def __init__(self, margin: float = 0.0, max_distance: float = 0.5, per_intent: int = 3,
+                 path: Optional[str] = None):
+        self.margin = margin
+        self.max_distance = max_distance
+        self.per_intent = per_intent
+        self.path = path
+        self.enabled = margin is not None and margin > 0
+
+        self.loaded = False
+        self.version = None
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.labels = np.empty(0, dtype=object)
+        self.intents: List[str] = []
+
+        self.fast = 0
+        self.fallback = 0
+        self._lock = threading.Lock()
+
+    def sync(self, index):
+        """Match the prototypes to the intent index version"""
+        if not self.enabled or (self.loaded and self.version == index.version):
+            return
+        with self._lock:
+            if self.loaded and self.version == index.version:
+                return
+            stored = load_prototypes(self.path) if self.path else None
+            if stored is not None and stored[2] == index.version:
+                matrix, labels, _ = stored
+            else:
+                matrix, labels = build_prototypes(index.matrix, list(index.labels), self.per_intent)
+                print(f"Intent prototypes rebuilt in memory ({len(labels)} prototypes)")
+            self.matrix = matrix
+            self.labels = np.array(labels, dtype=object)
+            self.intents = sorted(set(labels))
+            self.version = index.version
+            self.loaded = True
+
+    @classmethod
+    def from_arrays(cls, matrix, labels: List[str], margin: float = 0.0, max_distance: float = 0.5,
+                    per_intent: int = 3) -> "IntentPrototypes":
+        """Prototypes built from embeddings and labels (offline tools, no Chroma)"""
+        prototypes = cls(margin=margin, max_distance=max_distance, per_intent=per_intent)
+        matrix, prototype_labels = build_prototypes(matrix, labels, per_intent)
+        prototypes.matrix = matrix
+        prototypes.labels = np.array(prototype_labels, dtype=object)
+        prototypes.intents = sorted(set(prototype_labels))
+        prototypes.loaded = True
+        return prototypes
+
+    def nearest(self, queries) -> List[Tuple[str, float, float]]:
+        """(closest intent, its distance, distance of the runner-up intent) per query row"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if len(self.intents) < 2:
+            return []
+        q_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+        p_norms = np.einsum("ij,ij->i", self.matrix, self.matrix)[None, :]
+        distances = np.maximum(q_norms + p_norms - 2.0 * queries @ self.matrix.T, 0.0)
+        # Distancia al prototipo más cercano de cada intención
+        per_intent = np.stack([distances[:, self.labels == intent].min(axis=1) for intent in self.intents], axis=1)
+        order = np.argsort(per_intent, axis=1)
+        rows = np.arange(len(queries))
+        best = per_intent[rows, order[:, 0]]
+        second = per_intent[rows, order[:, 1]]
+        return [(self.intents[order[i, 0]], float(best[i]), float(second[i])) for i in rows]
+
+    def decide(self, intent: str, best: float, second: float) -> Optional[str]:
+        """The intent if the margin is large enough, else None"""
+        if best <= self.max_distance and second - best >= self.margin:
+            return intent
+        return None
+
+    def route(self, queries) -> List[Optional[str]]:
+        """Intent of each query row, or None when it needs the kNN analysis"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        decisions: List[Optional[str]] = [None] * len(queries)
+        if self.enabled:
+            for i, candidate in enumerate(self.nearest(queries)):
+                decisions[i] = self.decide(*candidate)
+
+        fast = sum(decision is not None for decision in decisions)
+        with self._lock:
+            self.fast += fast
+            self.fallback += len(decisions) - fast
+        return decisions
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.fast + self.fallback
+            return {
+                "fast": self.fast,
+                "fallback": self.fallback,
+                "fast_fraction": self.fast / total if total else 0.0,
+                "prototypes": len(self.labels),
+            }
@@ -0,0 +1,62 @@
+"""
+Routing config
+Prerouting thresholds chosen by the routing evaluation (python -m benchmarks.routing)
+"""
+import json
+import os
+from typing import Dict, Any, Optional
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTING_CONFIG_FILE = os.path.join(BASE_DIR, "persistence", "routing_config.json")
+
+# Valores elegidos a mano antes de la evaluación
+DEFAULT_ROUTING = {
+    "ambiguous_threshold": 0.5,
+    "gap_threshold": 0.1,
+    # Prototipos: diferencia mínima de distancia entre intenciones para saltear el kNN (0 lo desactiva).
+    # Desactivado hasta que benchmarks.routing elija un margen: un mensaje puede quedar más cerca
+    # de un centroide que de cualquier ejemplo y el camino rápido contradiría al kNN
+    "fast_path_margin": 0.0,
+}
+
+
+def config_path(path: Optional[str] = None) -> str:
+    return path or os.getenv("ROUTING_CONFIG") or ROUTING_CONFIG_FILE
+
+
+def load_routing_config(model_name: Optional[str] = None, path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Thresholds for prerouting: the evaluated config if it exists, else the defaults.
+    A config tuned for another embedding model is ignored (distances are not comparable).
+    """
+    path = config_path(path)
+    routing = dict(DEFAULT_ROUTING)
+    if not os.path.exists(path):
+        return routing
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading routing config {path}: {e}")
+        return routing
+
+    if model_name and config.get("model") and config["model"] != model_name:
+        print(f"Routing config was tuned for {config['model']}, not {model_name}; using default thresholds")
+        return routing
+
+    for key in DEFAULT_ROUTING:
+        if key in config:
+            routing[key] = float(config[key])
+    print(f"Routing thresholds loaded from {path}: {routing}")
+    return routing
+
+
+def save_routing_config(config: Dict[str, Any], path: Optional[str] = None) -> str:
+    """Write the config atomically; returns the path"""
+    path = config_path(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
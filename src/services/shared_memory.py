@@ -0,0 +1,27 @@
+"""
+Shared memory
+Read-only NumPy arrays in anonymous shared mappings, inherited by forked workers
+"""
+import mmap
+
+import numpy as np
+
+
+def share_array(array) -> np.ndarray:
+    """
+    Copy ``array`` into an anonymous MAP_SHARED mapping and return a read-only view.
+
+    Created before forking, every worker maps the same physical pages. Unlike a heap
+    array (copy-on-write, whose pages get copied as soon as the allocator touches a
+    neighbour), these pages are never duplicated. Not inherited on platforms without fork.
+    """
+    array = np.ascontiguousarray(array)
+    if array.nbytes == 0:
+        return array
+    # fileno -1: mapeo anónimo, compartido (MAP_SHARED) con los procesos hijos
+    buffer = mmap.mmap(-1, array.nbytes)
+    shared = np.frombuffer(buffer, dtype=array.dtype).reshape(array.shape)
+    shared[...] = array
+    shared.flags.writeable = False
+    return shared
+
@@ -0,0 +1,50 @@
+"""
+Snapshot and restore of the vector collections.
+Run from src:
+    py snapshot.py create --output snapshots/node-bootstrap
+    py snapshot.py restore --input snapshots/node-bootstrap
+"""
+import argparse
+import json
+
+from persistence.snapshot import create_snapshot, restore_snapshot
+from persistence.vector_store import COLLECTION_NAMES, VectorStore, DB_DIR
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot / restore the ChromaDB collections without re-embedding")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create = commands.add_parser("create", help="Write a snapshot bundle of the store")
+    create.add_argument("--output", required=True, help="Folder of the new bundle")
+    create.add_argument("--store", default=DB_DIR, help="ChromaDB directory to read")
+    create.add_argument("--collections", nargs="+", default=list(COLLECTION_NAMES), help="Collections to include")
+    create.add_argument("--batch-size", type=int, default=1000, help="Rows per page read from Chroma")
+
+    restore = commands.add_parser("restore", help="Bulk-load a bundle into a store")
+    restore.add_argument("--input", required=True, help="Folder of the bundle")
+    restore.add_argument("--store", default=DB_DIR, help="ChromaDB directory to load into")
+    restore.add_argument("--batch-size", type=int, default=1000, help="Rows per add() call")
+    restore.add_argument("--force", action="store_true", help="Replace collections that already have rows")
+    restore.add_argument("--no-verify", action="store_true", help="Skip the checksum verification")
+    restore.add_argument("--allow-model-mismatch", action="store_true",
+                         help="Restore even if the bundle was embedded with another model")
+
+    for command in (create, restore):
+        command.add_argument("--quiet", action="store_true", help="Do not print progress per batch")
+    args = parser.parse_args()
+
+    store = VectorStore(args.store)
+    if args.command == "create":
+        result = create_snapshot(store, args.output, args.collections, batch_size=args.batch_size, progress=not args.quiet)
+        print(f"✅ Snapshot written to {args.output} in {result['seconds']:.1f}s")
+    else:
+        result = restore_snapshot(
+            args.input, store,
+            batch_size=args.batch_size,
+            force=args.force,
+            verify=not args.no_verify,
+            allow_model_mismatch=args.allow_model_mismatch,
+            progress=not args.quiet
+        )
+        print(json.dumps(result, indent=2))
+    store.close()
@@ -0,0 +1,7 @@
+"""
+Pytest setup: the application modules are imported from src, as when running from there
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
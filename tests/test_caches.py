@@ -0,0 +1,139 @@
+"""
+TTL expiry and LRU eviction of the embedding and response caches
+"""
+import types
+
+import numpy as np
+import pytest
+
+from cache import embedding_cache, response_cache
+from cache.embedding_cache import EmbeddingCache
+from cache.response_cache import ResponseCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    fake_time = types.SimpleNamespace(time=clock.time)
+    monkeypatch.setattr(embedding_cache, "time", fake_time)
+    monkeypatch.setattr(response_cache, "time", fake_time)
+    return clock
+
+
+class CountingModel:
+    """Deterministic vectors; records which texts reach the model"""
+
+    def __init__(self, dim: int = 4):
+        self.dim = dim
+        self.calls = []
+
+    def encode(self, sentences, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        self.calls.append(texts)
+        matrix = np.array([[len(text), sum(map(ord, text)) % 97, 1.0, 0.0] for text in texts],
+                          dtype=np.float32).reshape(-1, self.dim)
+        return matrix[0] if single else matrix
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_embedding_cache_hits_skip_the_model(clock):
+    model = CountingModel()
+    cache = EmbeddingCache(model, "test", max_size=8)
+    first = cache.encode(["hola", "chau"])
+    second = cache.encode(["chau", "hola"])
+    np.testing.assert_array_equal(second, first[::-1])
+    assert model.calls == [["hola", "chau"]]
+    assert cache.stats()["hits"] == 2
+
+
+def test_embedding_cache_evicts_least_recently_used(clock):
+    model = CountingModel()
+    cache = EmbeddingCache(model, "test", max_size=2)
+    cache.encode(["a"])
+    cache.encode(["b"])
+    cache.encode(["a"])  # "a" pasa a ser el más reciente
+    cache.encode(["c"])  # desaloja "b"
+    model.calls.clear()
+
+    cache.encode(["a", "c"])
+    assert model.calls == []
+    cache.encode(["b"])
+    assert model.calls == [["b"]]
+    assert cache.stats()["evictions"] == 2
+
+
+def test_embedding_cache_entries_expire_after_ttl(clock):
+    model = CountingModel()
+    cache = EmbeddingCache(model, "test", max_size=8, ttl=60)
+    cache.encode(["hola"])
+    clock.now += 59
+    cache.encode(["hola"])
+    assert len(model.calls) == 1
+
+    clock.now += 2
+    cache.encode(["hola"])
+    assert len(model.calls) == 2
+    assert cache.stats()["expirations"] == 1
+
+
+def test_embedding_cache_empty_input(clock):
+    model = CountingModel()
+    cache = EmbeddingCache(model, "test", max_size=8)
+    assert cache.encode([]).shape == (0, 4)
+
+
+def test_response_cache_hits_similar_queries_with_same_context(clock):
+    cache = ResponseCache(max_size=8, ttl=60, similarity_threshold=0.95)
+    cache.store("docs", "ctx", unit(1, 0, 0), "respuesta")
+    assert cache.lookup("docs", "ctx", unit(1, 0.1, 0)) == "respuesta"
+    assert cache.lookup("docs", "ctx", unit(0, 1, 0)) is None
+    assert cache.lookup("docs", "otro", unit(1, 0, 0)) is None
+    assert cache.lookup("sql", "ctx", unit(1, 0, 0)) is None
+
+
+def test_response_cache_evicts_least_recently_used(clock):
+    cache = ResponseCache(max_size=2, ttl=60)
+    cache.store("docs", "a", unit(1, 0, 0), "A")
+    cache.store("docs", "b", unit(1, 0, 0), "B")
+    assert cache.lookup("docs", "a", unit(1, 0, 0)) == "A"  # "a" pasa a ser el más reciente
+    cache.store("docs", "c", unit(1, 0, 0), "C")  # desaloja "b"
+
+    assert cache.lookup("docs", "b", unit(1, 0, 0)) is None
+    assert cache.lookup("docs", "a", unit(1, 0, 0)) == "A"
+    assert cache.lookup("docs", "c", unit(1, 0, 0)) == "C"
+    assert cache.stats()["size"] == 2
+
+
+def test_response_cache_entries_expire_after_ttl(clock):
+    cache = ResponseCache(max_size=8, ttl=60)
+    cache.store("docs", "ctx", unit(1, 0, 0), "respuesta")
+    clock.now += 60
+    assert cache.lookup("docs", "ctx", unit(1, 0, 0)) == "respuesta"
+    clock.now += 1
+    assert cache.lookup("docs", "ctx", unit(1, 0, 0)) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_disabled_caches(clock):
+    model = CountingModel()
+    cache = EmbeddingCache(model, "test", max_size=0)
+    cache.encode(["hola"])
+    cache.encode(["hola"])
+    assert len(model.calls) == 2
+
+    responses = ResponseCache(max_size=0)
+    responses.store("docs", "ctx", unit(1, 0, 0), "respuesta")
+    assert responses.lookup("docs", "ctx", unit(1, 0, 0)) is None
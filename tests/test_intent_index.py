@@ -0,0 +1,113 @@
+"""
+IntentIndex against a brute-force reference of Chroma's exact search, and the
+prerouting decision rule against the original inline implementation
+"""
+import numpy as np
+import pytest
+
+from services.intent_index import IntentIndex, classify_neighbours
+
+
+def baseline_prerouting(distances, intents, ambiguous_threshold=0.5):
+    """Decision rule as it was written inline in ChatbotService.prerouting before the index"""
+    if not distances:
+        return "ambiguo"
+    best_distance, best_intent = distances[0], intents[0]
+    if best_distance > ambiguous_threshold:
+        return "ambiguo"
+    if len(distances) > 1:
+        distance_diff = distances[1] - best_distance
+        if distance_diff < 0.1 and best_intent != intents[1]:
+            return "ambiguo"
+    return best_intent
+
+
+@pytest.fixture
+def corpus():
+    rng = np.random.default_rng(7)
+    matrix = rng.normal(size=(60, 16)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    labels = [("sql", "docs", "saludo")[i % 3] for i in range(len(matrix))]
+    # Consultas cerca de un ejemplo (coincidencias claras) y al azar (casos ambiguos)
+    near = matrix[::5] + 0.1 * rng.normal(size=(12, 16)).astype(np.float32)
+    far = rng.normal(size=(12, 16)).astype(np.float32)
+    queries = np.vstack([near, far])
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return matrix, labels, queries
+
+
+def reference_top_k(matrix, query, k, space="l2"):
+    """Exact neighbours in Chroma's distance for each space"""
+    if space == "l2":
+        distances = ((matrix - query) ** 2).sum(axis=1)
+    elif space == "ip":
+        distances = 1.0 - matrix @ query
+    else:
+        distances = 1.0 - (matrix @ query) / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query))
+    order = np.argsort(distances, kind="stable")[:k]
+    return [str(i) for i in order], distances[order]
+
+
+@pytest.mark.parametrize("space", ["l2", "cosine", "ip"])
+@pytest.mark.parametrize("k", [1, 3, 10])
+def test_top_k_matches_exact_search(corpus, space, k):
+    matrix, labels, queries = corpus
+    index = IntentIndex.from_arrays(matrix, labels, space=space)
+    results = index.query(queries, n_results=k)
+
+    for row, query in enumerate(queries):
+        ids, distances = reference_top_k(matrix, query, k, space)
+        assert results["ids"][row] == ids
+        np.testing.assert_allclose(results["distances"][row], distances, atol=1e-5)
+        assert [meta["intent"] for meta in results["metadatas"][row]] == [labels[int(i)] for i in ids]
+
+
+def test_intent_filter_and_short_collections(corpus):
+    matrix, labels, queries = corpus
+    index = IntentIndex.from_arrays(matrix, labels)
+    results = index.query(queries[:1], n_results=5, intent="sql")
+    assert all(meta["intent"] == "sql" for meta in results["metadatas"][0])
+
+    # Menos ejemplos del intent que n_results: se devuelven los que hay, como Chroma
+    small = IntentIndex.from_arrays(matrix[:4], ["sql", "docs", "docs", "docs"])
+    results = small.query(queries[:1], n_results=3, intent="sql")
+    assert results["ids"] == [["0"]]
+
+
+def test_empty_index_returns_one_empty_row_per_query(corpus):
+    _, _, queries = corpus
+    index = IntentIndex.from_arrays(np.empty((0, 16), dtype=np.float32), [])
+    results = index.query(queries[:2], n_results=3)
+    assert results["ids"] == [[], []]
+    assert results["distances"] == [[], []]
+
+
+def test_decision_rule_matches_baseline_on_fixed_matrix(corpus):
+    matrix, labels, queries = corpus
+    index = IntentIndex.from_arrays(matrix, labels)
+    results = index.query(queries, n_results=3)
+
+    decisions = []
+    for row in range(len(queries)):
+        ids, distances = reference_top_k(matrix, queries[row], 3)
+        expected = baseline_prerouting(list(distances), [labels[int(i)] for i in ids])
+        intents = [meta["intent"] for meta in results["metadatas"][row]]
+        decision = classify_neighbours(results["distances"][row], intents, 0.5, 0.1)
+        assert decision == expected
+        decisions.append(decision)
+    # La matriz ejercita las dos ramas: coincidencias claras y ambiguas
+    assert "ambiguo" in decisions and set(decisions) - {"ambiguo"}
+
+
+@pytest.mark.parametrize("distances, intents, expected", [
+    ([], [], "ambiguo"),
+    ([0.2], ["sql"], "sql"),
+    ([0.5], ["sql"], "sql"),
+    ([0.51], ["sql"], "ambiguo"),
+    ([0.2, 0.25], ["sql", "docs"], "ambiguo"),
+    ([0.2, 0.25], ["sql", "sql"], "sql"),
+    ([0.2, 0.35], ["sql", "docs"], "sql"),
+])
+def test_decision_rule_thresholds(distances, intents, expected):
+    assert classify_neighbours(distances, intents, 0.5, 0.1) == expected
+    assert baseline_prerouting(distances, intents) == expected
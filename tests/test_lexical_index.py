@@ -0,0 +1,45 @@
+"""
+Reciprocal Rank Fusion ordering
+"""
+import pytest
+
+from persistence.lexical_index import reciprocal_rank_fusion
+
+
+def test_scores_are_sums_of_reciprocal_ranks():
+    fused = dict(reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60, n_results=10))
+    assert fused["a"] == pytest.approx(1 / 61)
+    assert fused["b"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused["c"] == pytest.approx(1 / 63)
+    assert fused["d"] == pytest.approx(1 / 62)
+
+
+def test_ids_in_both_rankings_come_first():
+    dense = ["a", "b", "c", "d"]
+    lexical = ["x", "c", "y", "b"]
+    ids = [doc_id for doc_id, _ in reciprocal_rank_fusion([dense, lexical], k=60, n_results=10)]
+    assert ids[:2] == ["c", "b"]
+    assert ids[2:4] == ["a", "x"]
+
+
+def test_ordering_is_descending_and_truncated():
+    fused = reciprocal_rank_fusion([["a", "b", "c", "d"], ["d", "c", "b", "a"]], k=1, n_results=3)
+    scores = [score for _, score in fused]
+    assert len(fused) == 3
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_ties_keep_first_seen_order():
+    # Misma posición en listas distintas: mismo puntaje, se respeta el orden de llegada
+    fused = reciprocal_rank_fusion([["a"], ["b"]], k=60, n_results=2)
+    assert [doc_id for doc_id, _ in fused] == ["a", "b"]
+
+
+def test_single_ranking_keeps_its_order():
+    ranking = ["d", "b", "a", "c"]
+    assert [doc_id for doc_id, _ in reciprocal_rank_fusion([ranking], n_results=4)] == ranking
+
+
+def test_empty_rankings():
+    assert reciprocal_rank_fusion([], n_results=5) == []
+    assert reciprocal_rank_fusion([[], []], n_results=5) == []
@@ -0,0 +1,83 @@
+"""
+TokenChunker boundaries and overlap, with a whitespace tokenizer standing in for the model's
+"""
+import re
+
+import pytest
+
+from persistence.db_setup.token_chunker import TokenChunker
+
+
+class WhitespaceTokenizer:
+    """One token per word, with character offsets like a fast tokenizer"""
+
+    def __call__(self, texts, add_special_tokens=False, return_offsets_mapping=False):
+        encoded = {"input_ids": [], "offset_mapping": []}
+        for text in texts:
+            spans = [match.span() for match in re.finditer(r"\S+", text)]
+            encoded["input_ids"].append(list(range(len(spans))))
+            encoded["offset_mapping"].append(spans)
+        return encoded
+
+
+def sentence(name: str, words: int) -> str:
+    return " ".join(f"{name}{i}" for i in range(words))
+
+
+def chunk(sentences, chunk_tokens=10, overlap_tokens=4):
+    chunker = TokenChunker(WhitespaceTokenizer(), chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens)
+    return list(chunker.chunks(sentences))
+
+
+def test_chunks_respect_budget_and_sentence_boundaries():
+    sentences = [(1, sentence(name, 4)) for name in "abcdef"]
+    chunks = chunk(sentences)
+    texts = {text for _, text in sentences}
+    for text, page in chunks:
+        assert page == 1
+        assert len(text.split()) <= 10
+        # Un chunk es una secuencia de oraciones completas (de 4 palabras cada una)
+        words = text.split()
+        assert len(words) % 4 == 0
+        assert all(" ".join(words[i:i + 4]) in texts for i in range(0, len(words), 4))
+    # Todas las oraciones quedan en algún chunk
+    assert all(any(text in chunk_text for chunk_text, _ in chunks) for text in texts)
+
+
+def test_consecutive_chunks_overlap_by_whole_trailing_sentences():
+    sentences = [(1, sentence(name, 3)) for name in "abcdefgh"]
+    chunks = [text for text, _ in chunk(sentences, chunk_tokens=10, overlap_tokens=4)]
+    assert chunks[0] == " ".join(sentence(name, 3) for name in "abc")
+    # La última oración (3 tokens <= 4 de solapamiento) se repite al inicio del siguiente chunk
+    assert chunks[1].startswith(sentence("c", 3))
+    for previous, current in zip(chunks, chunks[1:]):
+        shared = previous.split()[-3:]
+        assert current.split()[:3] == shared
+
+
+def test_no_overlap_across_pages():
+    sentences = [(1, sentence("a", 4)), (1, sentence("b", 4)), (2, sentence("c", 4))]
+    chunks = chunk(sentences)
+    assert chunks == [(sentence("a", 4) + " " + sentence("b", 4), 1), (sentence("c", 4), 2)]
+
+
+def test_long_sentence_is_cut_into_overlapping_windows():
+    long = sentence("w", 25)
+    chunks = chunk([(3, long)], chunk_tokens=10, overlap_tokens=4)
+    windows = [text.split() for text, _ in chunks]
+    assert all(page == 3 for _, page in chunks)
+    assert all(len(window) <= 10 for window in windows)
+    # Ventanas con paso chunk - overlap que cubren la oración completa
+    assert [window[0] for window in windows] == ["w0", "w6", "w12", "w18"]
+    assert windows[-1][-1] == "w24"
+    for previous, current in zip(windows, windows[1:]):
+        assert previous[-4:] == current[:4]
+
+
+def test_empty_sentences_are_skipped():
+    assert chunk([(1, ""), (1, "   ")]) == []
+
+
+def test_overlap_must_be_smaller_than_chunk():
+    with pytest.raises(ValueError):
+        TokenChunker(WhitespaceTokenizer(), chunk_tokens=8, overlap_tokens=8)